@@ -0,0 +1,213 @@
+"""
+Approximate mining of the 4ftMiner and SD4ftMiner tasks: mine a sample, verify the candidates on the whole table.
+
+A first look at a new antecedent set does not need a full cleverminer run. The task is mined on a stratified sample
+of its working set (the same fraction of rows of every value of the strata column, the succedent attribute by
+default) with relaxed quantifiers: Base counts are scaled down to the sample and lowered by the slack, the other lower
+bounds are lowered and the upper bounds raised by the slack (relative to their value). The rules found in the sample
+are candidates. Their four-fold tables are then recomputed on the whole working set with a bitset index, and only the
+candidates passing the task's own quantifiers are kept.
+
+The kept rules and their parameters are exact, the same as a full run gives for them. A rule that falls below the
+relaxed quantifiers in the sample is not found, so the rule list can miss rules of the full run, a larger fraction or
+slack makes that less likely. Every rule also gets 95% Wilson intervals of its confidences estimated from the sample
+(Newcombe's interval for the deltaconf of SD4ftMiner).
+
+Usage: python approximate.py task [--fraction F] [--strata COLUMN] [--slack S] [--seed N]
+e.g. python approximate.py 06 --fraction 0.1 --strata DRAFT_ROUND
+"""
+
+import argparse
+import math
+import time
+
+import pandas as pd
+
+from bitset import BitsetIndex
+from mining import mine, rule_records
+from sweep import UPPER_BOUNDS, measure, passes
+
+FRACTION = 0.2
+SLACK = 0.2
+# z of a two-sided 95% interval
+Z = 1.96
+
+# Quantifiers counting rows, they are scaled to the size of the sample
+COUNT_QUANTIFIERS = {'BASE', 'BASE1', 'FRSTBASE', 'BASE2', 'SCNDBASE'}
+
+
+# Rows of df sampled with the same fraction from every value of the strata column (missing values are a stratum too)
+def stratified_sample(df, strata, fraction=FRACTION, seed=0):
+    if strata not in df.columns:
+        raise ValueError(f'Strata column {strata} is not in the working set, use one of {", ".join(df.columns)}')
+    # Grouped by the codes of the values, pandas cannot sample a group with a missing key
+    codes, _ = pd.factorize(df[strata])
+    return df.groupby(codes, group_keys=False).sample(frac=fraction, random_state=seed).sort_index()
+
+
+# Quantifiers for mining the sample: counts scaled by the fraction, all the bounds loosened by the slack
+def relaxed_quantifiers(proc, quantifiers, fraction=FRACTION, slack=SLACK):
+    relaxed = {}
+    for name, value in quantifiers.items():
+        measure(proc, name)
+        if name.upper() in COUNT_QUANTIFIERS:
+            relaxed[name] = math.floor(value * fraction * (1 - slack))
+        elif name.upper() in UPPER_BOUNDS:
+            relaxed[name] = value + slack * abs(value)
+        else:
+            relaxed[name] = value - slack * abs(value)
+    return relaxed
+
+
+def _conf(fourfold):
+    a, b = fourfold[0], fourfold[1]
+    return a / (a + b) if a > 0 else 0
+
+
+# Rule parameters of cleverminer computed from the four-fold tables, rows being the rows of the mined df
+def rule_params(proc, fourfolds, rows):
+    if proc == '4ftMiner':
+        (a, b, c, d), = fourfolds
+        lift = a * (a + b + c + d) / (a + b) / (a + c) if (a + b) * (a + c) > 0 else None
+        return {
+            'base': a,
+            'rel_base': a / rows,
+            'conf': _conf([a, b]),
+            'aad': lift - 1 if lift is not None else None,
+            'bad': 1 - lift if lift is not None else None,
+            'fourfold': [a, b, c, d],
+        }
+    frst, scnd = fourfolds
+    conf1, conf2 = _conf(frst), _conf(scnd)
+    return {
+        'base1': frst[0],
+        'base2': scnd[0],
+        'rel_base1': frst[0] / rows,
+        'rel_base2': scnd[0] / rows,
+        'conf1': conf1,
+        'conf2': conf2,
+        'deltaconf': conf1 - conf2,
+        'ratioconf': conf1 / conf2 if conf2 > 0 else None,
+        'fourfold1': frst,
+        'fourfold2': scnd,
+    }
+
+
+# Wilson score interval of a proportion
+def wilson_interval(successes, trials, z=Z):
+    if not trials:
+        return 0.0, 1.0
+    share = successes / trials
+    center = (share + z ** 2 / (2 * trials)) / (1 + z ** 2 / trials)
+    spread = z / (1 + z ** 2 / trials) * math.sqrt(share * (1 - share) / trials + z ** 2 / (4 * trials ** 2))
+    return max(0.0, center - spread), min(1.0, center + spread)
+
+
+# Intervals of the confidences of a rule, from its four-fold tables in the sample
+def confidence_intervals(proc, params):
+    if proc == '4ftMiner':
+        a, b = params['fourfold'][:2]
+        return {'conf': wilson_interval(a, a + b)}
+    intervals = {}
+    for number in (1, 2):
+        a, b = params[f'fourfold{number}'][:2]
+        intervals[f'conf{number}'] = wilson_interval(a, a + b)
+    (low1, high1), (low2, high2) = intervals['conf1'], intervals['conf2']
+    conf1, conf2 = params['conf1'], params['conf2']
+    # Newcombe's hybrid score interval of the difference of two proportions
+    intervals['deltaconf'] = (
+        conf1 - conf2 - math.sqrt((conf1 - low1) ** 2 + (high2 - conf2) ** 2),
+        conf1 - conf2 + math.sqrt((high1 - conf1) ** 2 + (conf2 - low2) ** 2),
+    )
+    return intervals
+
+
+# Four-fold tables of a mined rule recomputed on the rows of index
+def _fourfolds(index, cedents):
+    # The category labels of the sample can differ from the whole table (1 against '1.0' when only the whole table
+    # has missing values), they are matched through the index
+    labeled = {
+        name: {column: [index.label(column, category) for category in categories]
+               for column, categories in cedent.items()}
+        for name, cedent in cedents.items() if cedent
+    }
+    ante, succ = labeled.get('ante'), labeled.get('succ')
+    if 'frst' not in cedents:
+        return [index.fourfold(ante, succ, labeled.get('cond'))]
+    return [index.fourfold(ante, succ, labeled.get('cond'), labeled.get(name)) for name in ('frst', 'scnd')]
+
+
+# Mine a stratified sample of df with relaxed quantifiers and verify the rules found on the whole df.
+# miner: cleverminer parameters (like the MINER dict of a task), strata: sampling column (the first succedent
+# attribute by default). Returns a dict with the verified rules (in the format of mining.rule_records() with the
+# exact parameters, plus the sample parameters and the confidence intervals), the rejected candidates and statistics.
+def approximate(df, miner, fraction=FRACTION, strata=None, slack=SLACK, seed=0):
+    proc = miner['proc']
+    if strata is None:
+        strata = miner['succ']['attributes'][0]['name']
+    quantifiers = relaxed_quantifiers(proc, miner['quantifiers'], fraction, slack)
+
+    start = time.perf_counter()
+    sample = stratified_sample(df, strata, fraction, seed)
+    candidates = rule_records(mine(sample, **{**miner, 'quantifiers': quantifiers}))
+    mined = time.perf_counter()
+
+    index = BitsetIndex(df)
+    rules, rejected = [], []
+    for candidate in candidates:
+        rule = {
+            **candidate,
+            'params': rule_params(proc, _fourfolds(index, candidate['cedents_struct']), len(df)),
+            'sample_params': candidate['params'],
+            'intervals': confidence_intervals(proc, candidate['params']),
+        }
+        (rules if passes(proc, rule, miner['quantifiers']) else rejected).append(rule)
+    for rule_id, rule in enumerate(rules, start=1):
+        rule['rule_id'] = rule_id
+
+    return {
+        'rules': rules,
+        'rejected': rejected,
+        'stats': {
+            'rows': len(df),
+            'sample_rows': len(sample),
+            'strata': strata,
+            'quantifiers': quantifiers,
+            'candidates': len(candidates),
+            'mining_seconds': mined - start,
+            'verification_seconds': time.perf_counter() - mined,
+        },
+    }
+
+
+def _interval_text(intervals):
+    return ', '.join(f'{name} [{low:.3f}, {high:.3f}]' for name, (low, high) in intervals.items())
+
+
+def main():
+    from run_tasks import load_task
+
+    parser = argparse.ArgumentParser(description='Mine a 4ftMiner or SD4ftMiner task on a sample and verify the rules.')
+    parser.add_argument('task', help='task name (e.g. 06)')
+    parser.add_argument('--fraction', type=float, default=FRACTION, help='share of the rows in the sample')
+    parser.add_argument('--strata', help='column the sample is stratified by (default: the succedent attribute)')
+    parser.add_argument('--slack', type=float, default=SLACK, help='relative loosening of the quantifiers')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the sample')
+    args = parser.parse_args()
+
+    task = load_task(args.task)
+    result = approximate(task.prepare(), task.MINER, args.fraction, args.strata, args.slack, args.seed)
+    for rule in result['rules']:
+        cedents = ' | '.join(f'{name}: {text}' for name, text in rule['cedents'].items() if text != '---')
+        print(f"{rule['rule_id']:>3}  {cedents}")
+        exact = ', '.join(f'{name}={value:.3f}' for name, value in rule['params'].items() if name in rule['intervals'])
+        print(f"     {exact}  sample 95%: {_interval_text(rule['intervals'])}")
+    stats = result['stats']
+    print(f"Sample of {stats['sample_rows']} / {stats['rows']} rows by {stats['strata']}, "
+          f"quantifiers {stats['quantifiers']}: {stats['candidates']} candidates, {len(result['rules'])} verified, "
+          f"{len(result['rejected'])} rejected "
+          f"(mining {stats['mining_seconds']:.1f} s, verification {stats['verification_seconds']:.1f} s)")
+
+
+if __name__ == '__main__':
+    main()
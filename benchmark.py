@@ -0,0 +1,274 @@
+"""
+Benchmarks for connect.py and the mining tasks on synthetic data.
+
+For every scale (1 = about the size of the real data, 10 = ten times as many players, ...) synthetic player_stats.csv,
+player_dim.csv and nhldraft.csv files are generated into .cache/benchmark/scale-{scale}. They are reused by later runs
+as long as the generator (its code, constants and seed) and nhldraft.csv have not changed, otherwise they are generated
+again. The drafted players are copies of the players in nhldraft.csv, their seasons and stats are random.
+
+Every scale is then benchmarked in a fresh process: the stages of connect.py run one after another (without the stage
+cache) and then every mining task runs on the generated outputs (without the mining cache). Wall time and peak memory
+(traced by tracemalloc in a second run, so it covers Python and NumPy allocations) of every stage and task are appended
+as JSON lines to the results file, along with the git commit, so results of different runs can be compared.
+
+Usage: python benchmark.py [--scales 1 10 100] [--tasks 01 03] [--results FILE] [--no-memory] [--regenerate]
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from stage_cache import code_fingerprint, file_fingerprint, fingerprint
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_DIR = os.path.join(ROOT_DIR, '.cache', 'benchmark')
+RESULTS_FILE = 'benchmark_results.jsonl'
+DEFAULT_SCALES = [1, 10, 100]
+SEED = 0
+# Written next to the generated files, the version of the generator they come from
+VERSION_FILE = 'version.txt'
+
+# Players that never get drafted, per scale unit
+UNDRAFTED_PLAYERS = 2000
+LEAGUES = ['NHL', 'OHL', 'WHL', 'Sweden', 'Russia', 'AHL', 'USHL', 'Finland']
+NATIONALITIES = ['Canada', 'USA', 'Sweden', 'Russia', 'Finland', 'Czechia', 'Latvia', 'Canada/USA', None]
+POSITIONS = ['C', 'LW', 'RW', 'D', 'G']
+
+
+def data_dir(scale):
+    return os.path.join(BENCHMARK_DIR, f'scale-{scale}')
+
+
+# Write the three source files of connect.py for the given scale into directory.
+def generate(scale, directory, seed=SEED):
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+
+    # Draft: the real draft repeated scale times, copies get a number after the player name
+    draft = pd.read_csv(os.path.join(ROOT_DIR, 'nhldraft.csv'))
+    copies = []
+    for copy in range(scale):
+        draft_copy = draft.copy()
+        draft_copy['id'] = draft['id'] + copy * len(draft)
+        if copy:
+            draft_copy['player'] = draft['player'] + f' {copy}'
+        copies.append(draft_copy)
+    draft = pd.concat(copies, ignore_index=True)
+    draft.to_csv(os.path.join(directory, 'nhldraft.csv'), index=False)
+
+    # Players: every drafted player and some undrafted ones
+    undrafted = [f'Undrafted Player{number}' for number in range(UNDRAFTED_PLAYERS * scale)]
+    names = np.concatenate([draft['player'].dropna().unique(), undrafted])
+    players = len(names)
+    # Drafted players are born in the year of their first draft row minus the draft age, so connect.py matches them
+    first_drafts = draft.dropna(subset=['player']).drop_duplicates('player').set_index('player')
+    birth_years = (first_drafts['year'] - first_drafts['age'].fillna(18)).reindex(names)
+    birth_years = birth_years.fillna(pd.Series(1980 + np.arange(players) % 20, index=names)).astype(int)
+    player_ids = np.arange(100000, 100000 + players)
+    pd.DataFrame({
+        'ROW_ID': np.arange(players),
+        'PLAYER_ID': player_ids,
+        'FIRST_NAME': 'first',
+        'LAST_NAME': 'last',
+        'DATE_OF_BIRTH': birth_years.astype(str).to_numpy() + '-01-01',
+        'PLACE_OF_BIRTH': 'place',
+        'NATIONALITY': rng.choice(np.array(NATIONALITIES, dtype=object), players),
+        'HEIGHT_CM': np.where(rng.random(players) < 0.05, np.nan, rng.integers(165, 205, players)),
+        'WEIGHT_KG': np.where(rng.random(players) < 0.05, np.nan, rng.integers(70, 120, players)),
+        'SHOOTS': rng.choice(['L', 'R'], players),
+        'DRAFT_YEAR': np.nan,
+        'DRAFT_ROUND': np.nan,
+        'DRAFT_OVERALL': np.nan,
+        'CONTRACT_THRU': np.nan,
+    }).to_csv(os.path.join(directory, 'player_dim.csv'), index=False)
+
+    # Seasons: 1-13 seasons per player, NHL from a random season on, some seasons split between two leagues
+    season_counts = rng.integers(1, 14, players)
+    first_years = rng.integers(1976, 2018, players)
+    first_nhl_seasons = rng.integers(0, season_counts + 2)
+    player = np.repeat(np.arange(players), season_counts)
+    season = np.arange(len(player)) - np.repeat(np.cumsum(season_counts) - season_counts, season_counts)
+    second_league = rng.random(len(player)) < 0.15
+    player = np.concatenate([player, player[second_league]])
+    season = np.concatenate([season, season[second_league]])
+    league = np.where(season >= first_nhl_seasons[player], 'NHL', rng.choice(LEAGUES[1:], len(player)))
+    league[-second_league.sum():] = rng.choice(LEAGUES, second_league.sum())
+    order = np.lexsort((np.arange(len(player)), season, player))
+    player, season, league = player[order], season[order], league[order]
+
+    rows = len(player)
+    year = first_years[player] + season
+    games = rng.integers(0, 82, rows)
+    goals = rng.integers(0, 40, rows)
+    assists = rng.integers(0, 50, rows)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        points_per_game = np.where(games > 0, np.round((goals + assists) / games, 2), np.nan)
+    positions = rng.choice(POSITIONS, players)
+    pd.DataFrame({
+        'ROW_ID': np.arange(rows),
+        'PLAYER_ID': player_ids[player],
+        'FIRST_NAME': 'first',
+        'LAST_NAME': 'last',
+        'PLAYER_NAME': pd.Series(names[player]) + ' (' + positions[player] + ')',
+        'PLAYER_URL': 'url',
+        'SECONDARY_POS': None,
+        'TEAM': 'team',
+        'LEAGUE': league,
+        'LEAGUE_YEAR': pd.Series(year).astype(str) + '-' + pd.Series(year + 1).astype(str),
+        'GP': games,
+        'G': goals,
+        'A': assists,
+        'TP': goals + assists,
+        'PPG': points_per_game,
+        'PIM': rng.integers(0, 150, rows),
+        '+/-': rng.integers(-30, 30, rows),
+    }).to_csv(os.path.join(directory, 'player_stats.csv'), index=False)
+    with open(os.path.join(directory, VERSION_FILE), 'w') as file:
+        file.write(generator_version(seed))
+    return {'players': players, 'seasons': rows, 'draft': len(draft)}
+
+
+# Changes with the code and constants of generate(), the seed and nhldraft.csv
+def generator_version(seed=SEED):
+    return fingerprint(code_fingerprint(generate), seed, UNDRAFTED_PLAYERS, LEAGUES, NATIONALITIES, POSITIONS,
+                       file_fingerprint(os.path.join(ROOT_DIR, 'nhldraft.csv')))
+
+
+# Whether directory holds data generated by the current version of generate()
+def is_current(directory, seed=SEED):
+    path = os.path.join(directory, VERSION_FILE)
+    if not os.path.exists(path):
+        return False
+    with open(path) as file:
+        return file.read().strip() == generator_version(seed)
+
+
+# Measurements of one worker process: wall time of every block, or its peak memory when memory is traced.
+# tracemalloc slows down code that allocates many small objects (cleverminer, CSV export) a lot, so time and memory are
+# measured in two separate runs.
+class Recorder:
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.records = []
+        if memory:
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def measure(self, kind, name):
+        if self.memory:
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        yield
+        record = {'kind': kind, 'name': name}
+        if self.memory:
+            record['peak_memory_mb'] = round((tracemalloc.get_traced_memory()[1] - memory_before) / 2 ** 20, 2)
+        else:
+            record['seconds'] = round(time.perf_counter() - start, 4)
+        self.records.append(record)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Runs in its own process, with the working directory and NHL_DATA_DIR set to the data of the scale.
+def run_scale(tasks=None, memory=False):
+    import connect
+    from mining import mine
+    from run_tasks import discover_tasks, load_task
+
+    recorder = Recorder(memory)
+    with recorder.measure('etl', 'load'):
+        loaded = connect.load()
+    with recorder.measure('etl', 'nhl_filter'):
+        nhl_filtered = connect.filter_nhl(loaded)
+    with recorder.measure('etl', 'name_normalization'):
+        normalized = connect.normalize_names(loaded, nhl_filtered)
+    with recorder.measure('etl', 'join'):
+        joined = connect.join(normalized, connect.first_draft_year, connect.last_draft_year)
+    with recorder.measure('etl', 'per_game_metrics'):
+        metrics = connect.add_per_game_metrics(normalized, joined)
+    with recorder.measure('etl', 'junior_stats'):
+        junior_stats = connect.add_junior_stats(loaded, joined)
+    with recorder.measure('etl', 'categorization'):
+        categorized = connect.categorize(metrics, junior_stats, **connect.categorization_config)
+    with recorder.measure('etl', 'export'):
+        connect.export(categorized)
+    del loaded, nhl_filtered, normalized, joined, metrics, junior_stats, categorized
+
+    for name in tasks or discover_tasks():
+        task = load_task(name)
+        with recorder.measure('task', name), contextlib.redirect_stdout(io.StringIO()):
+            mine(task.prepare(), cached=False, **task.MINER)
+    return recorder.records
+
+
+# Run run_scale() in a new process and return its records
+def _run_worker(scale, tasks, memory):
+    directory = data_dir(scale)
+    output = os.path.join(directory, 'worker.json')
+    command = [sys.executable, os.path.abspath(__file__), '--worker', str(scale), '--worker-output', output]
+    command += ['--tasks', *tasks] if tasks else []
+    command += ['--memory'] if memory else []
+    subprocess.run(command, cwd=directory, env={**os.environ, 'NHL_DATA_DIR': directory}, check=True,
+                   stdout=subprocess.DEVNULL)
+    with open(output) as file:
+        return json.load(file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark connect.py and the mining tasks on synthetic data.')
+    parser.add_argument('--scales', nargs='+', type=int, default=DEFAULT_SCALES, help='data sizes, 1 = real size')
+    parser.add_argument('--tasks', nargs='+', help='mining tasks to run (all by default)')
+    parser.add_argument('--results', default=RESULTS_FILE, help='JSON lines file the results are appended to')
+    parser.add_argument('--no-memory', action='store_true', help='only measure wall time')
+    parser.add_argument('--regenerate', action='store_true', help='generate the synthetic data again')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--worker-output', help=argparse.SUPPRESS)
+    parser.add_argument('--memory', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        with open(args.worker_output, 'w') as file:
+            json.dump(run_scale(args.tasks, args.memory), file)
+        return
+
+    common = {'commit': _git_commit(), 'started': datetime.datetime.now().isoformat(timespec='seconds')}
+    for scale in args.scales:
+        directory = data_dir(scale)
+        if args.regenerate or not is_current(directory):
+            start = time.perf_counter()
+            sizes = generate(scale, directory)
+            print(f'scale {scale}: generated {sizes} in {time.perf_counter() - start:.1f}s')
+
+        records = _run_worker(scale, args.tasks, memory=False)
+        if not args.no_memory:
+            peaks = {(record['kind'], record['name']): record['peak_memory_mb']
+                     for record in _run_worker(scale, args.tasks, memory=True)}
+            for record in records:
+                record['peak_memory_mb'] = peaks[(record['kind'], record['name'])]
+
+        with open(args.results, 'a') as file:
+            for record in records:
+                file.write(json.dumps({**common, 'scale': scale, **record}) + '\n')
+                memory = f", peak {record['peak_memory_mb']:.1f} MB" if 'peak_memory_mb' in record else ''
+                print(f"scale {scale} {record['kind']} {record['name']}: {record['seconds']:.2f}s{memory}")
+
+
+if __name__ == '__main__':
+    main()
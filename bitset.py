@@ -0,0 +1,151 @@
+"""
+Bitset index of the categorical columns, for computing four-fold tables without pandas.
+
+Every (column, category) pair gets a packed bitset (a NumPy uint64 array, one bit per row). A cedent is a
+{column: [category, ...]} dict like the cedents_struct of a cleverminer rule: the categories of one column are OR-ed
+together and the columns are AND-ed. The a/b/c/d counts of a rule are then a few ANDs and popcounts over the words of
+the bitsets, and many cedents can be evaluated at once with fourfolds().
+
+Categories are stored as strings, converted the same way cleverminer converts them (so DRAFT_ROUND 1.0 is '1', missing
+text values are 'nan' and missing numbers are left out), which lets the cedents of the mined rules be looked up
+directly.
+"""
+
+import numpy as np
+
+from datasets import DRAFT, decategorize, read_table, table_columns
+
+# Columns of nhl_draft.csv indexed by draft_index() besides the *_CAT columns
+DRAFT_INDEX_COLUMNS = ['DRAFT_ROUND', 'POSITION', 'SHOOTS']
+
+
+# Category labels of a column as cleverminer sees them. Numeric columns are converted to numbers, to integers when there
+# are only whole numbers (and no missing values), all other columns become strings.
+def _labels(series):
+    try:
+        numbers = series.astype(str).astype(float)
+    except ValueError:
+        return series.astype(str)
+    if numbers.notna().all() and (numbers % 1 == 0).all():
+        numbers = numbers.astype(int)
+    return numbers.astype(str).where(numbers.notna())
+
+
+def popcount(words):
+    return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+
+
+class BitsetIndex:
+    def __init__(self, df, columns=None):
+        columns = list(df.columns) if columns is None else list(columns)
+        values = decategorize(df[columns])
+        self.rows = len(df)
+        self.words = (self.rows + 63) // 64
+        self.bitsets = {}
+        # Category of every row by column, as a position in categories() (-1 for missing values)
+        self.codes = {}
+        for column in columns:
+            codes, categories = _labels(values[column]).factorize(sort=True)
+            self.codes[column] = codes
+            # One row of bits per category (missing values have code -1 and get no bit), packed little-endian into bytes
+            # and then into 64 bit words
+            bits = codes[None, :] == np.arange(len(categories))[:, None]
+            packed = np.packbits(bits, axis=1, bitorder='little')
+            padded = np.zeros((len(categories), self.words * 8), dtype=np.uint8)
+            padded[:, :packed.shape[1]] = packed
+            self.bitsets[column] = (
+                {category: position for position, category in enumerate(categories)},
+                padded.view(np.uint64),
+            )
+        # Bits of the existing rows, the padding bits of the last word stay 0
+        rows = np.zeros(self.words * 64, dtype=bool)
+        rows[:self.rows] = True
+        self.all_rows = np.packbits(rows, bitorder='little').view(np.uint64)
+
+    # Rows of a bitset as a boolean array
+    def unpack(self, mask):
+        return np.unpackbits(mask.view(np.uint8), count=self.rows, bitorder='little').astype(bool)
+
+    def categories(self, column):
+        return list(self.bitsets[column][0])
+
+    # Label of a category value in the index. Numbers match when they are equal, so 1 finds '1.0' in a column that
+    # has missing values (and the other way round)
+    def label(self, column, value):
+        positions = self.bitsets[column][0]
+        if str(value) in positions:
+            return str(value)
+        for category in positions:
+            try:
+                if float(category) == float(value):
+                    return category
+            except ValueError:
+                pass
+        return str(value)
+
+    def bitset(self, column, category):
+        positions, bitsets = self.bitsets[column]
+        position = positions.get(str(category))
+        if position is None:
+            return np.zeros(self.words, dtype=np.uint64)
+        return bitsets[position]
+
+    # Rows matching all the given cedents {column: [category, ...]}, an empty (or None) cedent matches all the rows.
+    def mask(self, *cedents):
+        result = self.all_rows.copy()
+        for column, categories in [item for cedent in cedents if cedent for item in cedent.items()]:
+            positions, bitsets = self.bitsets[column]
+            selected = [positions[str(category)] for category in categories if str(category) in positions]
+            result &= np.bitwise_or.reduce(bitsets[selected], axis=0) if selected else 0
+        return result
+
+    def count(self, *cedents):
+        return int(popcount(self.mask(*cedents)))
+
+    # a/b/c/d counts of ante => succ within the rows matching all the conds, as in the 'fourfold' parameter of
+    # cleverminer (for SD4ftMiner the conds are cond and frst or scnd)
+    def fourfold(self, ante, succ, *conds):
+        return self.fourfolds([ante], succ, *conds)[0].tolist()
+
+    # Four-fold tables of many antecedents against one succedent, an array of shape (len(antes), 4)
+    def fourfolds(self, antes, succ, *conds):
+        within = self.mask(*conds)
+        succ_mask = self.mask(succ) & within
+        ante_masks = np.stack([self.mask(ante) for ante in antes]) & within
+        a = popcount(ante_masks & succ_mask)
+        ante_count = popcount(ante_masks)
+        succ_count = popcount(succ_mask)
+        within_count = popcount(within)
+        return np.stack([a, ante_count - a, succ_count - a, within_count - ante_count - succ_count + a], axis=1)
+
+    # Recompute the four-fold tables of mined rules (rule_records() of mining.py) and return the ids of the rules
+    # whose tables differ from the ones reported by cleverminer. The index has to be built on the mined df.
+    def check_rules(self, rules):
+        mismatched = []
+        for rule in rules:
+            cedents = rule['cedents_struct']
+            params = rule['params']
+            if 'fourfold' in params:
+                expected = {'fourfold': [cedents.get('cond')]}
+            else:
+                expected = {
+                    'fourfold1': [cedents.get('cond'), cedents['frst']],
+                    'fourfold2': [cedents.get('cond'), cedents['scnd']],
+                }
+            for name, conds in expected.items():
+                if self.fourfold(cedents['ante'], cedents['succ'], *conds) != list(params[name]):
+                    mismatched.append(rule['rule_id'])
+                    break
+        return mismatched
+
+
+_draft_index = {}
+
+
+# Index of the whole draft table: the *_CAT columns and DRAFT_INDEX_COLUMNS, built once per process.
+def draft_index():
+    if 'index' not in _draft_index:
+        columns = [column for column in table_columns(DRAFT)
+                   if column.endswith('_CAT') or column in DRAFT_INDEX_COLUMNS]
+        _draft_index['index'] = BitsetIndex(read_table(DRAFT, columns))
+    return _draft_index['index']
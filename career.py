@@ -0,0 +1,220 @@
+"""
+Career index over all the seasons of player_stats.csv, every league included.
+
+The rows are sorted by player and season (rows of the same season keep their order in the file) and stored as NumPy
+arrays: the first season year of every row, its league as a code (an index into leagues) and the stat columns as
+floats. offsets[i]:offsets[i + 1] are the rows of the player player_ids[i], in the CSR style of sparse matrices.
+
+Queries work on all the players at once. A row mask selects seasons, by league (league_mask()) and by a window of
+season years (window(), the bounds can be numbers or a value per player, e.g. the year of the NHL debut from
+debut()). aggregate() then reduces a stat over the selected rows of every player (sum, mean, min, max, count, first,
+last) with np.ufunc.reduceat, and seasons() counts the distinct seasons. For example the PPG in the last season
+before the NHL debut and the number of seasons between the draft and the debut:
+
+    index = career_index()
+    before_debut = index.window(last=index.debut('NHL') - 1) & ~index.league_mask('NHL')
+    index.aggregate('PPG', 'last', before_debut)
+    index.seasons(index.window(first=draft_years, last=index.debut('NHL') - 1))
+
+The index is built by streaming the file in chunks and stored under CACHE_DIR, keyed by the content of the file.
+
+Usage: python career.py STAT HOW [--leagues LEAGUE ...] [--before-debut LEAGUE] [--first YEAR] [--last YEAR]
+e.g. python career.py PPG last --before-debut NHL
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from connect import LEAGUE, LEAGUE_YEAR, PLAYER_ID, PLAYER_STATS_CHUNK_SIZE, PLAYER_STATS_FILE
+from stage_cache import file_fingerprint
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(ROOT_DIR, '.cache', 'career')
+
+STATS = ['GP', 'G', 'A', 'TP', 'PPG', 'PIM', '+/-']
+# Year of the rows without a season, they are sorted after all the seasons of their player
+MISSING_YEAR = -1
+
+AGGREGATES = ['sum', 'mean', 'min', 'max', 'count', 'first', 'last']
+
+
+# First year of every season ('2005-2006' -> 2005), MISSING_YEAR for missing seasons
+def _first_years(league_year):
+    codes, seasons = pd.factorize(league_year)
+    first_years = seasons.astype(str).str[:4].astype(int).to_numpy()
+    return np.where(codes >= 0, first_years[codes], MISSING_YEAR).astype(np.int16)
+
+
+class CareerIndex:
+    # Arrays with one value per row in any order: player ids, league codes (into leagues), season years and
+    # stats {column: values}
+    def __init__(self, player_ids, league_codes, leagues, years, stats):
+        sort_years = np.where(years == MISSING_YEAR, np.iinfo(np.int16).max, years)
+        order = np.lexsort((np.arange(len(player_ids)), sort_years, player_ids))
+        sorted_ids = player_ids[order]
+        starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]]) if len(order) else np.zeros(0, int)
+        self.player_ids = sorted_ids[starts]
+        self.offsets = np.r_[starts, len(order)]
+        # Position of the player (in player_ids) of every row
+        self.row_players = np.repeat(np.arange(len(starts)), np.diff(self.offsets))
+        self.leagues = list(leagues)
+        self.league_codes = league_codes[order]
+        self.years = years[order]
+        self.stats = {column: values[order] for column, values in stats.items()}
+
+    @classmethod
+    def from_csv(cls, path=PLAYER_STATS_FILE, chunksize=PLAYER_STATS_CHUNK_SIZE):
+        header = pd.read_csv(path, encoding='unicode_escape', nrows=0).columns
+        stats = [column for column in STATS if column in header]
+        league_numbers = {}
+        parts = {name: [] for name in [PLAYER_ID, LEAGUE, LEAGUE_YEAR] + stats}
+        for chunk in pd.read_csv(path, encoding='unicode_escape', usecols=[PLAYER_ID, LEAGUE, LEAGUE_YEAR] + stats,
+                                 chunksize=chunksize):
+            chunk = chunk.dropna(subset=[PLAYER_ID])
+            for league in chunk[LEAGUE].dropna().unique():
+                league_numbers.setdefault(league, len(league_numbers))
+            parts[PLAYER_ID].append(chunk[PLAYER_ID].to_numpy(dtype=np.int64))
+            parts[LEAGUE].append(chunk[LEAGUE].map(league_numbers).fillna(-1).to_numpy(dtype=np.int16))
+            parts[LEAGUE_YEAR].append(_first_years(chunk[LEAGUE_YEAR]))
+            for column in stats:
+                parts[column].append(pd.to_numeric(chunk[column], errors='coerce').to_numpy(dtype=float))
+        arrays = {name: np.concatenate(values) for name, values in parts.items()}
+        return cls(arrays[PLAYER_ID], arrays[LEAGUE], league_numbers, arrays[LEAGUE_YEAR],
+                   {column: arrays[column] for column in stats})
+
+    def save(self, path):
+        np.savez(path, player_ids=self.player_ids, offsets=self.offsets, leagues=np.array(self.leagues, dtype=str),
+                 league_codes=self.league_codes, years=self.years, stat_names=np.array(list(self.stats), dtype=str),
+                 **{f'stat_{number}': values for number, values in enumerate(self.stats.values())})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            index = cls.__new__(cls)
+            index.player_ids = arrays['player_ids']
+            index.offsets = arrays['offsets']
+            index.row_players = np.repeat(np.arange(len(index.player_ids)), np.diff(index.offsets))
+            index.leagues = arrays['leagues'].tolist()
+            index.league_codes = arrays['league_codes']
+            index.years = arrays['years']
+            index.stats = {name: arrays[f'stat_{number}'] for number, name in enumerate(arrays['stat_names'])}
+        return index
+
+    # Value of every row from a value per player (a Series indexed by PLAYER_ID, players without a value get NaN)
+    def per_row(self, values):
+        return pd.Series(values).reindex(self.player_ids).to_numpy(dtype=float)[self.row_players]
+
+    # Rows played in any of the leagues
+    def league_mask(self, *leagues):
+        codes = [self.leagues.index(league) for league in leagues if league in self.leagues]
+        return np.isin(self.league_codes, codes)
+
+    # Rows with a season year in [first, last], both bounds are optional and can be a number or a value per player
+    # (a Series indexed by PLAYER_ID, a missing value excludes all the rows of the player). Rows without a season are
+    # never in a window.
+    def window(self, first=None, last=None):
+        mask = self.years != MISSING_YEAR
+        for bound, compare in ((first, np.greater_equal), (last, np.less_equal)):
+            if bound is None:
+                continue
+            bound = self.per_row(bound) if isinstance(bound, pd.Series) else bound
+            with np.errstate(invalid='ignore'):
+                mask &= compare(self.years, bound)
+        return mask
+
+    # First season year of every player in a league (NaN for players who never played in it)
+    def debut(self, league):
+        return self.aggregate_years(self.league_mask(league) & (self.years != MISSING_YEAR), 'min')
+
+    def _groups(self, mask):
+        rows = np.flatnonzero(mask)
+        players = self.row_players[rows]
+        starts = np.flatnonzero(np.r_[True, players[1:] != players[:-1]]) if len(rows) else np.zeros(0, int)
+        return rows, players, starts
+
+    def _reduce(self, values, mask, how):
+        if how not in AGGREGATES:
+            raise ValueError(f'Unknown aggregate {how}, use one of {", ".join(AGGREGATES)}')
+        if how not in ('first', 'last'):
+            # Missing values are left out, as in pandas
+            mask = mask & ~np.isnan(values)
+        rows, players, starts = self._groups(mask)
+        result = np.full(len(self.player_ids), 0.0 if how == 'count' else np.nan)
+        if not len(rows):
+            return pd.Series(result, index=pd.Index(self.player_ids, name=PLAYER_ID))
+        selected = values[rows]
+        ends = np.r_[starts[1:], len(rows)]
+        if how == 'first':
+            reduced = selected[starts]
+        elif how == 'last':
+            reduced = selected[ends - 1]
+        elif how == 'count':
+            reduced = ends - starts
+        elif how == 'mean':
+            reduced = np.add.reduceat(selected, starts) / (ends - starts)
+        else:
+            reduced = {'sum': np.add, 'min': np.minimum, 'max': np.maximum}[how].reduceat(selected, starts)
+        result[players[starts]] = reduced
+        return pd.Series(result, index=pd.Index(self.player_ids, name=PLAYER_ID))
+
+    # A stat reduced over the selected rows of every player (all rows without a mask), as a Series indexed by
+    # PLAYER_ID. Players without selected rows get NaN (0 for count).
+    def aggregate(self, column, how='sum', mask=None):
+        mask = np.ones(len(self.years), dtype=bool) if mask is None else mask
+        return self._reduce(self.stats[column], mask, how)
+
+    def aggregate_years(self, mask, how):
+        return self._reduce(self.years.astype(float), mask, how)
+
+    # Number of distinct seasons of every player among the selected rows
+    def seasons(self, mask=None):
+        mask = self.years != MISSING_YEAR if mask is None else mask & (self.years != MISSING_YEAR)
+        rows, players, _ = self._groups(mask)
+        years = self.years[rows]
+        new_season = np.r_[True, (players[1:] != players[:-1]) | (years[1:] != years[:-1])] if len(rows) else rows
+        counts = np.bincount(players[new_season.astype(bool)], minlength=len(self.player_ids))
+        return pd.Series(counts, index=pd.Index(self.player_ids, name=PLAYER_ID))
+
+
+# Career index of a stats file, loaded from CACHE_DIR when the file has not changed since the index was built
+def career_index(path=PLAYER_STATS_FILE, cache_dir=CACHE_DIR):
+    cache_path = os.path.join(cache_dir, f'{file_fingerprint(path)}.npz')
+    if os.path.exists(cache_path):
+        return CareerIndex.load(cache_path)
+    index = CareerIndex.from_csv(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    for name in os.listdir(cache_dir):
+        os.remove(os.path.join(cache_dir, name))
+    # np.savez adds .npz to names without it
+    temporary_path = f'{cache_path[:-len(".npz")]}.{os.getpid()}.tmp.npz'
+    index.save(temporary_path)
+    os.replace(temporary_path, cache_path)
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aggregate a stat over a window of every career.')
+    parser.add_argument('stat', choices=STATS, help='stat column')
+    parser.add_argument('how', choices=AGGREGATES, help='aggregate')
+    parser.add_argument('--leagues', nargs='+', help='only seasons in these leagues')
+    parser.add_argument('--before-debut', metavar='LEAGUE', help='only seasons before the debut in this league')
+    parser.add_argument('--first', type=int, help='first season year')
+    parser.add_argument('--last', type=int, help='last season year')
+    args = parser.parse_args()
+
+    index = career_index()
+    mask = index.window(args.first, args.last)
+    if args.leagues:
+        mask &= index.league_mask(*args.leagues)
+    if args.before_debut:
+        mask &= index.window(last=index.debut(args.before_debut) - 1) & ~index.league_mask(args.before_debut)
+    result = index.aggregate(args.stat, args.how, mask)
+    print(f'{len(index.player_ids)} players, {len(index.years)} seasons in {len(index.leagues)} leagues')
+    print(result.dropna().describe().to_string())
+
+
+if __name__ == '__main__':
+    main()
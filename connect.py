@@ -2,11 +2,32 @@
 Sources of data:
 https://www.kaggle.com/datasets/mjavon/elite-prospects-hockey-stats-player-data/data (player_stats.csv + player_dim.csv)
 https://www.kaggle.com/datasets/mattop/nhl-draft-hockey-player-data-1963-2022/data (nhldraft.csv)
+
+Both outputs are also written as Parquet (nhl_draft.parquet, nhl_player_stats.parquet), which keeps the categorical
+and nullable integer dtypes of schema.py. Use datasets.py to read them.
+
+The script is split into stages (load, NHL filter, name normalization, join, per-game metrics, junior stats,
+categorization and export). Results of every stage are cached in .cache/stages of the repository, so a rerun only
+recomputes the stages whose code, config, constants or inputs have changed. Run with --rebuild to ignore the cache.
+
+The bin edges of the quantile categories are written to nhl_quantile_edges.json, ingest.py uses them to add new draft
+classes and seasons without a full rebuild.
 """
 
+import json
+import sys
+
 import pandas as pd
 import numpy as np
 
+from datasets import DRAFT, HAS_PYARROW, PLAYER_STATS, parquet_path, write_parquet
+import names
+from names import REASONS, name_keys, resolve
+from schema import SCHEMAS, compact
+from stage_cache import Pipeline
+import transforms
+from transforms import parenthesized, primary, season_year, strip_position, unique_map
+
 # Column name constants.
 PLAYER_ID = 'PLAYER_ID'
 PLAYER_NAME = 'PLAYER_NAME'
@@ -19,149 +40,45 @@ OTHER = 'other'
 DRAFT_ROUND = 'draft_round'
 LEAGUE_YEAR = 'LEAGUE_YEAR'
 PPG = 'PPG'
+# Helper columns of the draft / player dim join
+DIM_ROW = '_DIM_ROW'
+DIM_NAME = '_DIM_NAME'
+
+# Source and output files.
+PLAYER_STATS_FILE = 'player_stats.csv'
+PLAYER_DIM_FILE = 'player_dim.csv'
+DRAFT_INFO_FILE = 'nhldraft.csv'
+DRAFT_OUTPUT_FILE = 'nhl_draft.csv'
+PLAYER_STATS_OUTPUT_FILE = 'nhl_player_stats.csv'
+# player_stats.csv is read in chunks of this many rows
+PLAYER_STATS_CHUNK_SIZE = 500_000
+# Columns of player_stats.csv that are not needed at all
+UNUSED_PLAYER_STATS_COLUMNS = ['ROW_ID', 'PLAYER_URL', 'FIRST_NAME', 'LAST_NAME', 'SECONDARY_POS']
+# Bin edges of the quantile categories, reused by ingest.py
+QUANTILE_EDGES_FILE = 'nhl_quantile_edges.json'
+
+# Draft years to keep (1978/79 to 2018/19)
+first_draft_year = 1978
+last_draft_year = 2018
 
 categories = ['very low', 'low', 'medium', 'high', 'very high']
 per_game_categories_intervals = [-np.inf, 0.2, 0.4, 0.6, 0.8, np.inf]
 games_played_categories_intervals = [-np.inf, 100, 300, 500, 700, np.inf]
 
-# Read original CSV files.
-player_stats_df = pd.read_csv('player_stats.csv', encoding='unicode_escape')
-player_dim_df = pd.read_csv('player_dim.csv', encoding='unicode_escape')
-draft_info_df = pd.read_csv('nhldraft.csv')
-
-# Copy original stats
-player_stats_original_df = player_stats_df.copy()
-
-# Filter out non-NHL players from stats.
-player_stats_df = player_stats_df.loc[player_stats_df[LEAGUE] == 'NHL']
-
-# Filter out non-NHL players from dim.
-player_dim_df = player_dim_df[player_dim_df[PLAYER_ID].isin(player_stats_df[PLAYER_ID])]
-
-# Remove position from the player stats player name column.
-player_stats_df[PLAYER_NAME] = player_stats_df[PLAYER_NAME].str.replace(r'\s*\(.+\)\s*', '', regex=True)
-
-# Add full name to the player dim df from player stats df.
-player_dim_df = player_dim_df.merge(
-    player_stats_df.drop_duplicates(subset=[PLAYER_ID])[[PLAYER_ID, PLAYER_NAME]],
-    on=PLAYER_ID
-)
-
-# Drop unwanted columns
-player_dim_df = player_dim_df.drop(columns=[
-    'ROW_ID',
-    'FIRST_NAME',
-    'LAST_NAME',
-    'DRAFT_YEAR',
-    'DRAFT_ROUND',
-    'DRAFT_OVERALL',
-    'CONTRACT_THRU',
-    'PLACE_OF_BIRTH',  # Nationality is sufficient
-], axis=1)
-player_stats_df = player_stats_df.drop(columns=[
-    'ROW_ID',
-    LEAGUE,
-    'PLAYER_URL',
-    'FIRST_NAME',
-    'LAST_NAME',
-    'SECONDARY_POS',
-], axis=1)
-draft_info_df = draft_info_df.drop(columns=[
-    'id',  # Note: Nationality is in both dfs, but we want to preserve it for players who have not played in the NHL.
-], axis=1)
-
-# Rename nationality column to make it unique and player name column to make it consistent
-draft_info_df = draft_info_df.rename(columns={'nationality': 'nationality_abbr', 'player': PLAYER_NAME})
-
-# Remove draft info rows with players drafted after 2018/19 season and players drafted before 1978/79 season.
-draft_info_df = draft_info_df[draft_info_df['year'] < 2019]
-draft_info_df = draft_info_df[draft_info_df['year'] >= 1978]
-
-# Add draft round column (in today's number of teams)
-draft_info_df[DRAFT_ROUND] = draft_info_df.apply(lambda row: (row['overall_pick'] - 1) // 32 + 1, axis=1)
-
-# Join player dim and draft info based on PLAYER_NAME.
-# Rename player to PLAYER_NAME in draft info first.
-# We will keep both non-mergable columns in the joined df.
-# If the player was not drafted, the draft info will be NaN.
-# If the player has been drafted and has not played in the NHL, the player dim() info will be NaN.
-# Note: We will not resolve an issue where multiple players have the same name as it is very unlikely and would require
-# a bit of effort to resolve (from the top of my head there are two players named Sebastian Aho.)
-joined_df = draft_info_df.merge(player_dim_df, on=PLAYER_NAME, how='outer')
-# Rename draft year and draft team columns
-joined_df = joined_df.rename(columns={'year': DRAFT_YEAR, 'team': DRAFT_TEAM})
-
-# Add amateur league
-joined_df[AMATEUR_LEAGUE] = joined_df['amateur_team'].str.extract(r'\((.*?)\)', expand=False)
-
-# Take only the primary position and nationality
-joined_df['position'] = joined_df['position'].str.replace(r'\/.+', '', regex=True)
-joined_df['NATIONALITY'] = joined_df['NATIONALITY'].str.replace(r'\/.+', '', regex=True)
-
-# Categorize statistical columns for stats df
-# First let's add goals per game, assists per game and penalty minutes per game
-player_stats_df['GPG'] = player_stats_df['G'] / player_stats_df['GP']
-player_stats_df['APG'] = player_stats_df['A'] / player_stats_df['GP']
-player_stats_df['PIMPG'] = player_stats_df['PIM'] / player_stats_df['GP']
-
-# Now let's categorize the newly added columns and points per game
-player_stats_df['GPG_CAT'] = pd.cut(player_stats_df['GPG'], per_game_categories_intervals, labels=categories)
-player_stats_df['APG_CAT'] = pd.cut(player_stats_df['APG'], per_game_categories_intervals, labels=categories)
-player_stats_df['PIMPG_CAT'] = pd.cut(player_stats_df['PIMPG'], per_game_categories_intervals, labels=categories)
-player_stats_df['PPG_CAT'] = pd.cut(player_stats_df[PPG], per_game_categories_intervals, labels=categories)
-
-# Categorize plus minus and games played as quantiles
-player_stats_df['PLUS_MINUS_CAT'] = pd.qcut(player_stats_df['+/-'], 5, labels=categories)
-player_stats_df['GP_CAT'] = pd.qcut(player_stats_df['GP'], 5, labels=categories)
-
-
-# Categorize season
-def categorize_season(row):
-    first_year = int(str(row[LEAGUE_YEAR])[:4])
-    if first_year < 1990:
-        return '80s'
-    if first_year < 2000:
-        return '90s'
-    if first_year < 2010:
-        return '00s'
-    if first_year < 2020:
-        return '10s'
-    return '20s'
-
-
-player_stats_df['SEASON_CAT'] = player_stats_df.apply(categorize_season, axis=1)
-
+# Categorize height and weight
+height_bin_edges = [130, 175, 185, 195, 300]
+# Define labels for the intervals.
+height_labels = ['<175', '175-185', '185-195', 'GIANT']
+weight_bin_edges = [50.0, 75.0, 85.0, 95.0, 105.0, 115.0, 130.0, 300]
+# Define labels for the intervals.
+weight_labels = ['<75', '75-85', '85-95', '95-105', '105-115', '115-130', 'MAXICHONKER']
 
+# Categorize seasons by the decade of their first year
+season_bin_edges = [-np.inf, 1990, 2000, 2010, 2020, np.inf]
+season_labels = ['80s', '90s', '00s', '10s', '20s']
 # Let's categorize seasons also if they are pre or in the salary cap era
-def is_in_cap_era(row):
-    first_year = int(str(row[LEAGUE_YEAR])[:4])
-    if first_year < 2005:
-        return 'PRE_CAP_ERA'
-    return 'IN_CAP_ERA'
-
-
-player_stats_df['IS_IN_CAP_ERA'] = player_stats_df.apply(is_in_cap_era, axis=1)
-
-# Add season number to players
-player_stats_df['PLAYER_SEASON_NUMBER'] = player_stats_df.groupby(PLAYER_ID).cumcount() + 1
-
-# Categorize statistical columns for draft df
-# First let's add points per game, goals per game, assists per game and penalty minutes per game
-joined_df[PPG] = joined_df['points'] / joined_df[GAMES_PLAYED]
-joined_df['GPG'] = joined_df['goals'] / joined_df[GAMES_PLAYED]
-joined_df['APG'] = joined_df['assists'] / joined_df[GAMES_PLAYED]
-joined_df['PIMPG'] = joined_df['penalties_minutes'] / joined_df[GAMES_PLAYED]
-
-# Now let's categorize the newly added columns
-joined_df['PPG_CAT'] = pd.cut(joined_df[PPG], per_game_categories_intervals, labels=categories)
-joined_df['GPG_CAT'] = pd.cut(joined_df['GPG'], per_game_categories_intervals, labels=categories)
-joined_df['APG_CAT'] = pd.cut(joined_df['APG'], per_game_categories_intervals, labels=categories)
-joined_df['PIMPG_CAT'] = pd.cut(joined_df['PIMPG'], per_game_categories_intervals, labels=categories)
-
-# Categorize plus minus, point shares and games played as quantiles
-joined_df['PLUS_MINUS_CAT'] = pd.qcut(joined_df['plus_minus'], 5, labels=categories)
-joined_df['POINT_SHARES_CAT'] = pd.qcut(joined_df['point_shares'], 5, labels=categories)
-joined_df['GAMES_PLAYED_CAT'] = pd.qcut(joined_df[GAMES_PLAYED], 5, labels=categories)
+cap_era_bin_edges = [-np.inf, 2005, np.inf]
+cap_era_labels = ['PRE_CAP_ERA', 'IN_CAP_ERA']
 
 # Categorize nationality based on nationality and nationality_abbr
 # The most common nationalities are CAN, USA, SWE, RUS, CZE, FIN, SVK, SUI and GER - the others will be categorized as
@@ -179,19 +96,13 @@ nationalities = {
 }
 
 
-def categorize_nationality(row):
-    nat = row['NATIONALITY']
-    nat_abbr = row['nationality_abbr']
-    if nat in nationalities.values():
-        return nat
-    elif nat_abbr in nationalities.keys():
-        return nationalities[nat_abbr]
-    else:
-        return OTHER
+# Nationality if it is one of the most common ones, otherwise the nationality by its abbreviation, otherwise OTHER
+def categorize_nationality(nationality, nationality_abbr, nationalities):
+    common = nationality.where(nationality.isin(list(nationalities.values())))
+    by_abbr = nationality_abbr.map(nationalities)
+    return pd.Categorical(common.fillna(by_abbr).fillna(OTHER), categories=[*nationalities.values(), OTHER])
 
 
-joined_df['NATIONALITY_CAT'] = joined_df.apply(categorize_nationality, axis=1)
-
 # Categorize amateur league
 # First lets create categories for the most common leagues
 amateur_leagues = {
@@ -211,70 +122,424 @@ amateur_leagues = {
 }
 
 
-def categorize_amateur_league(row):
+# Area of the amateur league (the first area listing it), leagues starting with 'High' are high schools in North
+# America, players without an amateur league were not drafted
+def categorize_amateur_league(amateur_league, amateur_leagues):
+    league_areas = {}
     for area, leagues in amateur_leagues.items():
-        if row[AMATEUR_LEAGUE] in leagues:
-            return area
-    if str(row[AMATEUR_LEAGUE]).startswith('High'):
-        return 'north_america'
-    return 'NOT_DRAFTED' if str(row[AMATEUR_LEAGUE]) == 'nan' else OTHER
+        for league in leagues:
+            league_areas.setdefault(league, area)
+    league_names = amateur_league.astype(str)
+    area = amateur_league.map(league_areas)
+    area = area.fillna(pd.Series(np.select(
+        [league_names.str.startswith('High'), league_names == 'nan'], ['north_america', 'NOT_DRAFTED'], OTHER
+    ), index=amateur_league.index))
+    return pd.Categorical(area, categories=[*amateur_leagues, OTHER, 'NOT_DRAFTED'])
+
+
+# dtype a column gets when the whole file is read at once, given the dtypes it got in the chunks
+def _common_dtype(dtypes):
+    if all(pd.api.types.is_numeric_dtype(dtype) for dtype in dtypes):
+        return np.result_type(*dtypes)
+    return np.dtype(object)
+
+
+# Read player_stats.csv in chunks, so the table with the seasons of all the leagues is never in memory at once.
+# NHL rows are kept with all the used columns. Other rows are only needed for the junior stats, they are reduced to
+# player id, season and PPG (the season as a number, see below) and dropped as soon as they are known to be played
+# after the player's first NHL season. Returns the NHL rows and the seasons played before the first NHL season.
+def stream_player_stats(path=PLAYER_STATS_FILE, chunksize=PLAYER_STATS_CHUNK_SIZE):
+    header = pd.read_csv(path, encoding='unicode_escape', nrows=0).columns
+    columns = [column for column in header if column not in UNUSED_PLAYER_STATS_COLUMNS]
+    nhl_chunks = []
+    chunk_dtypes = {column: set() for column in columns}
+    # First NHL season of every player seen so far (a groupby min over strings would fall back to pure Python)
+    first_nhl_seasons = pd.DataFrame({PLAYER_ID: pd.Series(dtype=np.int64), LEAGUE_YEAR: pd.Series(dtype=object)})
+    # Seasons are stored as numbers (their index in season_numbers) instead of strings
+    season_numbers = {}
+    other_ids, other_seasons, other_ppg = [], [], []
+
+    for chunk in pd.read_csv(path, encoding='unicode_escape', usecols=columns, chunksize=chunksize):
+        for column in columns:
+            chunk_dtypes[column].add(chunk[column].dtype)
+        is_nhl = (chunk[LEAGUE] == 'NHL').to_numpy()
+        nhl_chunks.append(chunk[is_nhl])
+        if is_nhl.any():
+            nhl_seasons = chunk.loc[is_nhl, [PLAYER_ID, LEAGUE_YEAR]].dropna()
+            first_nhl_seasons = pd.concat([first_nhl_seasons, nhl_seasons]).sort_values(LEAGUE_YEAR, kind='stable')
+            first_nhl_seasons = first_nhl_seasons.drop_duplicates(PLAYER_ID)
+
+        others = chunk.loc[~is_nhl, [PLAYER_ID, LEAGUE_YEAR, PPG]]
+        known_first_seasons = others[PLAYER_ID].map(first_nhl_seasons.set_index(PLAYER_ID)[LEAGUE_YEAR])
+        after_nhl = known_first_seasons.notna() & (others[LEAGUE_YEAR] >= known_first_seasons.fillna(''))
+        # Seasons without a year are never before the first NHL season
+        others = others[others[LEAGUE_YEAR].notna() & ~after_nhl]
+        for season in others[LEAGUE_YEAR].unique():
+            season_numbers.setdefault(season, len(season_numbers))
+        other_ids.append(others[PLAYER_ID].to_numpy())
+        other_seasons.append(others[LEAGUE_YEAR].map(season_numbers).to_numpy(dtype=np.int32))
+        other_ppg.append(others[PPG].to_numpy(dtype=float))
+
+    player_stats_df = pd.concat(nhl_chunks).astype(
+        {column: _common_dtype(dtypes) for column, dtypes in chunk_dtypes.items()}
+    )
 
+    # Renumber the seasons in the order of the season strings, so comparing and sorting the numbers gives the same
+    # results as for the strings
+    first_nhl_seasons = first_nhl_seasons.set_index(PLAYER_ID)[LEAGUE_YEAR]
+    for season in first_nhl_seasons:
+        season_numbers.setdefault(season, len(season_numbers))
+    ranks = np.empty(len(season_numbers), dtype=np.int32)
+    ranks[[season_numbers[season] for season in sorted(season_numbers)]] = np.arange(len(season_numbers))
+    seasons = pd.DataFrame({
+        PLAYER_ID: np.concatenate(other_ids),
+        LEAGUE_YEAR: ranks[np.concatenate(other_seasons)],
+        PPG: np.concatenate(other_ppg),
+    })
+    first_nhl_ranks = first_nhl_seasons.map(lambda season: ranks[season_numbers[season]])
+    junior_seasons = seasons[seasons[LEAGUE_YEAR] < seasons[PLAYER_ID].map(first_nhl_ranks)].reset_index(drop=True)
+    return player_stats_df, junior_seasons
+
+
+# Read original CSV files, the player stats are streamed (see stream_player_stats).
+def load():
+    player_stats_df, junior_seasons = stream_player_stats()
+    player_dim_df = pd.read_csv(PLAYER_DIM_FILE, encoding='unicode_escape')
+    draft_info_df = pd.read_csv(DRAFT_INFO_FILE)
+    return player_stats_df, player_dim_df, draft_info_df, junior_seasons
+
+
+def filter_nhl(loaded):
+    player_stats_df, player_dim_df, _, _ = loaded
+
+    # Filter out non-NHL players from stats.
+    player_stats_df = player_stats_df.loc[player_stats_df[LEAGUE] == 'NHL'].copy()
+
+    # Filter out non-NHL players from dim.
+    player_dim_df = player_dim_df[player_dim_df[PLAYER_ID].isin(player_stats_df[PLAYER_ID])]
+    return player_stats_df, player_dim_df
+
+
+def normalize_names(loaded, nhl_filtered):
+    _, _, draft_info_df, _ = loaded
+    player_stats_df, player_dim_df = nhl_filtered
+    player_stats_df = player_stats_df.copy()
+
+    # Remove position from the player stats player name column.
+    player_stats_df[PLAYER_NAME] = unique_map(player_stats_df[PLAYER_NAME], strip_position)
+
+    # Add full name to the player dim df from player stats df.
+    player_dim_df = player_dim_df.merge(
+        player_stats_df.drop_duplicates(subset=[PLAYER_ID])[[PLAYER_ID, PLAYER_NAME]],
+        on=PLAYER_ID
+    )
 
-joined_df['AMATEUR_LEAGUE_CAT'] = joined_df.apply(categorize_amateur_league, axis=1)
+    # Drop unwanted columns
+    player_dim_df = player_dim_df.drop(columns=[
+        'ROW_ID',
+        'FIRST_NAME',
+        'LAST_NAME',
+        'DRAFT_YEAR',
+        'DRAFT_ROUND',
+        'DRAFT_OVERALL',
+        'CONTRACT_THRU',
+        'PLACE_OF_BIRTH',  # Nationality is sufficient
+    ], axis=1)
+    # The other unused columns (UNUSED_PLAYER_STATS_COLUMNS) are not read at all
+    player_stats_df = player_stats_df.drop(columns=[
+        LEAGUE,
+    ], axis=1)
+    # Note: Nationality is in both dfs, but we want to preserve it for players who have not played in the NHL.
+    draft_info_df = draft_info_df.drop(columns=[
+        'id',
+    ], axis=1)
+
+    # Rename nationality column to make it unique and player name column to make it consistent
+    draft_info_df = draft_info_df.rename(columns={'nationality': 'nationality_abbr', 'player': PLAYER_NAME})
+    return player_stats_df, player_dim_df, draft_info_df
+
+
+def join(normalized, first_draft_year, last_draft_year):
+    _, player_dim_df, draft_info_df = normalized
+
+    # Remove draft info rows with players drafted outside of the draft years.
+    draft_info_df = draft_info_df[draft_info_df['year'] <= last_draft_year]
+    draft_info_df = draft_info_df[draft_info_df['year'] >= first_draft_year].copy()
+
+    # Add draft round column (in today's number of teams)
+    draft_info_df[DRAFT_ROUND] = (draft_info_df['overall_pick'] - 1) // 32 + 1
+
+    # Join player dim and draft info on the normalized player names, one to one (see names.py). A draft row without a
+    # player has NaN player dim info (drafted, never played in the NHL) and vice versa (undrafted NHL players).
+    joined_df = join_players(draft_info_df, player_dim_df)
+    # Rename draft year and draft team columns
+    joined_df = joined_df.rename(columns={'year': DRAFT_YEAR, 'team': DRAFT_TEAM})
+
+    # Add amateur league
+    joined_df[AMATEUR_LEAGUE] = unique_map(joined_df['amateur_team'], parenthesized)
+
+    # Take only the primary position and nationality
+    joined_df['position'] = unique_map(joined_df['position'], primary)
+    joined_df['NATIONALITY'] = unique_map(joined_df['NATIONALITY'], primary)
+    return joined_df
+
+
+# Outer join of the draft rows and the player dim rows by name resolution. PLAYER_NAME is the name in the draft, or the
+# name in the stats for undrafted players. Redrafted players and ambiguous names are reported.
+def join_players(draft_info_df, player_dim_df):
+    draft_info_df = draft_info_df.reset_index(drop=True)
+    player_dim_df = player_dim_df.reset_index(drop=True)
+    matches, report = resolve(
+        pd.DataFrame({
+            'key': name_keys(draft_info_df[PLAYER_NAME]),
+            'birth_year': draft_info_df['year'] - draft_info_df['age'],
+            'year': draft_info_df['year'],
+        }),
+        pd.DataFrame({
+            'key': name_keys(player_dim_df[PLAYER_NAME]),
+            'birth_year': pd.to_datetime(player_dim_df['DATE_OF_BIRTH'], errors='coerce').dt.year,
+        }),
+    )
+    for reason, entries in report.groupby('reason'):
+        print(f"Name resolution: {len(entries)} {REASONS[reason]} ({', '.join(entries['key'].head(3))}, ...)")
+
+    draft_info_df[DIM_ROW] = np.where(matches >= 0, matches, np.nan)
+    player_dim_df[DIM_ROW] = np.arange(len(player_dim_df), dtype=float)
+    joined_df = draft_info_df.merge(
+        player_dim_df.rename(columns={PLAYER_NAME: DIM_NAME}), on=DIM_ROW, how='outer', sort=False
+    )
+    joined_df[PLAYER_NAME] = joined_df[PLAYER_NAME].fillna(joined_df[DIM_NAME])
+    joined_df = joined_df.drop(columns=[DIM_ROW, DIM_NAME])
+    # Ordered by the player name, as the merge on PLAYER_NAME used to do
+    return joined_df.sort_values(PLAYER_NAME, kind='stable', ignore_index=True)
+
+
+def add_per_game_metrics(normalized, joined_df):
+    player_stats_df = normalized[0].copy()
+    joined_df = joined_df.copy()
+
+    # First let's add goals per game, assists per game and penalty minutes per game to the stats df
+    player_stats_df['GPG'] = player_stats_df['G'] / player_stats_df['GP']
+    player_stats_df['APG'] = player_stats_df['A'] / player_stats_df['GP']
+    player_stats_df['PIMPG'] = player_stats_df['PIM'] / player_stats_df['GP']
+
+    # Then points per game, goals per game, assists per game and penalty minutes per game to the draft df
+    joined_df[PPG] = joined_df['points'] / joined_df[GAMES_PLAYED]
+    joined_df['GPG'] = joined_df['goals'] / joined_df[GAMES_PLAYED]
+    joined_df['APG'] = joined_df['assists'] / joined_df[GAMES_PLAYED]
+    joined_df['PIMPG'] = joined_df['penalties_minutes'] / joined_df[GAMES_PLAYED]
+    return player_stats_df, joined_df
 
 
 # Add ppg from juniors (last year and average) to draft df
-def get_junior_stats(row):
-    if str(row[PLAYER_ID]) == 'nan':
-        return 0, 0
+# All players are handled at once: junior_seasons are the seasons played before the first NHL season of every player
+# (in the order of the source file), take the last and the average PPG of those seasons per player.
+# Tie rule: rows of the same player and season keep their order in the source file, so the last of them is the last
+# junior season. Before, every player was sorted separately with quicksort, which keeps that order only for players
+# with at most 16 rows. For players with more rows and such ties LAST_JUNIOR_YEAR_PPG can differ from the old output,
+# and AVERAGE_JUNIOR_PPG can differ in the last bit (the same values summed in another order).
+def get_junior_stats(junior_seasons, player_ids):
+    # Stable sort so that two seasons from the same year keep their order from the source file
+    non_nhl_seasons = junior_seasons.sort_values(by=[PLAYER_ID, LEAGUE_YEAR], kind='stable')
+
+    junior_player_ids = non_nhl_seasons[PLAYER_ID].to_numpy()
+    ppg = non_nhl_seasons[PPG].to_numpy(dtype=float)
+    is_group_start = np.ones(len(junior_player_ids), dtype=bool)
+    is_group_start[1:] = junior_player_ids[1:] != junior_player_ids[:-1]
+    group_starts = np.flatnonzero(is_group_start)
+    group_sizes = np.diff(np.r_[group_starts, len(ppg)])
+
+    # Series.mean() sums with numpy's pairwise summation, summing players with the same number of seasons as rows
+    # of one 2D block keeps the averages bit for bit the same as averaging every player separately
+    ppg_sums = np.zeros(len(group_starts))
+    for size in np.unique(group_sizes):
+        groups = np.flatnonzero(group_sizes == size)
+        ppg_sums[groups] = np.nan_to_num(ppg)[group_starts[groups, None] + np.arange(size)].sum(axis=1)
+    ppg_counts = np.add.reduceat(~np.isnan(ppg), group_starts) if len(ppg) else np.zeros(0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average_junior_ppg = pd.Series(ppg_sums / ppg_counts, index=junior_player_ids[group_starts])
+    last_junior_year_ppg = pd.Series(ppg[group_starts + group_sizes - 1], index=junior_player_ids[group_starts])
+
+    # Players without a player id or without any seasons before the NHL get zeros
+    junior_stats = pd.DataFrame({
+        'LAST_JUNIOR_YEAR_PPG': player_ids.map(last_junior_year_ppg),
+        'AVERAGE_JUNIOR_PPG': player_ids.map(average_junior_ppg),
+    })
+    junior_stats.loc[~player_ids.isin(last_junior_year_ppg.index)] = 0
+    return junior_stats.astype(float)
+
+
+def add_junior_stats(loaded, joined_df):
+    _, _, _, junior_seasons = loaded
+    return get_junior_stats(junior_seasons, joined_df[PLAYER_ID])
+
+
+# First year of a season ('2005-06' -> 2005). Seasons repeat a lot, so every distinct season is parsed only once.
+def season_first_year(league_year):
+    return unique_map(league_year, season_year).astype(int)
+
+
+# Categorize a column by its quantiles, the bin edges are stored in quantile_edges[name].
+# With frozen edges (a dict like quantile_edges from an earlier run) the column is cut by those edges instead, values
+# outside of them fall into the lowest or the highest category.
+def categorize_quantiles(values, name, categories, quantile_edges, frozen_edges=None):
+    if frozen_edges is None:
+        result, edges = pd.qcut(values, len(categories), labels=categories, retbins=True)
+        quantile_edges[name] = edges.tolist()
+        return result
+    quantile_edges[name] = frozen_edges[name]
+    bins = [-np.inf, *frozen_edges[name][1:-1], np.inf]
+    return pd.cut(values, bins, labels=categories, include_lowest=True)
+
+
+def categorize(metrics, junior_stats, categories, per_game_categories_intervals, nationalities, amateur_leagues,
+               height_bin_edges, height_labels, weight_bin_edges, weight_labels, season_bin_edges, season_labels,
+               cap_era_bin_edges, cap_era_labels, frozen_quantile_edges=None):
+    player_stats_df, joined_df = metrics
+    player_stats_df = player_stats_df.copy()
+    joined_df = joined_df.copy()
+    quantile_edges = {}
+
+    def quantiles(df, column, name):
+        return categorize_quantiles(df[column], name, categories, quantile_edges, frozen_quantile_edges)
+
+    # Now let's categorize the per game columns of the stats df and points per game
+    player_stats_df['GPG_CAT'] = pd.cut(player_stats_df['GPG'], per_game_categories_intervals, labels=categories)
+    player_stats_df['APG_CAT'] = pd.cut(player_stats_df['APG'], per_game_categories_intervals, labels=categories)
+    player_stats_df['PIMPG_CAT'] = pd.cut(player_stats_df['PIMPG'], per_game_categories_intervals, labels=categories)
+    player_stats_df['PPG_CAT'] = pd.cut(player_stats_df[PPG], per_game_categories_intervals, labels=categories)
+
+    # Categorize plus minus and games played as quantiles
+    player_stats_df['PLUS_MINUS_CAT'] = quantiles(player_stats_df, '+/-', 'PLAYER_STATS.PLUS_MINUS_CAT')
+    player_stats_df['GP_CAT'] = quantiles(player_stats_df, 'GP', 'PLAYER_STATS.GP_CAT')
+
+    # Categorize seasons by decade and by the salary cap era
+    first_year = season_first_year(player_stats_df[LEAGUE_YEAR])
+    player_stats_df['SEASON_CAT'] = pd.cut(first_year, bins=season_bin_edges, labels=season_labels, right=False)
+    player_stats_df['IS_IN_CAP_ERA'] = pd.cut(first_year, bins=cap_era_bin_edges, labels=cap_era_labels, right=False)
+
+    # Add season number to players
+    player_stats_df['PLAYER_SEASON_NUMBER'] = player_stats_df.groupby(PLAYER_ID).cumcount() + 1
+
+    # Categorize the per game columns of the draft df
+    joined_df['PPG_CAT'] = pd.cut(joined_df[PPG], per_game_categories_intervals, labels=categories)
+    joined_df['GPG_CAT'] = pd.cut(joined_df['GPG'], per_game_categories_intervals, labels=categories)
+    joined_df['APG_CAT'] = pd.cut(joined_df['APG'], per_game_categories_intervals, labels=categories)
+    joined_df['PIMPG_CAT'] = pd.cut(joined_df['PIMPG'], per_game_categories_intervals, labels=categories)
+
+    # Categorize plus minus, point shares and games played as quantiles
+    joined_df['PLUS_MINUS_CAT'] = quantiles(joined_df, 'plus_minus', 'DRAFT.PLUS_MINUS_CAT')
+    joined_df['POINT_SHARES_CAT'] = quantiles(joined_df, 'point_shares', 'DRAFT.POINT_SHARES_CAT')
+    joined_df['GAMES_PLAYED_CAT'] = quantiles(joined_df, GAMES_PLAYED, 'DRAFT.GAMES_PLAYED_CAT')
+
+    joined_df['NATIONALITY_CAT'] = categorize_nationality(
+        joined_df['NATIONALITY'], joined_df['nationality_abbr'], nationalities
+    )
+    joined_df['AMATEUR_LEAGUE_CAT'] = categorize_amateur_league(joined_df[AMATEUR_LEAGUE], amateur_leagues)
 
-    seasons_by_player = player_stats_original_df[player_stats_original_df[PLAYER_ID] == row[PLAYER_ID]].sort_values(
-        by=LEAGUE_YEAR
+    # Add junior stats and categorize them
+    joined_df[['LAST_JUNIOR_YEAR_PPG', 'AVERAGE_JUNIOR_PPG']] = junior_stats
+    joined_df['LAST_JUNIOR_YEAR_PPG_CAT'] = pd.cut(
+        joined_df['LAST_JUNIOR_YEAR_PPG'], per_game_categories_intervals, labels=categories
+    )
+    joined_df['AVERAGE_JUNIOR_PPG_CAT'] = pd.cut(
+        joined_df['AVERAGE_JUNIOR_PPG'], per_game_categories_intervals, labels=categories
     )
-    first_nhl_season_year = seasons_by_player[seasons_by_player[LEAGUE] == 'NHL'].iloc[0][LEAGUE_YEAR]
-    non_nhl_seasons = seasons_by_player[seasons_by_player[LEAGUE_YEAR] < first_nhl_season_year]
-    if non_nhl_seasons.empty:
-        return 0, 0
-    average_ppg_in_junior = non_nhl_seasons[PPG].mean()
-    return non_nhl_seasons.iloc[-1][PPG], average_ppg_in_junior
 
+    # Create new columns 'HEIGHT_CAT' and 'WEIGHT_CAT' with the intervals.
+    joined_df['HEIGHT_CAT'] = pd.cut(joined_df['HEIGHT_CM'], bins=height_bin_edges, labels=height_labels, right=False)
+    joined_df['WEIGHT_CAT'] = pd.cut(joined_df['WEIGHT_KG'], bins=weight_bin_edges, labels=weight_labels, right=False)
+    return player_stats_df, joined_df, quantile_edges
 
-joined_df['LAST_JUNIOR_YEAR_PPG'] = joined_df.apply(lambda row: get_junior_stats(row)[0], axis=1)
-joined_df['AVERAGE_JUNIOR_PPG'] = joined_df.apply(lambda row: get_junior_stats(row)[1], axis=1)
 
-# Categorize newly added columns
-joined_df['LAST_JUNIOR_YEAR_PPG_CAT'] = pd.cut(
-    joined_df['LAST_JUNIOR_YEAR_PPG'], per_game_categories_intervals, labels=categories
-)
-joined_df['AVERAGE_JUNIOR_PPG_CAT'] = pd.cut(
-    joined_df['AVERAGE_JUNIOR_PPG'], per_game_categories_intervals, labels=categories
-)
+# The two output tables (draft, player stats) with upper case column names
+def output_tables(categorized):
+    player_stats_df, joined_df, _ = categorized
 
-# Categorize height and weight
-bin_edges = [130, 175, 185, 195, 300]
+    # Add draft info to player stats
+    player_stats_df = player_stats_df.merge(
+        joined_df[[DRAFT_YEAR, 'overall_pick', DRAFT_TEAM, AMATEUR_LEAGUE, PLAYER_ID, 'AMATEUR_LEAGUE_CAT', DRAFT_ROUND,
+                   'HEIGHT_CAT', 'WEIGHT_CAT']],
+        on=PLAYER_ID,
+        how='left'
+    )
 
-# Define labels for the intervals.
-labels = ['<175', '175-185', '185-195', 'GIANT']
-# Create a new column 'HEIGHT_CAT' with the intervals.
-joined_df['HEIGHT_CAT'] = pd.cut(joined_df['HEIGHT_CM'], bins=bin_edges, labels=labels, right=False)
+    # Normalize column names in dfs
+    joined_df = joined_df.copy()
+    joined_df.columns = joined_df.columns.str.upper()
+    player_stats_df.columns = player_stats_df.columns.str.upper()
+    return joined_df, player_stats_df
+
+
+def write_outputs(joined_df, player_stats_df):
+    # Nullable small integers and categoricals of schema.py, floats are kept at full precision
+    joined_df = compact(joined_df, DRAFT, floats=False)
+    player_stats_df = compact(player_stats_df, PLAYER_STATS, floats=False)
+
+    # Export to CSV.
+    joined_df.to_csv(DRAFT_OUTPUT_FILE, index=False)
+    player_stats_df.to_csv(PLAYER_STATS_OUTPUT_FILE, index=False)
+
+    # Export to Parquet as well, it keeps the categorical dtypes and is much faster to read.
+    write_parquet(joined_df, DRAFT, data_dir='.')
+    write_parquet(player_stats_df, PLAYER_STATS, data_dir='.')
+
+
+def export(categorized):
+    write_outputs(*output_tables(categorized))
+    with open(QUANTILE_EDGES_FILE, 'w') as file:
+        json.dump(categorized[2], file, indent=2)
+
+
+# Config of the categorization stage
+categorization_config = {
+    'categories': categories,
+    'per_game_categories_intervals': per_game_categories_intervals,
+    'nationalities': nationalities,
+    'amateur_leagues': amateur_leagues,
+    'height_bin_edges': height_bin_edges,
+    'height_labels': height_labels,
+    'weight_bin_edges': weight_bin_edges,
+    'weight_labels': weight_labels,
+    'season_bin_edges': season_bin_edges,
+    'season_labels': season_labels,
+    'cap_era_bin_edges': cap_era_bin_edges,
+    'cap_era_labels': cap_era_labels,
+}
 
-bin_edges = [50.0, 75.0, 85.0, 95.0, 105.0, 115.0, 130.0, 300]
-# Define labels for the intervals.
-labels = ['<75', '75-85', '85-95', '95-105', '105-115', '115-130', 'MAXICHONKER']
-joined_df['WEIGHT_CAT'] = pd.cut(joined_df['WEIGHT_KG'], bins=bin_edges, labels=labels, right=False)
-
-# Add draft info to player stats
-player_stats_df = player_stats_df.merge(
-    joined_df[[DRAFT_YEAR, 'overall_pick', DRAFT_TEAM, AMATEUR_LEAGUE, PLAYER_ID, 'AMATEUR_LEAGUE_CAT', DRAFT_ROUND,
-               'HEIGHT_CAT', 'WEIGHT_CAT']],
-    on=PLAYER_ID,
-    how='left'
-)
-
-# Normalize column names in dfs
-joined_df.columns = joined_df.columns.str.upper()
-player_stats_df.columns = player_stats_df.columns.str.upper()
-
-# Export to CSV.
-joined_df.to_csv('nhl_draft.csv', index=False)
-player_stats_df.to_csv('nhl_player_stats.csv', index=False)
+
+def run(rebuild=False):
+    pipeline = Pipeline(rebuild=rebuild)
+    loaded = pipeline.run('load', load, files=[PLAYER_STATS_FILE, PLAYER_DIM_FILE, DRAFT_INFO_FILE],
+                          code=[stream_player_stats, _common_dtype],
+                          constants={'UNUSED_PLAYER_STATS_COLUMNS': UNUSED_PLAYER_STATS_COLUMNS})
+    nhl_filtered = pipeline.run('nhl_filter', filter_nhl, loaded)
+    # The modules names.py and transforms.py are keyed as a whole, with all their helpers and patterns
+    normalized = pipeline.run('name_normalization', normalize_names, loaded, nhl_filtered, code=[transforms],
+                              constants={'PLAYER_NAME': PLAYER_NAME, 'PLAYER_ID': PLAYER_ID, 'LEAGUE': LEAGUE})
+    joined = pipeline.run(
+        'join', join, normalized,
+        config={'first_draft_year': first_draft_year, 'last_draft_year': last_draft_year},
+        code=[join_players, names, transforms],
+        constants={'PLAYER_NAME': PLAYER_NAME, 'DRAFT_ROUND': DRAFT_ROUND, 'DRAFT_YEAR': DRAFT_YEAR,
+                   'DRAFT_TEAM': DRAFT_TEAM, 'AMATEUR_LEAGUE': AMATEUR_LEAGUE, 'DIM_ROW': DIM_ROW,
+                   'DIM_NAME': DIM_NAME},
+    )
+    metrics = pipeline.run('per_game_metrics', add_per_game_metrics, normalized, joined)
+    junior_stats = pipeline.run('junior_stats', add_junior_stats, loaded, joined, code=[get_junior_stats])
+    categorized = pipeline.run(
+        'categorization', categorize, metrics, junior_stats, config=categorization_config,
+        code=[season_first_year, transforms, categorize_nationality, categorize_amateur_league, categorize_quantiles],
+        constants={'OTHER': OTHER, 'PLAYER_ID': PLAYER_ID, 'LEAGUE_YEAR': LEAGUE_YEAR, 'PPG': PPG,
+                   'GAMES_PLAYED': GAMES_PLAYED, 'AMATEUR_LEAGUE': AMATEUR_LEAGUE},
+    )
+    outputs = [DRAFT_OUTPUT_FILE, PLAYER_STATS_OUTPUT_FILE, QUANTILE_EDGES_FILE]
+    if HAS_PYARROW:
+        outputs += [parquet_path(DRAFT, data_dir='.'), parquet_path(PLAYER_STATS, data_dir='.')]
+    pipeline.run('export', export, categorized, code=[output_tables, write_outputs, write_parquet, compact],
+                 constants={'SCHEMAS': SCHEMAS},
+                 outputs=outputs)
+
+
+if __name__ == '__main__':
+    run(rebuild='--rebuild' in sys.argv[1:])
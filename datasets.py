@@ -0,0 +1,206 @@
+"""
+Shared loader for the outputs of connect.py.
+
+connect.py writes every output table both as CSV and as Parquet. The Parquet file keeps the pandas dtypes (including the
+Categorical columns created by pd.cut / pd.qcut) and can be read column by column, so it is preferred whenever it
+exists and is not older than the CSV file. Without pyarrow installed, the CSV file is used. The tables are read from
+the repository root, or from the directory in the NHL_DATA_DIR environment variable (used by benchmark.py). Columns
+get the compact dtypes of schema.py (nullable small integers and categoricals), floats stay float64 so the tasks
+compare and aggregate them at full precision.
+
+Tables are memoized per process: every column of a source file is parsed once and later reads of the same column are
+served from memory. load_dataset() builds a task's working set from a declarative spec (columns, missing values to drop
+or fill, recodings, sortable relabeling and row filters), apply_spec() applies such a spec to an existing df.
+"""
+
+import operator
+import os
+
+import pandas as pd
+
+import schema
+from instrument import instrumented
+from schema import DRAFT, PLAYER_STATS
+
+try:
+    import pyarrow.parquet
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+DATA_DIR = os.environ.get('NHL_DATA_DIR', os.path.dirname(os.path.abspath(__file__)))
+
+
+def csv_path(name, data_dir=DATA_DIR):
+    return os.path.join(data_dir, f'{name}.csv')
+
+
+def parquet_path(name, data_dir=DATA_DIR):
+    return os.path.join(data_dir, f'{name}.parquet')
+
+
+# Write a table as Parquet next to its CSV file (skipped when pyarrow is not installed).
+def write_parquet(df, name, data_dir=DATA_DIR):
+    if not HAS_PYARROW:
+        print(f'pyarrow is not installed, {name}.parquet was not written')
+        return
+    df.to_parquet(parquet_path(name, data_dir), index=False)
+
+
+def _has_fresh_parquet(name, data_dir):
+    parquet = parquet_path(name, data_dir)
+    csv = csv_path(name, data_dir)
+    if not HAS_PYARROW or not os.path.exists(parquet):
+        return False
+    return not os.path.exists(csv) or os.path.getmtime(parquet) >= os.path.getmtime(csv)
+
+
+# File a table is read from: the Parquet file when it is up to date, the CSV file otherwise
+def source_path(name, data_dir=DATA_DIR):
+    return parquet_path(name, data_dir) if _has_fresh_parquet(name, data_dir) else csv_path(name, data_dir)
+
+
+def _source_columns(path):
+    if path.endswith('.parquet'):
+        return pyarrow.parquet.read_schema(path).names
+    return pd.read_csv(path, encoding='unicode_escape', nrows=0).columns.tolist()
+
+
+def _read_columns(path, columns):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, encoding='unicode_escape', usecols=columns)[columns]
+
+
+# (table name, data dir) -> ((source path, modification time), df with the columns read so far)
+_tables = {}
+
+
+# Read a table, only the given columns if columns is set. Columns are returned in the requested order.
+# Columns already read by this process are not parsed again, only the missing ones are read from the source file.
+# compact=False reads the columns with the dtypes of the source file, bypassing the memoized tables.
+def read_table(name, columns=None, data_dir=DATA_DIR, compact=True):
+    path = source_path(name, data_dir)
+    if not compact:
+        return _read_columns(path, list(columns) if columns is not None else _source_columns(path))
+    version = (path, os.path.getmtime(path))
+    cached_version, df = _tables.get((name, data_dir), (None, None))
+    if cached_version != version:
+        df = None
+
+    wanted = list(columns) if columns is not None else _source_columns(path)
+    missing = [column for column in wanted if df is None or column not in df.columns]
+    if missing:
+        missing_df = schema.compact(_read_columns(path, missing), name, floats=False)
+        df = missing_df if df is None else pd.concat([df, missing_df], axis=1)
+        _tables[(name, data_dir)] = (version, df)
+    return df[wanted].copy()
+
+
+# Names of all the columns of a table, without reading any data.
+def table_columns(name, data_dir=DATA_DIR):
+    return _source_columns(source_path(name, data_dir))
+
+
+def clear_cache():
+    _tables.clear()
+
+
+def read_draft(columns=None):
+    return read_table(DRAFT, columns)
+
+
+def read_player_stats(columns=None):
+    return read_table(PLAYER_STATS, columns)
+
+
+FILTER_OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda series, values: series.isin(values),
+    'not in': lambda series, values: ~series.isin(values),
+}
+
+
+# Relabel the values of a column. Categorical columns get their categories renamed (as long as no two categories are
+# merged), everything else goes through Series.replace. Nullable integers cannot hold the new labels, they go back to
+# float64 first.
+def _replace(series, old_values, new_values):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        mapping = {old: new for old, new in zip(old_values, new_values) if old in series.cat.categories}
+        renamed = [mapping.get(category, category) for category in series.cat.categories]
+        if len(set(renamed)) == len(renamed):
+            return series.cat.rename_categories(mapping)
+        series = series.astype(object)
+    elif pd.api.types.is_extension_array_dtype(series.dtype) and pd.api.types.is_integer_dtype(series.dtype):
+        series = series.astype(float)
+    return series.replace(old_values, new_values)
+
+
+def _fillna(series, value):
+    if isinstance(series.dtype, pd.CategoricalDtype) and value not in series.cat.categories:
+        series = series.cat.add_categories([value])
+    return series.fillna(value)
+
+
+# Columns referenced anywhere in a spec, in the order they are first mentioned.
+def spec_columns(spec):
+    columns = list(spec.get('columns', []))
+    columns += spec.get('dropna', [])
+    columns += list(spec.get('fillna', {}))
+    columns += list(spec.get('recode', {}))
+    columns += list(spec.get('sortable', {}))
+    columns += [column for column, _, _ in spec.get('filters', [])]
+    return list(dict.fromkeys(columns))
+
+
+# Apply a spec to a df. The steps always run in this order:
+# fillna: {column: value} - fill missing values
+# dropna: [column, ...] - drop rows with a missing value in any of the columns
+# recode: {column: {new_value: [old_value, ...]}} - replace groups of values with one value
+# sortable: {column: [category, ...]} - relabel categories as '{index}_{category}', so they sort in the given order
+#   (needed for seq, lcut and rcut in cleverminer)
+# filters: [(column, operator, value), ...] - keep only rows matching all the filters, see FILTER_OPERATORS
+def apply_spec(df, spec):
+    df = df.copy()
+    for column, value in spec.get('fillna', {}).items():
+        df[column] = _fillna(df[column], value)
+    if spec.get('dropna'):
+        df = df.dropna(subset=spec['dropna'])
+    for column, groups in spec.get('recode', {}).items():
+        for new_value, old_values in groups.items():
+            df[column] = _replace(df[column], old_values, [new_value] * len(old_values))
+    for column, categories in spec.get('sortable', {}).items():
+        df[column] = _replace(df[column], categories, sortable_labels(categories))
+    for column, operator_name, value in spec.get('filters', []):
+        df = df[FILTER_OPERATORS[operator_name](df[column], value)]
+    return df
+
+
+def sortable_labels(categories):
+    return [f'{index}_{value}' for index, value in enumerate(categories)]
+
+
+# Read only the columns used by the spec (from memory when they were already read) and apply the spec.
+# spec['table'] is DRAFT by default.
+@instrumented(kind='dataset')
+def load_dataset(spec):
+    return apply_spec(read_table(spec.get('table', DRAFT), spec_columns(spec)), spec)
+
+
+# Turn categorical columns back into plain values before handing the df to cleverminer. cleverminer keeps the category
+# order of categorical columns and leaves out missing values, while plain columns are converted to strings ('nan'
+# included) and sorted, which is how all the task rules were mined. Nullable integers become float64 (as read from
+# CSV), their missing values would be converted to '<NA>' otherwise.
+def decategorize(df):
+    dtypes = {}
+    for column, dtype in df.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            dtypes[column] = object
+        elif pd.api.types.is_extension_array_dtype(dtype) and pd.api.types.is_integer_dtype(dtype):
+            dtypes[column] = float
+    return df.astype(dtypes)
@@ -0,0 +1,49 @@
+"""
+Per-player features derived from nhl_player_stats for the mining tasks.
+
+first_season() takes the values of a player's first NHL season and career_windows() averages a stat over the
+windows of a career (seasons 1-3, 4-6 and 7+). Both work on the whole stats table in one groupby pass and return one
+row per PLAYER_ID, add_player_features() then puts the features next to the draft rows.
+"""
+
+import numpy as np
+
+PLAYER_ID = 'PLAYER_ID'
+PLAYER_SEASON_NUMBER = 'PLAYER_SEASON_NUMBER'
+
+# Career windows by the last season number they include, every season after the last bound is in the last window
+CAREER_WINDOWS = ['SEASONS_1_3', 'SEASONS_4_6', 'SEASONS_7_PLUS']
+CAREER_WINDOW_BOUNDS = [3, 6]
+SEASONS = 'SEASONS'
+
+
+# Values of the given columns in the first NHL season of every player. When a player has more than one row for the
+# first season, the last one is used.
+def first_season(stats_df, columns):
+    first_seasons = stats_df[stats_df[PLAYER_SEASON_NUMBER] == 1]
+    return first_seasons.drop_duplicates(PLAYER_ID, keep='last').set_index(PLAYER_ID)[list(columns)]
+
+
+# Average of a stat in every career window, plus the number of seasons (stat rows) of the player.
+# A window without seasons gets the empty value, a missing stat value makes the average of its window NaN.
+def career_windows(stats_df, stat, empty=np.nan):
+    stats_df = stats_df.dropna(subset=[PLAYER_ID])
+    season_number = stats_df[PLAYER_SEASON_NUMBER].to_numpy()
+    # Seasons without a number are counted in the last window
+    window = np.select([season_number <= bound for bound in CAREER_WINDOW_BOUNDS],
+                       list(range(len(CAREER_WINDOW_BOUNDS))), len(CAREER_WINDOW_BOUNDS))
+
+    grouped = stats_df[stat].groupby([stats_df[PLAYER_ID], window])
+    means = (grouped.sum() / grouped.size()).where(~stats_df[stat].isna().groupby([stats_df[PLAYER_ID], window]).any())
+    windows = means.unstack(fill_value=empty).reindex(columns=range(len(CAREER_WINDOWS)), fill_value=empty)
+    windows.columns = CAREER_WINDOWS
+    windows[SEASONS] = stats_df.groupby(PLAYER_ID).size()
+    return windows
+
+
+# Add the per-player features (indexed by PLAYER_ID) as new columns of draft_df, players without features get NaN.
+def add_player_features(draft_df, features):
+    draft_df = draft_df.copy()
+    for column in features.columns:
+        draft_df[column] = draft_df[PLAYER_ID].map(features[column])
+    return draft_df
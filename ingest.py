@@ -0,0 +1,171 @@
+"""
+Incremental ingest of new draft classes and seasons into the outputs of connect.py.
+
+New rows (in the format of nhldraft.csv, player_stats.csv or player_dim.csv) are appended to the source files, so a
+later full rebuild gives the same data. Then only the affected players are run through the stages of connect.py: the
+players of the new season and dim rows, the players with the names of the new draft rows, and everyone sharing a name
+with them (the draft is joined on the normalized names of names.py). Their rows in nhl_draft.csv and
+nhl_player_stats.csv are replaced, the rows of all the other players are kept as they are.
+
+The quantile categories (PLUS_MINUS_CAT, GP_CAT, POINT_SHARES_CAT, GAMES_PLAYED_CAT) of the new rows are cut by the
+frozen bin edges of the last full build (nhl_quantile_edges.json). After the update the quantiles of the whole tables
+are compared with the frozen edges and drifted columns are reported, --recompute-drifted recomputes them.
+Updated rows are appended at the end of the stats table, so the row order can differ from a full rebuild.
+
+Usage: python ingest.py [--draft FILE] [--stats FILE] [--dim FILE] [--recompute-drifted]
+"""
+
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+
+import connect
+from connect import LEAGUE, PLAYER_ID, PLAYER_NAME
+from datasets import DRAFT, PLAYER_STATS, read_table
+from names import name_keys
+
+# Largest allowed shift of a quantile edge, relative to the range of the frozen edges
+DRIFT_TOLERANCE = 0.05
+
+# Output table and column every quantile category is computed from
+QUANTILE_SOURCES = {
+    'PLAYER_STATS.PLUS_MINUS_CAT': (PLAYER_STATS, '+/-'),
+    'PLAYER_STATS.GP_CAT': (PLAYER_STATS, 'GP'),
+    'DRAFT.PLUS_MINUS_CAT': (DRAFT, 'PLUS_MINUS'),
+    'DRAFT.POINT_SHARES_CAT': (DRAFT, 'POINT_SHARES'),
+    'DRAFT.GAMES_PLAYED_CAT': (DRAFT, 'GAMES_PLAYED'),
+}
+
+
+def _append_rows(path, rows):
+    columns = pd.read_csv(path, encoding='unicode_escape', nrows=0).columns
+    with open(path, 'rb+') as file:
+        file.seek(0, 2)
+        if file.tell():
+            file.seek(-1, 2)
+            if file.read(1) != b'\n':
+                file.write(b'\n')
+    rows[columns].to_csv(path, mode='a', header=False, index=False)
+
+
+# Player ids and name keys (names.name_keys) affected by the new rows. Names are resolved through the NHL rows of the
+# stats until no new id or name shows up.
+def affected_players(player_stats_df, player_ids, player_names):
+    nhl_players = player_stats_df.loc[player_stats_df[LEAGUE] == 'NHL', [PLAYER_ID, PLAYER_NAME]].drop_duplicates()
+    nhl_names = name_keys(nhl_players[PLAYER_NAME])
+    ids, names = set(player_ids), set(name_keys(pd.Series(list(player_names), dtype=object)).dropna())
+    while True:
+        new_names = set(nhl_names[nhl_players[PLAYER_ID].isin(ids)]) - names
+        new_ids = set(nhl_players.loc[nhl_names.isin(names), PLAYER_ID]) - ids
+        if not new_names and not new_ids:
+            return ids, names
+        names |= new_names
+        ids |= new_ids
+
+
+# Run the stages of connect.py for the given players only, the quantile categories use the frozen edges.
+def build_players(loaded, ids, names, frozen_edges):
+    player_stats_df, player_dim_df, draft_info_df, junior_seasons = loaded
+    loaded = (
+        player_stats_df[player_stats_df[PLAYER_ID].isin(ids)],
+        player_dim_df[player_dim_df[PLAYER_ID].isin(ids)],
+        draft_info_df[name_keys(draft_info_df['player']).isin(names)],
+        junior_seasons[junior_seasons[PLAYER_ID].isin(ids)],
+    )
+    nhl_filtered = connect.filter_nhl(loaded)
+    normalized = connect.normalize_names(loaded, nhl_filtered)
+    joined = connect.join(normalized, connect.first_draft_year, connect.last_draft_year)
+    metrics = connect.add_per_game_metrics(normalized, joined)
+    junior_stats = connect.add_junior_stats(loaded, joined)
+    categorized = connect.categorize(
+        metrics, junior_stats, **connect.categorization_config, frozen_quantile_edges=frozen_edges
+    )
+    return connect.output_tables(categorized)
+
+
+# Relative shift of the quantile edges of the current tables against the frozen edges
+def quantile_drift(tables, frozen_edges):
+    drift = {}
+    for name, edges in frozen_edges.items():
+        table, column = QUANTILE_SOURCES[name]
+        current = tables[table][column].quantile(np.linspace(0, 1, len(edges))).to_numpy()
+        spread = (edges[-1] - edges[0]) or 1
+        drift[name] = float(np.max(np.abs(current - np.array(edges))) / spread)
+    return drift
+
+
+def ingest(draft_rows=None, stats_rows=None, dim_rows=None, recompute_drifted=False,
+           drift_tolerance=DRIFT_TOLERANCE):
+    with open(connect.QUANTILE_EDGES_FILE) as file:
+        frozen_edges = json.load(file)
+
+    for path, rows in [(connect.DRAFT_INFO_FILE, draft_rows), (connect.PLAYER_STATS_FILE, stats_rows),
+                       (connect.PLAYER_DIM_FILE, dim_rows)]:
+        if rows is not None:
+            _append_rows(path, rows)
+
+    new_ids = [rows[PLAYER_ID] for rows in (stats_rows, dim_rows) if rows is not None]
+    new_names = draft_rows['player'] if draft_rows is not None else []
+    loaded = connect.load()
+    ids, names = affected_players(loaded[0], pd.concat(new_ids) if new_ids else [], new_names)
+    new_draft, new_stats = build_players(loaded, ids, names, frozen_edges)
+
+    draft_df = read_table(DRAFT, data_dir='.', compact=False)
+    stats_df = read_table(PLAYER_STATS, data_dir='.', compact=False)
+    draft_df = draft_df[~(draft_df[PLAYER_ID].isin(ids) | name_keys(draft_df[PLAYER_NAME]).isin(names))]
+    stats_df = stats_df[~stats_df[PLAYER_ID].isin(ids)]
+    # The draft table is ordered by player name (the order of the outer join)
+    draft_df = pd.concat([draft_df, new_draft], ignore_index=True).sort_values(PLAYER_NAME, kind='stable')
+    stats_df = pd.concat([stats_df, new_stats], ignore_index=True)
+    tables = {DRAFT: draft_df, PLAYER_STATS: stats_df}
+
+    drift = quantile_drift(tables, frozen_edges)
+    drifted = [name for name, value in drift.items() if value > drift_tolerance]
+    if recompute_drifted:
+        for name in drifted:
+            table, column = QUANTILE_SOURCES[name]
+            quantile_edges = {}
+            tables[table][name.split('.')[1]] = connect.categorize_quantiles(
+                tables[table][column], name, connect.categories, quantile_edges
+            )
+            frozen_edges[name] = quantile_edges[name]
+
+    connect.write_outputs(tables[DRAFT], tables[PLAYER_STATS])
+    with open(connect.QUANTILE_EDGES_FILE, 'w') as file:
+        json.dump(frozen_edges, file, indent=2)
+    return {
+        'players': len(ids),
+        'names': len(names),
+        'draft_rows': len(new_draft),
+        'stats_rows': len(new_stats),
+        'drift': drift,
+        'drifted': drifted,
+        'recomputed': drifted if recompute_drifted else [],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Add new draft, season or player rows to the outputs of connect.py.')
+    parser.add_argument('--draft', help='CSV file with new nhldraft.csv rows')
+    parser.add_argument('--stats', help='CSV file with new player_stats.csv rows')
+    parser.add_argument('--dim', help='CSV file with new player_dim.csv rows')
+    parser.add_argument('--recompute-drifted', action='store_true',
+                        help='recompute the quantile categories whose bin edges have drifted')
+    args = parser.parse_args()
+
+    result = ingest(
+        draft_rows=pd.read_csv(args.draft) if args.draft else None,
+        stats_rows=pd.read_csv(args.stats, encoding='unicode_escape') if args.stats else None,
+        dim_rows=pd.read_csv(args.dim, encoding='unicode_escape') if args.dim else None,
+        recompute_drifted=args.recompute_drifted,
+    )
+    print(f"Updated {result['players']} players ({result['draft_rows']} draft rows, {result['stats_rows']} stats rows)")
+    for name in result['drifted']:
+        action = 'recomputed' if name in result['recomputed'] else 'run with --recompute-drifted or rebuild'
+        print(f"{name}: quantile edges drifted by {result['drift'][name]:.1%}, {action}")
+
+
+if __name__ == '__main__':
+    main()
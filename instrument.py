@@ -0,0 +1,181 @@
+"""
+Instrumentation of the stages of connect.py, the cleverminer calls and the task scripts.
+
+instrument(name, kind) is a context manager measuring a block: wall and CPU time, the peak RSS of the process and how
+much the block raised it, the row counts of its input and output tables and the number of mined rules (counted by
+Measurement.count_inputs() / count_outputs() from DataFrames and cleverminer results). instrumented() does the same
+for a function, counting its arguments and its result. Every measurement is appended as a JSON line to LOG_FILE (or
+to the file in the NHL_INSTRUMENT_LOG environment variable), together with the script and the enclosing block.
+
+Blocks named in the NHL_PROFILE environment variable (comma separated, e.g. NHL_PROFILE=join or
+NHL_PROFILE=cleverminer) run under cProfile. Their statistics are written to PROFILE_DIR and the functions with the
+most cumulative time are printed to standard error. Profiled stages of connect.py are never loaded from the cache.
+
+Usage: python instrument.py [LOG_FILE] (totals of the logged blocks)
+e.g. NHL_PROFILE=join python connect.py
+"""
+
+import contextlib
+import cProfile
+import datetime
+import functools
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_FILE = os.environ.get('NHL_INSTRUMENT_LOG', os.path.join(ROOT_DIR, '.cache', 'instrumentation.jsonl'))
+PROFILE_DIR = os.path.join(ROOT_DIR, '.cache', 'profiles')
+# Functions printed for a profiled block
+PROFILE_TOP = 20
+
+# Names of the blocks being measured, per thread (the last one is the parent of a new block)
+_local = threading.local()
+_profiling = threading.Lock()
+
+
+def profiled(name):
+    return name in {part.strip() for part in os.environ.get('NHL_PROFILE', '').split(',')}
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+# Row counts of the tables in a value (a DataFrame or Series, or tuples and lists of them)
+def _rows(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return [len(value)]
+    if isinstance(value, (tuple, list)):
+        return [rows for item in value for rows in _rows(item)]
+    return []
+
+
+# Fields of the record of one block, set by the code in the block
+class Measurement:
+    def __init__(self):
+        self.fields = {}
+
+    def count_inputs(self, *values):
+        self.fields['rows_in'] = _rows(values)
+
+    def count_outputs(self, value):
+        self.fields['rows_out'] = _rows(value)
+        result = getattr(value, 'result', None)
+        if isinstance(result, dict) and 'rules' in result:
+            self.fields['rules'] = len(result['rules'])
+
+
+def write_record(record, path=None):
+    path = path or LOG_FILE
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'a') as file:
+        file.write(json.dumps(record, default=str) + '\n')
+
+
+def _write_profile(name, profiler):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    path = os.path.join(PROFILE_DIR, f'{name}-{stamp}-{os.getpid()}.prof')
+    profiler.dump_stats(path)
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(PROFILE_TOP)
+    print(f'Profile of {name} written to {path}\n{report.getvalue()}', file=sys.stderr)
+    return path
+
+
+@contextlib.contextmanager
+def instrument(name, kind):
+    stack = _local.__dict__.setdefault('stack', [])
+    measurement = Measurement()
+    # Only one block at a time can be profiled
+    profiler = cProfile.Profile() if profiled(name) and _profiling.acquire(blocking=False) else None
+    error = None
+    peak_before = _peak_rss_mb()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    stack.append(name)
+    if profiler:
+        profiler.enable()
+    try:
+        yield measurement
+    except BaseException as exception:
+        error = type(exception).__name__
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+        stack.pop()
+        peak_after = _peak_rss_mb()
+        record = {
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'script': os.path.basename(sys.argv[0]),
+            'pid': os.getpid(),
+            'kind': kind,
+            'name': name,
+            'parent': stack[-1] if stack else None,
+            'wall_seconds': round(time.perf_counter() - wall_start, 4),
+            'cpu_seconds': round(time.process_time() - cpu_start, 4),
+            'peak_rss_mb': None if peak_after is None else round(peak_after, 1),
+            'peak_rss_delta_mb': None if peak_after is None else round(peak_after - peak_before, 1),
+            **measurement.fields,
+        }
+        if error:
+            record['error'] = error
+        if profiler:
+            record['profile'] = _write_profile(name, profiler)
+            _profiling.release()
+        write_record(record)
+
+
+# Decorator measuring every call of a function (named after the function by default), rows are counted in its
+# arguments and its result
+def instrumented(name=None, kind='function'):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with instrument(name or function.__name__, kind) as measurement:
+                measurement.count_inputs(*args, *kwargs.values())
+                result = function(*args, **kwargs)
+                measurement.count_outputs(result)
+            return result
+        return wrapper
+    return decorator
+
+
+def read_log(path=None):
+    with open(path or LOG_FILE) as file:
+        return pd.DataFrame([json.loads(line) for line in file if line.strip()])
+
+
+def main():
+    log = read_log(sys.argv[1] if len(sys.argv) > 1 else None)
+    pd.set_option('display.width', 120)
+    totals = log.groupby(['kind', 'name'], sort=False).agg(
+        calls=('name', 'size'),
+        wall_seconds=('wall_seconds', 'sum'),
+        cpu_seconds=('cpu_seconds', 'sum'),
+        max_rss_delta_mb=('peak_rss_delta_mb', 'max'),
+        last_run=('time', 'max'),
+    )
+    print(totals.sort_values('wall_seconds', ascending=False).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Shared entry point for running cleverminer on the prepared task data.
+
+Every mining task in tasks/ defines a prepare() function returning its working set and a MINER dict with the
+cleverminer parameters (proc, quantifiers, ante, succ, cond, ...). mine() runs cleverminer on that pair (or returns
+the stored result when the same data was already mined with the same parameters, see mining_cache.py) and
+rule_records() turns the mined rules into plain dicts that can be stored or compared.
+"""
+
+from cleverminer import cleverminer
+
+from datasets import decategorize
+from instrument import instrument, profiled
+from mining_cache import MiningCache, cache_key
+
+
+# cached=False always runs cleverminer (and does not store the result). Every call is measured by instrument.py as
+# the block 'cleverminer', when it is profiled the cache is not used.
+def mine(df, cached=True, **params):
+    df = decategorize(df)
+    with instrument('cleverminer', 'mining') as measurement:
+        measurement.fields['proc'] = params.get('proc')
+        measurement.count_inputs(df)
+        if not cached or profiled('cleverminer'):
+            clm = cleverminer(df=df, **params)
+            measurement.fields['cached'] = False
+        else:
+            cache = MiningCache()
+            key = cache_key(df, params)
+            clm = cache.get(key)
+            measurement.fields['cached'] = clm is not None
+            if clm is None:
+                clm = cleverminer(df=df, **params)
+                cache.put(key, clm)
+        measurement.count_outputs(clm)
+    return clm
+
+
+# Mined rules as plain dicts: rule id, cedents as text and as {attribute: [categories]} and the rule parameters
+# (base, confidence, four-fold tables, ... depending on the procedure).
+def rule_records(clm):
+    return [
+        {
+            'rule_id': rule['rule_id'],
+            'cedents': rule['cedents_str'],
+            'cedents_struct': rule['cedents_struct'],
+            'params': rule['params'],
+        }
+        for rule in clm.result['rules']
+    ]
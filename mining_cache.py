@@ -0,0 +1,123 @@
+"""
+On-disk cache of cleverminer results, used by mining.mine().
+
+A result is keyed by a hash of the df handed to cleverminer (column names, dtypes and values, the category order of
+categorical columns included) and of the cleverminer parameters, with dict keys sorted and quantifier names in upper
+case (cleverminer matches them case-insensitively). When the same task is mined again on the same data, the stored
+cleverminer object is returned instead of running the search, print_rulelist() and result work on it as usual.
+
+Results are pickles under CACHE_DIR. The cache is bounded by MAX_CACHE_BYTES, the least recently used results are
+removed first. All the results are removed when the installed cleverminer version changes.
+"""
+
+import contextlib
+import hashlib
+import importlib.metadata
+import json
+import os
+import pickle
+
+import pandas as pd
+from cleverminer import cleverminer
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(ROOT_DIR, '.cache', 'mining')
+MAX_CACHE_BYTES = 256 * 2 ** 20
+VERSION_FILE = 'cleverminer_version'
+
+
+def data_fingerprint(df):
+    digest = hashlib.sha256()
+    for column in df.columns:
+        series = df[column]
+        dtype = series.dtype
+        categories = list(dtype.categories) if isinstance(dtype, pd.CategoricalDtype) else None
+        digest.update(repr((column, str(dtype), categories)).encode())
+        digest.update(pd.util.hash_pandas_object(series, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _canonical(params):
+    params = dict(params)
+    if 'quantifiers' in params:
+        params['quantifiers'] = {name.upper(): value for name, value in params['quantifiers'].items()}
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+def cache_key(df, params):
+    return hashlib.sha256(f'{data_fingerprint(df)}:{_canonical(params)}'.encode()).hexdigest()
+
+
+class MiningCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.version = importlib.metadata.version('cleverminer')
+        os.makedirs(cache_dir, exist_ok=True)
+        version_path = os.path.join(cache_dir, VERSION_FILE)
+        stored_version = None
+        if os.path.exists(version_path):
+            with open(version_path) as file:
+                stored_version = file.read().strip()
+        if stored_version != self.version:
+            # Parallel run_tasks.py workers can all find the old version and clear the cache at the same time
+            self.clear()
+            temporary_path = f'{version_path}.{os.getpid()}.tmp'
+            with open(temporary_path, 'w') as file:
+                file.write(self.version)
+            os.replace(temporary_path, version_path)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.pkl')
+
+    def _entries(self):
+        return [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith('.pkl')]
+
+    # The stored cleverminer object, or None. A hit marks the result as recently used.
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                state = pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        # The entry may have been evicted by another process since it was read
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)
+        clm = cleverminer.__new__(cleverminer)
+        clm.__dict__.update(state)
+        return clm
+
+    # Store a cleverminer object without the mined df and the progress bar (which cannot be pickled)
+    def put(self, key, clm):
+        state = {name: value for name, value in vars(clm).items() if name != 'bar'}
+        state['bar'] = None
+        state['kwargs'] = {name: value for name, value in clm.kwargs.items() if name != 'df'}
+        # Written under a temporary name first, run_tasks.py may store results from several processes at once
+        temporary_path = f'{self._path(key)}.{os.getpid()}.tmp'
+        with open(temporary_path, 'wb') as file:
+            pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, self._path(key))
+        self.evict()
+
+    # Remove the least recently used results until the cache fits into max_bytes
+    def evict(self):
+        entries = []
+        for path in self._entries():
+            # Another process may have removed the file in the meantime
+            with contextlib.suppress(FileNotFoundError):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            total -= size
+
+    def clear(self):
+        for path in self._entries():
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
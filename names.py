@@ -0,0 +1,109 @@
+"""
+Name resolution between the draft rows of nhldraft.csv and the NHL players of player_dim.csv, used by connect.join().
+
+Names are normalized once to keys: the position suffix of the stats names ('Sebastian Aho (C)') is removed, accents
+are stripped, the name is lower cased and dots, apostrophes, hyphens and generational suffixes (Jr., Sr., II, III, IV)
+are dropped. Draft rows and players are paired with a hash join on the keys. When both birth years are known (for a
+draft row the draft year minus the draft age), they have to be at most BIRTH_YEAR_TOLERANCE apart.
+
+Every draft row is matched to at most one player and every player to at most one draft row. Names with a single
+candidate pair are matched directly. For the other names the pairs with known birth years are preferred, and a player
+with more than one draft row (re-entered the draft) keeps the latest draft, the other draft rows stay without a player.
+Candidates that cannot be told apart are left unmatched. Both cases are listed in the report of resolve().
+"""
+
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from transforms import strip_position, unique_map
+
+BIRTH_YEAR_TOLERANCE = 1
+
+AMBIGUOUS = 'ambiguous'
+REDRAFTED = 'redrafted'
+# Report reasons as printed by connect.py
+REASONS = {
+    AMBIGUOUS: 'names with candidates that cannot be told apart, left without a match',
+    REDRAFTED: 'players with more than one draft row of their name, matched to one of them',
+}
+
+_PUNCTUATION = re.compile(r"[.'`]")
+_GENERATION_SUFFIX = re.compile(r'\s+(jr|sr|ii|iii|iv)$')
+
+
+# Normalized name key of one name
+def name_key(name):
+    key = unicodedata.normalize('NFKD', strip_position(name)).encode('ascii', 'ignore').decode('ascii')
+    key = ' '.join(_PUNCTUATION.sub('', key.lower()).replace('-', ' ').split())
+    return _GENERATION_SUFFIX.sub('', key)
+
+
+# Normalized name keys of a Series of names (see transforms.unique_map), missing names stay missing
+def name_keys(names):
+    constants = {'_PUNCTUATION': _PUNCTUATION.pattern, '_GENERATION_SUFFIX': _GENERATION_SUFFIX.pattern}
+    return unique_map(pd.Series(names, dtype=object), name_key, code=[strip_position], constants=constants)
+
+
+# Candidate (draft row, player row) pairs of one name in the order they are assigned: known birth years first, then
+# the latest draft, then the row order
+def _ordered(pairs):
+    return pairs.sort_values(['known', 'year', 'draft_row', 'dim_row'], ascending=[False, False, True, True])
+
+
+def _rank(pair):
+    return pair.known, pair.year
+
+
+# Assign the contested pairs of one name one to one. Returns the accepted pairs and the report entries.
+def _assign(key, pairs):
+    accepted, report = [], []
+    remaining = list(_ordered(pairs).itertuples(index=False))
+    while remaining:
+        best = remaining[0]
+        competing = [pair for pair in remaining[1:] if pair.draft_row == best.draft_row or pair.dim_row == best.dim_row]
+        tied = [pair for pair in competing if _rank(pair) == _rank(best)]
+        if tied:
+            rows = [best] + tied
+            draft_rows = {pair.draft_row for pair in rows}
+            dim_rows = {pair.dim_row for pair in rows}
+            report.append((key, AMBIGUOUS, sorted(draft_rows), sorted(dim_rows)))
+        else:
+            accepted.append((best.draft_row, best.dim_row))
+            draft_rows, dim_rows = {best.draft_row}, {best.dim_row}
+            earlier = sorted(pair.draft_row for pair in competing if pair.dim_row == best.dim_row)
+            if earlier:
+                report.append((key, REDRAFTED, [best.draft_row] + earlier, [best.dim_row]))
+        remaining = [pair for pair in remaining if pair.draft_row not in draft_rows and pair.dim_row not in dim_rows]
+    return accepted, report
+
+
+# Match draft rows to players. draft: name keys ('key'), estimated birth years ('birth_year') and draft years
+# ('year') of the draft rows, dim: name keys and birth years of the players. Returns the position of the matched
+# player for every draft row (-1 for none) and a report with one row per redrafted player or ambiguous name (the
+# positions of the draft rows and players involved).
+def resolve(draft, dim):
+    draft = pd.DataFrame({'key': draft['key'].to_numpy(), 'draft_birth_year': draft['birth_year'].to_numpy(),
+                          'year': draft['year'].to_numpy(), 'draft_row': np.arange(len(draft))})
+    dim = pd.DataFrame({'key': dim['key'].to_numpy(), 'dim_birth_year': dim['birth_year'].to_numpy(),
+                        'dim_row': np.arange(len(dim))})
+    pairs = draft.dropna(subset=['key']).merge(dim.dropna(subset=['key']), on='key')
+    pairs['known'] = pairs['draft_birth_year'].notna() & pairs['dim_birth_year'].notna()
+    difference = (pairs['draft_birth_year'] - pairs['dim_birth_year']).abs()
+    pairs = pairs[~pairs['known'] | (difference <= BIRTH_YEAR_TOLERANCE)]
+
+    # Pairs whose draft row and player have no other candidate are matched directly
+    single = (pairs.groupby('draft_row')['dim_row'].transform('size') == 1) & \
+             (pairs.groupby('dim_row')['draft_row'].transform('size') == 1)
+    matches = np.full(len(draft), -1)
+    matches[pairs.loc[single, 'draft_row'].to_numpy()] = pairs.loc[single, 'dim_row'].to_numpy()
+
+    report = []
+    for key, contested in pairs[~single].groupby('key', sort=True):
+        accepted, entries = _assign(key, contested)
+        for draft_row, dim_row in accepted:
+            matches[draft_row] = dim_row
+        report += entries
+    return matches, pd.DataFrame(report, columns=['key', 'reason', 'draft_rows', 'dim_rows'])
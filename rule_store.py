@@ -0,0 +1,290 @@
+"""
+SQLite store of the mined rules, so the results of different runs can be queried and compared without mining again.
+
+Every cleverminer run of a task is stored as a run (task, procedure, quantifiers, miner parameters, summary) with its
+rules. A rule keeps its cedents, its parameters and its four-fold tables (fourfold for 4ftMiner, fourfold1 and
+fourfold2 for SD4ftMiner). The task, the quantifiers, the attributes of every cedent, the succedent, the confidence and
+the base are indexed. Confidence and base are the ones of the first set for SD4ftMiner, CFMiner rules have no
+confidence.
+
+The tasks and run_tasks.py save their runs to rules.sqlite, next to the output tables of connect.py. RuleStore.rules()
+fetches and filters rules, diff() compares the rules of two runs (added, removed and changed rules, matched by their
+cedents).
+
+Usage:
+python rule_store.py runs [--task 01]
+python rule_store.py rules (RUN | --task 01) [--min-conf 0.6] [--min-base 50] [--attribute HEIGHT_CAT] [--succ TEXT]
+python rule_store.py diff (RUN RUN | --task 01)  (without run ids the last two runs of the task are compared)
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+
+from datasets import DATA_DIR
+
+STORE_FILE = os.path.join(DATA_DIR, 'rules.sqlite')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    task TEXT NOT NULL,
+    proc TEXT NOT NULL,
+    quantifiers TEXT NOT NULL,
+    miner TEXT NOT NULL,
+    summary TEXT,
+    seconds REAL,
+    created TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_task ON runs (task);
+
+CREATE TABLE IF NOT EXISTS quantifiers (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    name TEXT NOT NULL,
+    value REAL,
+    PRIMARY KEY (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS quantifiers_name_value ON quantifiers (name, value);
+
+CREATE TABLE IF NOT EXISTS rules (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    rule_id INTEGER NOT NULL,
+    cedents TEXT NOT NULL,
+    cedents_struct TEXT NOT NULL,
+    params TEXT NOT NULL,
+    succ TEXT,
+    conf REAL,
+    base INTEGER,
+    PRIMARY KEY (run_id, rule_id)
+);
+CREATE INDEX IF NOT EXISTS rules_succ ON rules (succ);
+CREATE INDEX IF NOT EXISTS rules_conf ON rules (conf);
+CREATE INDEX IF NOT EXISTS rules_base ON rules (base);
+
+CREATE TABLE IF NOT EXISTS cedent_attributes (
+    run_id INTEGER NOT NULL,
+    rule_id INTEGER NOT NULL,
+    cedent TEXT NOT NULL,
+    attribute TEXT NOT NULL,
+    categories TEXT NOT NULL,
+    PRIMARY KEY (run_id, rule_id, cedent, attribute)
+);
+CREATE INDEX IF NOT EXISTS cedent_attributes_attribute ON cedent_attributes (attribute, cedent);
+
+CREATE TABLE IF NOT EXISTS fourfolds (
+    run_id INTEGER NOT NULL,
+    rule_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    a INTEGER NOT NULL,
+    b INTEGER NOT NULL,
+    c INTEGER NOT NULL,
+    d INTEGER NOT NULL,
+    PRIMARY KEY (run_id, rule_id, name)
+);
+"""
+
+FOURFOLD_PARAMS = ['fourfold', 'fourfold1', 'fourfold2']
+
+
+def _json(value):
+    return json.dumps(value, default=str)
+
+
+# Identity of a rule when comparing runs: its cedents with the attributes in a fixed order
+def rule_key(rule):
+    return _json({cedent: dict(sorted(attributes.items())) for cedent, attributes in
+                  sorted(rule['cedents_struct'].items()) if attributes})
+
+
+class RuleStore:
+    def __init__(self, path=STORE_FILE):
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Store a run: rules are rule_records() of mining.py, miner the cleverminer parameters of the task.
+    # Returns the id of the new run.
+    def add_run(self, task, miner, rules, summary=None, seconds=None):
+        with self.connection:
+            run_id = self.connection.execute(
+                'INSERT INTO runs (task, proc, quantifiers, miner, summary, seconds, created) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (task, miner['proc'], _json(miner['quantifiers']), _json(miner), _json(summary), seconds,
+                 datetime.datetime.now().isoformat(timespec='seconds')),
+            ).lastrowid
+            self.connection.executemany(
+                'INSERT INTO quantifiers VALUES (?, ?, ?)',
+                [(run_id, name.upper(), value) for name, value in miner['quantifiers'].items()],
+            )
+            self.connection.executemany(
+                'INSERT INTO rules VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(run_id, rule['rule_id'], _json(rule['cedents']), _json(rule['cedents_struct']),
+                  _json(rule['params']), rule['cedents'].get('succ'),
+                  rule['params'].get('conf', rule['params'].get('conf1')),
+                  rule['params'].get('base', rule['params'].get('base1'))) for rule in rules],
+            )
+            self.connection.executemany(
+                'INSERT INTO cedent_attributes VALUES (?, ?, ?, ?, ?)',
+                [(run_id, rule['rule_id'], cedent, attribute, _json(categories))
+                 for rule in rules for cedent, attributes in rule['cedents_struct'].items()
+                 for attribute, categories in attributes.items()],
+            )
+            self.connection.executemany(
+                'INSERT INTO fourfolds VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(run_id, rule['rule_id'], name, *rule['params'][name])
+                 for rule in rules for name in FOURFOLD_PARAMS if name in rule['params']],
+            )
+        return run_id
+
+    # Runs, newest first. quantifiers: {name: value} the runs have to be mined with (names are case-insensitive).
+    def runs(self, task=None, quantifiers=None):
+        query = ('SELECT runs.*, (SELECT COUNT(*) FROM rules WHERE rules.run_id = runs.run_id) AS rule_count '
+                 'FROM runs WHERE 1 = 1')
+        args = []
+        if task is not None:
+            query += ' AND task = ?'
+            args.append(task)
+        for name, value in (quantifiers or {}).items():
+            query += ' AND run_id IN (SELECT run_id FROM quantifiers WHERE name = ? AND value = ?)'
+            args += [name.upper(), value]
+        rows = self.connection.execute(query + ' ORDER BY run_id DESC', args).fetchall()
+        return [
+            {**dict(row), 'quantifiers': json.loads(row['quantifiers']), 'miner': json.loads(row['miner']),
+             'summary': json.loads(row['summary'])}
+            for row in rows
+        ]
+
+    def latest_run(self, task):
+        row = self.connection.execute('SELECT MAX(run_id) FROM runs WHERE task = ?', (task,)).fetchone()
+        return row[0]
+
+    # Rules of a run (the latest run of the task when only task is given, rules of all the runs when neither is),
+    # in the same format as rule_records() plus run_id and task. Optional filters: minimal confidence and base,
+    # succedent text, an attribute used in the rule (in the given cedent only, if cedent is set).
+    def rules(self, run_id=None, task=None, min_conf=None, min_base=None, succ=None, attribute=None, cedent=None):
+        if run_id is None and task is not None:
+            run_id = self.latest_run(task)
+            if run_id is None:
+                return []
+        query = 'SELECT rules.*, runs.task FROM rules JOIN runs USING (run_id) WHERE 1 = 1'
+        args = []
+        for condition, value in [('rules.run_id = ?', run_id), ('conf >= ?', min_conf), ('base >= ?', min_base),
+                                 ('succ = ?', succ)]:
+            if value is not None:
+                query += f' AND {condition}'
+                args.append(value)
+        if attribute is not None:
+            query += (' AND EXISTS (SELECT 1 FROM cedent_attributes AS attributes'
+                      ' WHERE attributes.run_id = rules.run_id AND attributes.rule_id = rules.rule_id'
+                      ' AND attributes.attribute = ?')
+            args.append(attribute)
+            if cedent is not None:
+                query += ' AND attributes.cedent = ?'
+                args.append(cedent)
+            query += ')'
+        rows = self.connection.execute(query + ' ORDER BY rules.run_id, rules.rule_id', args).fetchall()
+        return [
+            {
+                'run_id': row['run_id'],
+                'task': row['task'],
+                'rule_id': row['rule_id'],
+                'cedents': json.loads(row['cedents']),
+                'cedents_struct': json.loads(row['cedents_struct']),
+                'params': json.loads(row['params']),
+            }
+            for row in rows
+        ]
+
+    # Rules only in run_a (removed), only in run_b (added) and in both with different parameters (changed, as
+    # (rule in run_a, rule in run_b) pairs)
+    def diff(self, run_a, run_b):
+        rules_a = {rule_key(rule): rule for rule in self.rules(run_a)}
+        rules_b = {rule_key(rule): rule for rule in self.rules(run_b)}
+        return {
+            'removed': [rule for key, rule in rules_a.items() if key not in rules_b],
+            'added': [rule for key, rule in rules_b.items() if key not in rules_a],
+            'changed': [(rule, rules_b[key]) for key, rule in rules_a.items()
+                        if key in rules_b and rule['params'] != rules_b[key]['params']],
+        }
+
+
+# Store the rules of a cleverminer run of a task
+def save(task, miner, clm, seconds=None, path=STORE_FILE):
+    # Imported here, cleverminer prints its version on import and the query commands do not need it
+    from mining import rule_records
+
+    with RuleStore(path) as store:
+        return store.add_run(task, miner, rule_records(clm), clm.result['summary_statistics'], seconds)
+
+
+def _rule_line(rule):
+    cedents = ' | '.join(f'{cedent}: {text}' for cedent, text in rule['cedents'].items() if text != '---')
+    params = rule['params']
+    measures = ', '.join(f'{name}={params[name]:.3g}' for name in ('base', 'conf', 'base1', 'conf1', 'base2', 'conf2')
+                         if name in params)
+    return f"{rule['rule_id']:>4}  {cedents}  ({measures})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the stored rules of the mining tasks.')
+    parser.add_argument('--store', default=STORE_FILE, help='SQLite file with the rules')
+    commands = parser.add_subparsers(dest='command', required=True)
+    runs_parser = commands.add_parser('runs', help='list the stored runs')
+    runs_parser.add_argument('--task')
+    rules_parser = commands.add_parser('rules', help='list the rules of a run')
+    rules_parser.add_argument('run', nargs='?', type=int)
+    rules_parser.add_argument('--task')
+    rules_parser.add_argument('--min-conf', type=float)
+    rules_parser.add_argument('--min-base', type=int)
+    rules_parser.add_argument('--succ')
+    rules_parser.add_argument('--attribute')
+    rules_parser.add_argument('--cedent')
+    diff_parser = commands.add_parser('diff', help='compare the rules of two runs')
+    diff_parser.add_argument('runs', nargs='*', type=int)
+    diff_parser.add_argument('--task')
+    args = parser.parse_args()
+
+    with RuleStore(args.store) as store:
+        if args.command == 'runs':
+            for run in store.runs(args.task):
+                print(f"{run['run_id']:>4}  {run['task']}  {run['proc']}  {run['created']}  "
+                      f"{run['rule_count']} rules  {run['quantifiers']}")
+        elif args.command == 'rules':
+            if args.run is None and args.task is None:
+                parser.error('rules needs a run id or --task')
+            for rule in store.rules(args.run, args.task, args.min_conf, args.min_base, args.succ, args.attribute,
+                                    args.cedent):
+                print(_rule_line(rule))
+        else:
+            if len(args.runs) == 2:
+                run_a, run_b = args.runs
+            elif args.task is not None and not args.runs:
+                runs = store.runs(args.task)
+                if len(runs) < 2:
+                    parser.error(f'task {args.task} has less than two stored runs')
+                run_a, run_b = runs[1]['run_id'], runs[0]['run_id']
+            else:
+                parser.error('diff needs two run ids or --task')
+            diff = store.diff(run_a, run_b)
+            print(f"run {run_a} -> run {run_b}: {len(diff['added'])} added, {len(diff['removed'])} removed, "
+                  f"{len(diff['changed'])} changed")
+            for sign, name in (('+', 'added'), ('-', 'removed')):
+                for rule in diff[name]:
+                    print(f'{sign} {_rule_line(rule)}')
+            for rule_a, rule_b in diff['changed']:
+                print(f'~ {_rule_line(rule_a)}\n  -> {_rule_line(rule_b)}')
+
+
+if __name__ == '__main__':
+    main()
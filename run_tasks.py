@@ -0,0 +1,159 @@
+"""
+Runs all the cleverminer tasks from tasks/ in parallel.
+
+A task is a script in tasks/ that defines prepare() (returns the df to mine) and MINER (the cleverminer parameters),
+scripts without MINER (like the random forest in tasks/08.py) are skipped. Every task runs in its own worker process,
+the mined rules are collected into one JSON file (task_results.json by default) and saved as runs to the rule store
+(rules.sqlite, see rule_store.py). The results also hold the row counts of the values of every attribute of a task in
+its working set. Tasks whose working set is a load_dataset() spec (SPEC) on the columns of the draft cube are counted
+from the cube (see cube.dataset_cube()), the others from the df they mine.
+
+Usage: python run_tasks.py [task ...] [--workers N] [--output FILE] [--no-store]
+e.g. python run_tasks.py 01 03 --workers 2
+"""
+
+import argparse
+import ast
+import contextlib
+import glob
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import datasets
+from cube import CountCube, dataset_cube
+from instrument import instrument
+from mining import mine, rule_records
+from rule_store import RuleStore
+
+TASKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tasks')
+RESULTS_FILE = 'task_results.json'
+# Cedents of a MINER whose attributes are counted
+CEDENTS = ['ante', 'succ', 'cond', 'frst', 'scnd']
+
+
+# Names of the task scripts defining MINER. The scripts are parsed, not imported, so nothing in them runs.
+def discover_tasks(tasks_dir=TASKS_DIR):
+    names = []
+    for path in sorted(glob.glob(os.path.join(tasks_dir, '*.py'))):
+        with open(path) as file:
+            tree = ast.parse(file.read(), filename=path)
+        assigned = {target.id for node in tree.body if isinstance(node, ast.Assign)
+                    for target in node.targets if isinstance(target, ast.Name)}
+        defined = {node.name for node in tree.body if isinstance(node, ast.FunctionDef)}
+        if 'MINER' in assigned and 'prepare' in defined:
+            names.append(os.path.splitext(os.path.basename(path))[0])
+    return names
+
+
+def load_task(name, tasks_dir=TASKS_DIR):
+    spec = importlib.util.spec_from_file_location(f'task_{name}', os.path.join(tasks_dir, f'{name}.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Row counts of the values of every attribute of a task in its working set df ('nan' for missing values)
+def task_counts(task, df):
+    columns = list(dict.fromkeys(attribute['name'] for cedent in CEDENTS
+                                 for attribute in (task.MINER.get(cedent) or {}).get('attributes', [])))
+    cube = None
+    if hasattr(task, 'SPEC'):
+        # Raises KeyError when the spec reads columns the cube does not have
+        with contextlib.suppress(KeyError):
+            cube = dataset_cube(task.SPEC)
+    if cube is None:
+        cube = CountCube(df, columns)
+    counts = {}
+    for column in columns:
+        marginal = cube.marginal(column)
+        counts[column] = {str(label): int(count) for label, count in marginal.items() if count}
+        if cube.rows > marginal.sum():
+            counts[column]['nan'] = int(cube.rows - marginal.sum())
+    return counts
+
+
+# Runs in a worker process. cleverminer prints a lot, its output is captured so the workers do not mix their logs.
+def run_task(name):
+    start = time.perf_counter()
+    output = io.StringIO()
+    rulelist = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output), instrument(name, 'task'):
+            task = load_task(name)
+            df = task.prepare()
+            clm = mine(df, **task.MINER)
+            counts = task_counts(task, df)
+        with contextlib.redirect_stdout(rulelist):
+            clm.print_rulelist()
+        return {
+            'task': name,
+            'proc': task.MINER['proc'],
+            'miner': task.MINER,
+            'quantifiers': task.MINER['quantifiers'],
+            'rules': rule_records(clm),
+            'summary': clm.result['summary_statistics'],
+            'rows': len(df),
+            'counts': counts,
+            'seconds': time.perf_counter() - start,
+            'rulelist': rulelist.getvalue(),
+        }
+    except Exception:
+        return {'task': name, 'error': traceback.format_exc(), 'seconds': time.perf_counter() - start,
+                'output': output.getvalue()}
+
+
+# Read both output tables once in this process. With the fork start method the workers inherit the parsed columns
+# (copy on write) from datasets' cache instead of every worker parsing the files again.
+def _warm_datasets():
+    for name in (datasets.DRAFT, datasets.PLAYER_STATS):
+        if os.path.exists(datasets.csv_path(name)) or os.path.exists(datasets.parquet_path(name)):
+            datasets.read_table(name)
+
+
+def run_all(names=None, workers=None):
+    names = names or discover_tasks()
+    context = None
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+        _warm_datasets()
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers or min(len(names), os.cpu_count()), mp_context=context) as pool:
+        futures = {pool.submit(run_task, name): name for name in names}
+        for future in as_completed(futures):
+            result = future.result()
+            status = 'error' if 'error' in result else f"{len(result['rules'])} rules"
+            print(f"{result['task']}: {status} in {result['seconds']:.1f}s")
+            results[result['task']] = result
+    return [results[name] for name in names]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the cleverminer tasks in parallel.')
+    parser.add_argument('tasks', nargs='*', help='task names (e.g. 01 03), all tasks by default')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--output', default=RESULTS_FILE, help='JSON file for the results')
+    parser.add_argument('--no-store', action='store_true', help='do not save the runs to the rule store')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = run_all(args.tasks, args.workers)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2, default=str)
+    if not args.no_store:
+        with RuleStore() as store:
+            for result in results:
+                if 'error' not in result:
+                    store.add_run(result['task'], result['miner'], result['rules'], result['summary'],
+                                  result['seconds'])
+    print(f'{len(results)} tasks finished in {time.perf_counter() - start:.1f}s, results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Compact dtypes of the tables written by connect.py.
+
+Read from CSV, the tables get float64 for every count with a missing value (DRAFT_ROUND, GAMES_PLAYED, AGE, ...) and
+object strings for low-cardinality text columns (POSITION, SHOOTS, DRAFT_TEAM, the *_CAT columns, ...), with the same
+label stored again in every row. SCHEMAS gives every column a compact dtype instead: nullable small integers,
+categoricals and float32.
+
+compact() applies a schema. Integers and categoricals are lossless, connect.py and ingest.py write the outputs with
+them, so the Parquet files already have the compact dtypes. float32 loses precision (comparisons of per-game values
+like those of task 10 can flip), so floats are never downcast for the tasks, datasets.read_table() keeps them at
+float64. Only the memory report shows the float32 savings.
+
+Usage: python schema.py (prints the memory of every column before and after compacting)
+"""
+
+import os
+
+import pandas as pd
+
+# Table names, datasets.py imports them from here
+DRAFT = 'nhl_draft'
+PLAYER_STATS = 'nhl_player_stats'
+
+CATEGORY = 'category'
+FLOAT = 'float32'
+
+_CATEGORY_COLUMNS = ['PLUS_MINUS_CAT', 'PPG_CAT', 'GPG_CAT', 'APG_CAT', 'PIMPG_CAT', 'AMATEUR_LEAGUE_CAT', 'HEIGHT_CAT',
+                     'WEIGHT_CAT', 'DRAFT_TEAM', 'AMATEUR_LEAGUE']
+_PER_GAME_COLUMNS = ['PPG', 'GPG', 'APG', 'PIMPG']
+
+SCHEMAS = {
+    DRAFT: {
+        'DRAFT_YEAR': 'Int16',
+        'OVERALL_PICK': 'Int16',
+        'POSITION': CATEGORY,
+        'NATIONALITY_ABBR': CATEGORY,
+        'AGE': 'Int8',
+        'TO_YEAR': 'Int16',
+        'AMATEUR_TEAM': CATEGORY,
+        'GAMES_PLAYED': 'Int16',
+        'GOALS': 'Int16',
+        'ASSISTS': 'Int16',
+        'POINTS': 'Int16',
+        'PLUS_MINUS': 'Int16',
+        'PENALTIES_MINUTES': 'Int16',
+        'GOALIE_GAMES_PLAYED': 'Int16',
+        'GOALIE_WINS': 'Int16',
+        'GOALIE_LOSSES': 'Int16',
+        'GOALIE_TIES_OVERTIME': 'Int16',
+        'SAVE_PERCENTAGE': FLOAT,
+        'GOALS_AGAINST_AVERAGE': FLOAT,
+        'POINT_SHARES': FLOAT,
+        # Int16 so that the tasks can fill missing rounds with 100, 123 or 999
+        'DRAFT_ROUND': 'Int16',
+        'PLAYER_ID': 'Int32',
+        'NATIONALITY': CATEGORY,
+        'HEIGHT_CM': 'Int16',
+        'WEIGHT_KG': 'Int16',
+        'SHOOTS': CATEGORY,
+        'POINT_SHARES_CAT': CATEGORY,
+        'GAMES_PLAYED_CAT': CATEGORY,
+        'NATIONALITY_CAT': CATEGORY,
+        'LAST_JUNIOR_YEAR_PPG': FLOAT,
+        'AVERAGE_JUNIOR_PPG': FLOAT,
+        'LAST_JUNIOR_YEAR_PPG_CAT': CATEGORY,
+        'AVERAGE_JUNIOR_PPG_CAT': CATEGORY,
+        **{column: CATEGORY for column in _CATEGORY_COLUMNS},
+        **{column: FLOAT for column in _PER_GAME_COLUMNS},
+    },
+    PLAYER_STATS: {
+        'PLAYER_ID': 'Int32',
+        # A player has about a dozen rows, the name is stored once per player
+        'PLAYER_NAME': CATEGORY,
+        'TEAM': CATEGORY,
+        'LEAGUE_YEAR': CATEGORY,
+        'GP': 'Int16',
+        'G': 'Int16',
+        'A': 'Int16',
+        'TP': 'Int16',
+        'PIM': 'Int16',
+        '+/-': 'Int16',
+        'GP_CAT': CATEGORY,
+        'SEASON_CAT': CATEGORY,
+        'IS_IN_CAP_ERA': CATEGORY,
+        'PLAYER_SEASON_NUMBER': 'Int8',
+        'DRAFT_YEAR': 'Int16',
+        'OVERALL_PICK': 'Int16',
+        'DRAFT_ROUND': 'Int16',
+        **{column: CATEGORY for column in _CATEGORY_COLUMNS},
+        **{column: FLOAT for column in _PER_GAME_COLUMNS},
+    },
+}
+
+
+# Convert the columns of df (a table named name) to the dtypes of its schema, columns without a schema dtype are left
+# as they are. Categorical columns keep their categories (and order). floats=False leaves the float columns alone.
+def compact(df, name, floats=True):
+    schema = SCHEMAS[name]
+    dtypes = {}
+    for column in df.columns:
+        dtype = schema.get(column)
+        if dtype is None or (dtype == FLOAT and not floats):
+            continue
+        if dtype == CATEGORY and isinstance(df[column].dtype, pd.CategoricalDtype):
+            continue
+        dtypes[column] = dtype
+    return df.astype(dtypes)
+
+
+# Memory of every column of df (in bytes, strings included) with its current dtype and with the schema dtype
+def memory_report(df, name):
+    compacted = compact(df, name)
+    report = pd.DataFrame({
+        'dtype_before': df.dtypes.astype(str),
+        'bytes_before': df.memory_usage(deep=True, index=False),
+        'dtype_after': compacted.dtypes.astype(str),
+        'bytes_after': compacted.memory_usage(deep=True, index=False),
+    })
+    report['saved'] = 1 - report['bytes_after'] / report['bytes_before']
+    return report
+
+
+def main():
+    from datasets import csv_path
+
+    pd.set_option('display.width', 120)
+    for name in (DRAFT, PLAYER_STATS):
+        if not os.path.exists(csv_path(name)):
+            print(f'{csv_path(name)} does not exist, run connect.py first\n')
+            continue
+        # The CSV file gives the dtypes pandas infers on its own
+        df = pd.read_csv(csv_path(name), encoding='unicode_escape')
+        report = memory_report(df, name)
+        print(f'{name}: {len(df)} rows')
+        print(report.to_string(formatters={'saved': '{:.0%}'.format}))
+        before, after = report['bytes_before'].sum() / 2 ** 20, report['bytes_after'].sum() / 2 ** 20
+        print(f'total: {before:.1f} MB -> {after:.1f} MB ({1 - after / before:.0%} less)\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Batch scoring of draft prospects with the draft round model of tasks/08.py.
+
+The prospects CSV needs the feature columns of the model (NATIONALITY_CAT, POSITION, AGE, HEIGHT_CAT, ...), other
+columns are copied to the output as they are. The file is read in chunks, every chunk is encoded with the code maps
+stored with the model (categories the model has not seen and missing values get the code of missing values) and gets
+the probability of every draft round, P_NOT_DRAFTED for the players without a round, and the most probable round.
+
+Usage: python score.py prospects.csv [--output FILE] [--chunksize N] [--model FILE]
+"""
+
+import argparse
+import sys
+import time
+
+import pandas as pd
+
+from training import MISSING, MODEL_FILE, encode, load_model
+
+CHUNKSIZE = 50_000
+PREDICTED_ROUND = 'PREDICTED_ROUND'
+
+
+def _probability_column(label):
+    return 'P_NOT_DRAFTED' if label == MISSING else f'P_ROUND_{label}'
+
+
+# Probabilities of the draft rounds for a df of prospects, plus the most probable round (MISSING: not drafted)
+def score(df, bundle):
+    missing = [column for column in bundle['features'] if column not in df.columns]
+    if missing:
+        raise ValueError(f'Missing feature columns: {", ".join(missing)}')
+    model = bundle['model']
+    encoded = encode(df[bundle['features']], bundle['code_maps'])
+    probabilities = model.predict_proba(encoded)
+    scores = pd.DataFrame(probabilities.round(4), index=df.index,
+                          columns=[_probability_column(label) for label in model.classes_])
+    scores[PREDICTED_ROUND] = model.classes_[probabilities.argmax(axis=1)]
+    return scores
+
+
+# Scored chunks of a prospects CSV: the columns of the file followed by the scores
+def score_file(path, bundle, chunksize=CHUNKSIZE):
+    # Text features are read as strings, so a numeric looking category still matches its code map
+    dtypes = {column: str for column in bundle['code_maps']}
+    for chunk in pd.read_csv(path, chunksize=chunksize, dtype=dtypes, encoding='unicode_escape'):
+        yield pd.concat([chunk, score(chunk, bundle)], axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Predict the draft round probabilities of prospects.')
+    parser.add_argument('prospects', help='CSV file with the feature columns of the model')
+    parser.add_argument('--output', help='output CSV file (default: standard output)')
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE, help='rows scored at once')
+    parser.add_argument('--model', default=MODEL_FILE, help='model stored by tasks/08.py')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    bundle = load_model(args.model)
+    # Trees are scored on all the cores
+    bundle['model'].set_params(n_jobs=-1)
+    loaded = time.perf_counter()
+    rows = 0
+    output = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        for number, scored in enumerate(score_file(args.prospects, bundle, args.chunksize)):
+            scored.to_csv(output, header=number == 0, index=False)
+            rows += len(scored)
+    finally:
+        if args.output:
+            output.close()
+    seconds = time.perf_counter() - loaded
+    print(f'Scored {rows} rows in {seconds:.1f} s ({rows / max(seconds, 1e-9):.0f} rows/s), '
+          f'model {bundle["features_version"]} loaded in {loaded - start:.2f} s', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
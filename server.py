@@ -0,0 +1,254 @@
+"""
+Local query server keeping the outputs of connect.py, the draft cube and the draft round model in memory.
+
+The tables are read once at start (datasets.py keeps them in memory), the count cube of cube.py and the model stored by
+tasks/08.py are loaded, and requests are answered with JSON over HTTP on localhost:
+
+GET  /health                                     loaded files and their versions
+GET  /tasks                                      mining tasks of tasks/
+GET  /counts?columns=POSITION,SHOOTS             row counts of the combinations of values of cube columns
+GET  /crosstab?index=POSITION&columns=DRAFT_ROUND
+POST /mine   {"task": "03", "quantifiers": {...}} or {"miner": {...}, "dataset": {load_dataset() spec}}
+POST /score  {"rows": [{"NATIONALITY_CAT": "Canada", "POSITION": "C", "AGE": 18, ...}, ...]}
+
+Counts, crosstabs and scores are computed in the request threads. Mining runs on a pool of worker processes
+(cleverminer is pure Python) and goes through the mining cache as usual. Only the tasks of tasks/ with a MINER can be
+mined by name. The workers are started by a forkserver (spawned where there is none), never forked from the server
+with its request threads running, and every worker reads the tables once when it starts. Every request is measured by
+instrument.py.
+
+The source files of the tables and the model file are checked every RELOAD_SECONDS. When one of them has changed (and
+did not change again by the next check, so connect.py has finished writing), the tables, the cube and the model are
+loaded again and new requests go to a new worker pool. The old pool is shut down once the requests already running
+on it have finished.
+
+Usage: python server.py [--host HOST] [--port PORT] [--workers N]
+e.g. curl -s 'localhost:8765/crosstab?index=POSITION&columns=DRAFT_ROUND'
+     curl -s -d '{"task": "01"}' localhost:8765/mine
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import threading
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from cube import draft_cube
+from datasets import DATA_DIR, DRAFT, PLAYER_STATS, load_dataset, source_path
+from instrument import instrument
+from mining import mine, rule_records
+from run_tasks import _warm_datasets, discover_tasks, load_task
+from score import score
+from training import MODEL_FILE, load_model
+
+HOST = '127.0.0.1'
+PORT = 8765
+RELOAD_SECONDS = 2.0
+
+
+# Runs in a worker process: mine a task (with quantifiers overriding some of its own) or a miner on a dataset spec.
+# cleverminer prints a lot, its output is dropped.
+def _mine(task, miner, spec, quantifiers):
+    with contextlib.redirect_stdout(io.StringIO()):
+        if task is not None:
+            module = load_task(task)
+            df, miner = module.prepare(), dict(module.MINER)
+        else:
+            df = load_dataset(spec)
+        if quantifiers:
+            miner['quantifiers'] = {**miner['quantifiers'], **quantifiers}
+        clm = mine(df, **miner)
+    return {'task': task, 'miner': miner, 'rows': len(df), 'rules': rule_records(clm),
+            'summary': clm.result['summary_statistics']}
+
+
+# Files the loaded data comes from, with their modification times
+def _versions():
+    paths = [source_path(name, DATA_DIR) for name in (DRAFT, PLAYER_STATS)] + [MODEL_FILE]
+    return {path: os.path.getmtime(path) for path in paths if os.path.exists(path)}
+
+
+# Data kept in memory by the server and the worker pool sharing it
+class QueryState:
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count()
+        self.lock = threading.Lock()
+        self.pool = None
+        self.reload()
+
+    def reload(self):
+        versions = _versions()
+        _warm_datasets()
+        cube = draft_cube()
+        bundle = load_model() if os.path.exists(MODEL_FILE) else None
+        if bundle is not None:
+            # Requests score a few rows, spreading them over the cores costs more than it saves
+            bundle['model'].set_params(n_jobs=1)
+        # Forking this process while request threads hold locks would copy the locks into the workers
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context(method),
+                                   initializer=_warm_datasets)
+        # Start the workers now, not on the first mining request
+        pool.submit(os.getpid).result()
+        with self.lock:
+            old_pool = self.pool
+            self.pool, self.cube, self.bundle, self.versions = pool, cube, bundle, versions
+            self.loaded = datetime.datetime.now().isoformat(timespec='seconds')
+        if old_pool is not None:
+            # Requests submitted before the swap still finish on the old pool
+            old_pool.shutdown(wait=True)
+
+    def submit(self, function, *args):
+        with self.lock:
+            return self.pool.submit(function, *args)
+
+    # Reload when the files have changed, checked every RELOAD_SECONDS until stop is set
+    def watch(self, stop):
+        changed = None
+        while not stop.wait(RELOAD_SECONDS):
+            versions = _versions()
+            if versions == self.versions:
+                changed = None
+            elif versions != changed:
+                # Wait for one more check, the files may still be written
+                changed = versions
+            else:
+                changed = None
+                paths = [os.path.basename(path) for path in versions if versions[path] != self.versions.get(path)]
+                try:
+                    self.reload()
+                    print(f'Reloaded after changes to {", ".join(paths) or "the loaded files"}', flush=True)
+                except Exception as error:
+                    print(f'Reload failed, serving the previous data: {error!r}', flush=True)
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _labels(index):
+    return [None if pd.isna(label) else label for label in index]
+
+
+def _health(state, query, body):
+    return {'loaded': state.loaded, 'versions': state.versions, 'draft_rows': state.cube.rows,
+            'model': state.bundle['features_version'] if state.bundle else None, 'workers': state.workers}
+
+
+def _tasks(state, query, body):
+    return discover_tasks()
+
+
+def _counts(state, query, body):
+    counts = state.cube.counts_by(*query['columns'].split(','), dropna=False)
+    return json.loads(counts[counts > 0].reset_index().to_json(orient='records'))
+
+
+def _crosstab(state, query, body):
+    table = state.cube.crosstab(query['index'], query['columns'], dropna=False)
+    return {'index': _labels(table.index), 'columns': _labels(table.columns), 'counts': table.to_numpy().tolist()}
+
+
+def _mine_request(state, query, body):
+    task, miner, spec = body.get('task'), body.get('miner'), body.get('dataset')
+    if task is None and (miner is None or spec is None):
+        raise ValueError('Send a task, or a miner and a dataset spec')
+    # The task script is executed, so only the mining tasks of tasks/ are accepted
+    tasks = discover_tasks()
+    if task is not None and task not in tasks:
+        raise ValueError(f'Unknown task {task!r}, use one of {", ".join(tasks)}')
+    return state.submit(_mine, task, miner, spec, body.get('quantifiers')).result()
+
+
+def _score(state, query, body):
+    if state.bundle is None:
+        raise ValueError(f'{MODEL_FILE} does not exist, run tasks/08.py first')
+    scores = score(pd.DataFrame(body['rows']), state.bundle)
+    return json.loads(scores.to_json(orient='records'))
+
+
+ROUTES = {
+    ('GET', '/health'): _health,
+    ('GET', '/tasks'): _tasks,
+    ('GET', '/counts'): _counts,
+    ('GET', '/crosstab'): _crosstab,
+    ('POST', '/mine'): _mine_request,
+    ('POST', '/score'): _score,
+}
+
+
+def _json_default(value):
+    return value.item() if isinstance(value, np.generic) else str(value)
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self._respond()
+
+    def do_POST(self):
+        self._respond()
+
+    def _respond(self):
+        url = urllib.parse.urlsplit(self.path)
+        route = ROUTES.get((self.command, url.path))
+        if route is None:
+            self._send(404, {'error': f'Unknown request {self.command} {url.path}'})
+            return
+        try:
+            query = {name: values[-1] for name, values in urllib.parse.parse_qs(url.query).items()}
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}')
+            with instrument(f'{self.command} {url.path}', 'request'):
+                result = route(self.server.state, query, body)
+        except (KeyError, ValueError, TypeError, FileNotFoundError) as error:
+            self._send(400, {'error': f'{type(error).__name__}: {error}'})
+        except Exception as error:
+            self._send(500, {'error': f'{type(error).__name__}: {error}'})
+        else:
+            self._send(200, result)
+
+    def _send(self, status, result):
+        data = json.dumps(result, default=_json_default).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(host=HOST, port=PORT, workers=None):
+    state = QueryState(workers)
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.state = state
+    stop = threading.Event()
+    threading.Thread(target=state.watch, args=(stop,), daemon=True).start()
+    print(f'Serving on http://{host}:{port} with {state.workers} mining workers', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+        state.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve mining, crosstab and scoring requests on the draft data.')
+    parser.add_argument('--host', default=HOST, help='address to listen on')
+    parser.add_argument('--port', type=int, default=PORT, help='port to listen on')
+    parser.add_argument('--workers', type=int, default=None, help='mining worker processes (default: all cores)')
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+On-disk cache for the stages of connect.py.
+
+Every stage result is stored as a pickle under CACHE_DIR. Its key is a hash of the stage name, the source code of the
+stage (and of the helper functions and modules it uses), the constants it reads, its config and the keys of the stages
+it reads from. Source files are keyed by their content. When nothing a stage depends on has changed, the stored result
+is loaded instead of recomputing it. Every stage is measured by instrument.py (also when it is loaded).
+"""
+
+import hashlib
+import inspect
+import os
+import pickle
+import time
+
+from instrument import instrument, profiled
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'stages')
+
+
+# Hash the content of a file in chunks, so big CSV files are never fully loaded just to be hashed.
+def file_fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def code_fingerprint(*functions):
+    return hashlib.sha256(''.join(inspect.getsource(function) for function in functions).encode()).hexdigest()
+
+
+def fingerprint(*parts):
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+# Result of a stage together with its cache key. Downstream stages are keyed by the keys of their inputs, so the data
+# itself never has to be hashed.
+class StageResult:
+    def __init__(self, name, key, value):
+        self.name = name
+        self.key = key
+        self.value = value
+
+
+class Pipeline:
+    def __init__(self, cache_dir=CACHE_DIR, rebuild=False, verbose=True):
+        self.cache_dir = cache_dir
+        self.rebuild = rebuild
+        self.verbose = verbose
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # Run a stage or load its result from the cache.
+    # inputs: results of upstream stages, their values are passed to func as positional arguments
+    # config: keyword arguments passed to func, they are part of the key
+    # code: helper functions (or whole modules) used by func, their source is part of the key
+    # constants: module-level values read by func or its helpers ({name: value}), part of the key but not passed
+    # files: source files read by func, their content is part of the key
+    # outputs: files written by func, the stage is rerun if any of them is missing
+    def run(self, name, func, *inputs, config=None, code=(), constants=None, files=(), outputs=()):
+        config = config or {}
+        constants = constants or {}
+        key = fingerprint(
+            name,
+            code_fingerprint(func, *code),
+            sorted(config.items()),
+            sorted(constants.items()),
+            [stage_input.key for stage_input in inputs],
+            [(path, file_fingerprint(path)) for path in files],
+        )
+        path = os.path.join(self.cache_dir, f'{name}-{key[:16]}.pkl')
+
+        # A profiled stage is always computed, there is nothing to profile in loading it
+        cached = not self.rebuild and not profiled(name) and os.path.exists(path) and \
+            all(os.path.exists(output) for output in outputs)
+        with instrument(name, 'stage') as measurement:
+            measurement.fields['cached'] = cached
+            if cached:
+                with open(path, 'rb') as file:
+                    value = pickle.load(file)
+            else:
+                start = time.perf_counter()
+                measurement.count_inputs(*[stage_input.value for stage_input in inputs])
+                value = func(*[stage_input.value for stage_input in inputs], **config)
+            measurement.count_outputs(value)
+        if cached:
+            self._log(f'{name}: cached')
+            return StageResult(name, key, value)
+        self._log(f'{name}: computed in {time.perf_counter() - start:.2f}s')
+
+        # Remove older results of the same stage, only the latest one can be reused by the next run
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.startswith(f'{name}-') and file_name.endswith('.pkl'):
+                os.remove(os.path.join(self.cache_dir, file_name))
+        with open(path, 'wb') as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        return StageResult(name, key, value)
+
+    def _log(self, message):
+        if self.verbose:
+            print(message)
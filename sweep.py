@@ -0,0 +1,157 @@
+"""
+Quantifier sweep for the 4ftMiner and SD4ftMiner tasks.
+
+Tuning the thresholds of a task (e.g. conf 0.5 / Base 100 against conf 0.45 / Base 80) does not need one cleverminer
+run per setting. The task is mined once with the loosest value of every swept quantifier, every rule found that way
+keeps its parameters and four-fold tables, and the rules of each tighter setting are picked from them by checking the
+quantifiers the same way cleverminer does. Quantifiers that are not swept keep the task's value and are applied by
+the single cleverminer run.
+
+Usage: python sweep.py task quantifier=value,value ... [--output FILE]
+e.g. python sweep.py 01 conf=0.45,0.5 Base=80,100
+"""
+
+import argparse
+import itertools
+import json
+
+from mining import mine, rule_records
+from run_tasks import load_task
+
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator > 0 else None
+
+
+# Rule measures by quantifier name (upper case, as cleverminer compares them), computed from the stored rule
+# parameters. None means the measure is undefined for the rule, cleverminer rejects the rule in that case.
+MEASURES = {
+    '4ftMiner': {
+        'BASE': lambda params: params['base'],
+        'RELBASE': lambda params: params['rel_base'],
+        'CONF': lambda params: params['conf'],
+        'PIM': lambda params: params['conf'],
+        'AAD': lambda params: params['aad'],
+        'BAD': lambda params: params['bad'],
+        'DBLPIM': lambda params: _ratio(params['fourfold'][0], sum(params['fourfold'][:3])),
+        'EQUIV': lambda params: _ratio(params['fourfold'][0] + params['fourfold'][3], sum(params['fourfold'])),
+    },
+    'SD4ftMiner': {
+        'BASE1': lambda params: params['base1'],
+        'FRSTBASE': lambda params: params['base1'],
+        'BASE2': lambda params: params['base2'],
+        'SCNDBASE': lambda params: params['base2'],
+        'RELBASE1': lambda params: params['rel_base1'],
+        'FRSTRELBASE': lambda params: params['rel_base1'],
+        'RELBASE2': lambda params: params['rel_base2'],
+        'SCNDRELBASE': lambda params: params['rel_base2'],
+        'CONF1': lambda params: params['conf1'],
+        'PIM1': lambda params: params['conf1'],
+        'FRSTCONF': lambda params: params['conf1'],
+        'FRSTPIM': lambda params: params['conf1'],
+        'CONF2': lambda params: params['conf2'],
+        'PIM2': lambda params: params['conf2'],
+        'SCNDCONF': lambda params: params['conf2'],
+        'SCNDPIM': lambda params: params['conf2'],
+        'DELTACONF': lambda params: params['deltaconf'],
+        'DELTAPIM': lambda params: params['deltaconf'],
+        'RATIOCONF': lambda params: params['ratioconf'],
+        'RATIOPIM': lambda params: params['ratioconf'],
+        'RATIOCONF_LEQ': lambda params: params['ratioconf'],
+        'RATIOPIM_LEQ': lambda params: params['ratioconf'],
+    },
+}
+
+
+# Quantifiers giving an upper bound (measure <= value), all the others give a lower bound (value <= measure)
+UPPER_BOUNDS = {'RATIOCONF_LEQ', 'RATIOPIM_LEQ'}
+
+
+# Function computing the value of quantifier name from the params of a rule of proc (used by approximate.py too)
+def measure(proc, name):
+    measures = MEASURES.get(proc)
+    if measures is None:
+        raise ValueError(f'Quantifier sweep is not supported for {proc}, only for {", ".join(MEASURES)}')
+    if name.upper() not in measures:
+        raise ValueError(f'Quantifier {name} cannot be swept for {proc}')
+    return measures[name.upper()]
+
+
+# Whether a rule (as in rule_records()) passes every quantifier of setting {quantifier: value}
+def passes(proc, rule, setting):
+    for name, value in setting.items():
+        rule_value = measure(proc, name)(rule['params'])
+        if rule_value is None:
+            return False
+        if name.upper() in UPPER_BOUNDS:
+            if rule_value > value:
+                return False
+        elif value > rule_value:
+            return False
+    return True
+
+
+# The loosest value of every swept quantifier: the lowest lower bound and the highest upper bound.
+def loosest(grid):
+    return {name: max(values) if name.upper() in UPPER_BOUNDS else min(values) for name, values in grid.items()}
+
+
+# All combinations of the grid values, as {quantifier: value} dicts.
+def settings(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+# Mine df once at the loosest thresholds of grid and filter the rules for every setting of the grid.
+# miner: cleverminer parameters (like the MINER dict of a task), grid: {quantifier: [value, ...]}.
+# Returns a list of {'quantifiers': ..., 'rules': [...]}, quantifiers being the full quantifiers of the setting.
+def sweep(df, miner, grid):
+    proc = miner['proc']
+    for name in grid:
+        measure(proc, name)
+
+    # Swept quantifiers replace the task's own value (matched case-insensitively, like in cleverminer)
+    swept = {name.upper() for name in grid}
+    fixed = {name: value for name, value in miner['quantifiers'].items() if name.upper() not in swept}
+    clm = mine(df, **{**miner, 'quantifiers': {**fixed, **loosest(grid)}})
+    rules = rule_records(clm)
+
+    return [
+        {
+            'quantifiers': {**fixed, **setting},
+            'rules': [rule for rule in rules if passes(proc, rule, setting)],
+        }
+        for setting in settings(grid)
+    ]
+
+
+def sweep_task(name, grid):
+    task = load_task(name)
+    return sweep(task.prepare(), task.MINER, grid)
+
+
+def _grid_argument(text):
+    name, _, values = text.partition('=')
+    if not values:
+        raise argparse.ArgumentTypeError(f'expected quantifier=value,value,..., got {text}')
+    return name, [float(value) if '.' in value else int(value) for value in values.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep the quantifiers of a 4ftMiner or SD4ftMiner task.')
+    parser.add_argument('task', help='task name (e.g. 01)')
+    parser.add_argument('grid', nargs='+', type=_grid_argument, help='quantifier values, e.g. conf=0.45,0.5')
+    parser.add_argument('--output', help='JSON file for the rules of every setting')
+    args = parser.parse_args()
+
+    results = sweep_task(args.task, dict(args.grid))
+    for result in results:
+        setting = ', '.join(f'{name}={value}' for name, value in result['quantifiers'].items())
+        print(f"{setting}: {len(result['rules'])} rules")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    main()
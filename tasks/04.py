@@ -1,29 +1,34 @@
-from cleverminer import cleverminer
-import pandas as pd
+import os
+import sys
 
-draft_df = pd.read_csv('../nhl_draft.csv', encoding='unicode_escape')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from datasets import load_dataset  # noqa: E402
+from mining import mine  # noqa: E402
+from rule_store import save  # noqa: E402
 
-# Filter out not player with no height or weight
-draft_df = draft_df[draft_df['HEIGHT_CAT'].notnull()]
-draft_df = draft_df[draft_df['WEIGHT_CAT'].notnull()]
+# To use sequences, we need to rename the columns (code strings into sortable strings)
+avg_junior_ppg_cats = ['very low', 'low', 'medium', 'high', 'very high']
+weight_cats = ['<75', '75-85', '85-95', '95-105', '105-115', '115-130', 'MAXICHONKER']
 
-# Fill draft round with 100 for undrafted players
-draft_df['DRAFT_ROUND'] = draft_df['DRAFT_ROUND'].fillna(100)
 
-# Combine players drafted in round 1, 2 and 3 into one category
-draft_df['DRAFT_ROUND'] = draft_df['DRAFT_ROUND'].replace([1, 2, 3], 'EARLY')
+# Working set of the task, see datasets.load_dataset()
+SPEC = {
+    'columns': [
+        'HEIGHT_CAT', 'WEIGHT_CAT', 'DRAFT_ROUND', 'AVERAGE_JUNIOR_PPG_CAT', 'LAST_JUNIOR_YEAR_PPG_CAT',
+        'NATIONALITY_CAT',
+    ],
+    # Fill draft round with 100 for undrafted players
+    'fillna': {'DRAFT_ROUND': 100},
+    # Filter out not player with no height or weight
+    'dropna': ['HEIGHT_CAT', 'WEIGHT_CAT'],
+    # Combine players drafted in round 1, 2 and 3 into one category and other drafted players into another one
+    'recode': {'DRAFT_ROUND': {'EARLY': [1, 2, 3], 'LATE': [4, 5, 6, 7, 8, 9, 10, 100]}},
+    'sortable': {'AVERAGE_JUNIOR_PPG_CAT': avg_junior_ppg_cats, 'WEIGHT_CAT': weight_cats},
+}
 
-# Combine other drafted players into one category
-draft_df['DRAFT_ROUND'] = draft_df['DRAFT_ROUND'].replace([4, 5, 6, 7, 8, 9, 10, 100], 'LATE')
 
-# To use sequences, we need to rename the columns
-# First code strings into numbers
-avg_junior_ppg_cats = ['very low', 'low', 'medium', 'high', 'very high']
-weight_cats = ['<75', '75-85', '85-95', '95-105', '105-115', '115-130', 'MAXICHONKER']
-replace_avg_ppg = [f'{index}_{value}' for index, value in enumerate(avg_junior_ppg_cats)]
-replace_weight = [f'{index}_{value}' for index, value in enumerate(weight_cats)]
-draft_df['AVERAGE_JUNIOR_PPG_CAT'] = draft_df['AVERAGE_JUNIOR_PPG_CAT'].replace(avg_junior_ppg_cats, replace_avg_ppg)
-draft_df['WEIGHT_CAT'] = draft_df['WEIGHT_CAT'].replace(weight_cats, replace_weight)
+def prepare():
+    return load_dataset(SPEC)
 
 
 # Using the CFMiner procedure from the cleverminer package to find associative rules with base over 50
@@ -33,12 +38,11 @@ draft_df['WEIGHT_CAT'] = draft_df['WEIGHT_CAT'].replace(weight_cats, replace_wei
 # sequence will be used for weight and avg junior ppg categories of max length 2 instead of subset)
 # and Nationality. We classify 'being drafted more in the later rounds' as relative number of players in 4+ rounds
 # is at least 85 %.
-clm = cleverminer(
-    df=draft_df,
-    target='DRAFT_ROUND',
-    proc='CFMiner',
-    quantifiers={'S_Up': 1, 'Base': 50, 'RelMax': 0.85},
-    cond={
+MINER = {
+    'target': 'DRAFT_ROUND',
+    'proc': 'CFMiner',
+    'quantifiers': {'S_Up': 1, 'Base': 50, 'RelMax': 0.85},
+    'cond': {
         'attributes': [
             {'name': 'HEIGHT_CAT', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
             {'name': 'WEIGHT_CAT', 'type': 'seq', 'minlen': 1, 'maxlen': 2},
@@ -47,6 +51,10 @@ clm = cleverminer(
             {'name': 'NATIONALITY_CAT', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
         ], 'minlen': 1, 'maxlen': 5, 'type': 'con'
     }
-)
+}
+
 
-clm.print_rulelist()
+if __name__ == '__main__':
+    clm = mine(prepare(), **MINER)
+    clm.print_rulelist()
+    save('04', MINER, clm)
@@ -1,24 +1,34 @@
-from cleverminer import cleverminer
-import pandas as pd
+import os
+import sys
 
-draft_df = pd.read_csv('../nhl_draft.csv', encoding='unicode_escape')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from datasets import load_dataset  # noqa: E402
+from mining import mine  # noqa: E402
+from rule_store import save  # noqa: E402
 
-# Filter out players with no PPG (did not play in NHL)
-draft_df = draft_df[draft_df['PPG_CAT'].notnull()]
+# To use cuts we need to sort PPG_CAT
+categories = ['very low', 'low', 'medium', 'high', 'very high']
 
-# Categorize draft rounds
-draft_df['DRAFT_ROUND'] = draft_df['DRAFT_ROUND'].fillna(123)
-draft_df['DRAFT_ROUND'] = draft_df['DRAFT_ROUND'].replace([1, 2, 3], 'EARLY')
-draft_df['DRAFT_ROUND'] = draft_df['DRAFT_ROUND'].replace([4, 5, 6, 7, 8, 9, 10, 123], 'LATE')
 
-# Fill missing height and weight with most common values
-draft_df['HEIGHT_CAT'] = draft_df['HEIGHT_CAT'].fillna('185-195')
-draft_df['WEIGHT_CAT'] = draft_df['WEIGHT_CAT'].fillna('85-95')
+# Working set of the task, see datasets.load_dataset()
+SPEC = {
+    'columns': [
+        'PPG_CAT', 'DRAFT_ROUND', 'HEIGHT_CAT', 'WEIGHT_CAT', 'NATIONALITY_CAT', 'POSITION', 'PIMPG_CAT',
+        'PLUS_MINUS_CAT', 'AMATEUR_LEAGUE_CAT', 'AVERAGE_JUNIOR_PPG_CAT',
+    ],
+    # Fill undrafted players' draft round and missing height and weight with most common values
+    'fillna': {'DRAFT_ROUND': 123, 'HEIGHT_CAT': '185-195', 'WEIGHT_CAT': '85-95'},
+    # Filter out players with no PPG (did not play in NHL)
+    'dropna': ['PPG_CAT'],
+    # Categorize draft rounds
+    'recode': {'DRAFT_ROUND': {'EARLY': [1, 2, 3], 'LATE': [4, 5, 6, 7, 8, 9, 10, 123]}},
+    'sortable': {'PPG_CAT': categories},
+}
+
+
+def prepare():
+    return load_dataset(SPEC)
 
-# To use cuts we need to sort PPG_CAT
-categories = ['very low', 'low', 'medium', 'high', 'very high']
-sortable_categories = [f'{index}_{value}' for index, value in enumerate(categories)]
-draft_df['PPG_CAT'] = draft_df['PPG_CAT'].replace(categories, sortable_categories)
 
 # Using the SD4ftMiner procedure from the cleverminer package to find associative rules with base over 25 (both)
 # Confidence ratio of 2.0 and absolute confidence difference of 0.13
@@ -26,11 +36,10 @@ draft_df['PPG_CAT'] = draft_df['PPG_CAT'].replace(categories, sortable_categorie
 # Average PPG in juniors, Weight, Height
 # Succedents: PPG (high + very high)
 # Groups of Draft round Early and Late
-clm = cleverminer(
-    df=draft_df,
-    proc='SD4ftMiner',
-    quantifiers={'Base1': 25, 'Base2': 25, 'Ratioconf': 2.0, 'Deltaconf': 0.13},
-    ante={
+MINER = {
+    'proc': 'SD4ftMiner',
+    'quantifiers': {'Base1': 25, 'Base2': 25, 'Ratioconf': 2.0, 'Deltaconf': 0.13},
+    'ante': {
         'attributes': [
             {'name': 'NATIONALITY_CAT', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
             {'name': 'POSITION', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
@@ -42,21 +51,25 @@ clm = cleverminer(
             {'name': 'WEIGHT_CAT', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
         ], 'minlen': 1, 'maxlen': 3, 'type': 'con',
     },
-    succ={
+    'succ': {
         'attributes': [
             {'name': 'PPG_CAT', 'type': 'rcut', 'minlen': 1, 'maxlen': 2},
         ], 'minlen': 1, 'maxlen': 1, 'type': 'con',
     },
-    frst={
+    'frst': {
         'attributes': [
             {'name': 'DRAFT_ROUND', 'type': 'one', 'value': 'EARLY'},
         ], 'minlen': 1, 'maxlen': 1, 'type': 'con',
     },
-    scnd={
+    'scnd': {
         'attributes': [
             {'name': 'DRAFT_ROUND', 'type': 'one', 'value': 'LATE'},
         ], 'minlen': 1, 'maxlen': 1, 'type': 'con',
     },
-)
+}
+
 
-clm.print_rulelist()
+if __name__ == '__main__':
+    clm = mine(prepare(), **MINER)
+    clm.print_rulelist()
+    save('07', MINER, clm)
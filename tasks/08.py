@@ -1,46 +1,22 @@
-import pandas as pd
+import os
+import sys
+
 import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score
 from sklearn.metrics import classification_report
 from sklearn.metrics import confusion_matrix
-from sklearn.preprocessing import LabelEncoder
 from sklearn.model_selection import train_test_split
 
-draft_df = pd.read_csv('../nhl_draft.csv', encoding='unicode_escape')
-# Select the desired columns for the subset
-selected_columns = ['NATIONALITY_CAT', 'POSITION', 'AGE', 'DRAFT_ROUND', 'HEIGHT_CAT',
-                    'WEIGHT_CAT', 'SHOOTS', 'AMATEUR_LEAGUE_CAT', 'LAST_JUNIOR_YEAR_PPG_CAT',
-                    'AVERAGE_JUNIOR_PPG_CAT']
-
-# Create the subset DataFrame
-rf_subset = draft_df[selected_columns]
-
-label_encoder = LabelEncoder()
-
-# Encode the categorical columns
-rf_subset['NATIONALITY_CAT'] = label_encoder.fit_transform(rf_subset['NATIONALITY_CAT'])
-rf_subset['POSITION'] = label_encoder.fit_transform(rf_subset['POSITION'])
-rf_subset['HEIGHT_CAT'] = label_encoder.fit_transform(rf_subset['HEIGHT_CAT'])
-rf_subset['WEIGHT_CAT'] = label_encoder.fit_transform(rf_subset['WEIGHT_CAT'])
-rf_subset['SHOOTS'] = label_encoder.fit_transform(rf_subset['SHOOTS'])
-rf_subset['AMATEUR_LEAGUE_CAT'] = label_encoder.fit_transform(rf_subset['AMATEUR_LEAGUE_CAT'])
-rf_subset['LAST_JUNIOR_YEAR_PPG_CAT'] = label_encoder.fit_transform(rf_subset['LAST_JUNIOR_YEAR_PPG_CAT'])
-rf_subset['AVERAGE_JUNIOR_PPG_CAT'] = label_encoder.fit_transform(rf_subset['AVERAGE_JUNIOR_PPG_CAT'])
-
-rf_subset['NATIONALITY_CAT'] = rf_subset['NATIONALITY_CAT'].fillna(123)
-rf_subset['POSITION'] = rf_subset['POSITION'].fillna(123)
-rf_subset['HEIGHT_CAT'] = rf_subset['HEIGHT_CAT'].fillna(123)
-rf_subset['WEIGHT_CAT'] = rf_subset['WEIGHT_CAT'].fillna(123)
-rf_subset['SHOOTS'] = rf_subset['SHOOTS'].fillna(123)
-rf_subset['AMATEUR_LEAGUE_CAT'] = rf_subset['AMATEUR_LEAGUE_CAT'].fillna(123)
-rf_subset['LAST_JUNIOR_YEAR_PPG_CAT'] = rf_subset['LAST_JUNIOR_YEAR_PPG_CAT'].fillna(123)
-rf_subset['AVERAGE_JUNIOR_PPG_CAT'] = rf_subset['AVERAGE_JUNIOR_PPG_CAT'].fillna(123)
-
-rf_subset['AGE'] = rf_subset['AGE'].fillna(123)
-rf_subset['DRAFT_ROUND'] = rf_subset['DRAFT_ROUND'].fillna(123)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from instrument import instrument  # noqa: E402
+from training import cross_validate, feature_matrix, save_model, split_target  # noqa: E402
 
+# The selected columns with the text columns encoded by stable category codes and the missing values coded as 123
+# (see training.py), loaded from the stored feature matrix when nhl_draft.csv has not changed
+rf_subset, features_version = feature_matrix()
+print(f'Feature matrix version {features_version}')
 
 # Display the first few rows of the subset
 print(rf_subset.head())
@@ -52,11 +28,16 @@ y_train = train['DRAFT_ROUND']
 X_test = test.drop('DRAFT_ROUND', axis=1)
 y_test = test['DRAFT_ROUND']
 
-# Initialize the Random Forest classifier.
-rf_clf = RandomForestClassifier(random_state=42)
+# Initialize the Random Forest classifier (trained on all the cores).
+rf_clf = RandomForestClassifier(random_state=42, n_jobs=-1)
 
 # Train the classifier on the training data.
-rf_clf.fit(X_train, y_train)
+with instrument('random_forest_fit', 'training') as measurement:
+    measurement.count_inputs(X_train)
+    rf_clf.fit(X_train, y_train)
+
+# Store the model with its code maps, score.py predicts the rounds of new prospects with it
+save_model(rf_clf, features_version)
 
 # Make predictions on the test data.
 rf_y_pred = rf_clf.predict(X_test)
@@ -66,6 +47,12 @@ rf_accuracy = accuracy_score(test["DRAFT_ROUND"], rf_y_pred)
 print("Random Forest Accuracy:", rf_accuracy)
 rf_report = classification_report(test["DRAFT_ROUND"], rf_y_pred,  zero_division=1)
 print(rf_report)
+
+# Cross-validated accuracy of the same model on the whole subset, the folds are trained in parallel
+with instrument('random_forest_cross_validation', 'training') as measurement:
+    measurement.count_inputs(rf_subset)
+    rf_cv_scores = cross_validate(RandomForestClassifier(random_state=42), *split_target(rf_subset))
+print(f"Random Forest {len(rf_cv_scores)}-fold CV Accuracy: {sum(rf_cv_scores) / len(rf_cv_scores)}")
 rf_confmatrix = confusion_matrix(test["DRAFT_ROUND"], rf_y_pred)
 class_labels = sorted(set(test["DRAFT_ROUND"]))
 
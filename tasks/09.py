@@ -1,55 +1,65 @@
-from cleverminer import cleverminer
-import pandas as pd
+import os
+import sys
 
-stats_df = pd.read_csv('../nhl_player_stats.csv', encoding='unicode_escape')
-draft_df = pd.read_csv('../nhl_draft.csv', encoding='unicode_escape')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from datasets import apply_spec, read_draft, read_player_stats  # noqa: E402
+from features import add_player_features, first_season  # noqa: E402
+from mining import mine  # noqa: E402
+from rule_store import save  # noqa: E402
 
 desired_column = 'PIMPG_CAT'
 NEW_COLUMN_NAME = 'FIRST_NHL_SEASON_STAT'
 
-# Get all the first seasons of players
-first_seasons = stats_df[stats_df['PLAYER_SEASON_NUMBER'] == 1]
+# To use rcut on NEW_COLUMN_NAME, we need to make it sortable
+categories = ['very low', 'low', 'medium', 'high', 'very high']
 
-# Add PPG_CAT and SEASON_CAT to the draft dataframe
-draft_df = draft_df.assign(**{NEW_COLUMN_NAME: None})
-draft_df = draft_df.assign(FIRST_NHL_SEASON_DECADE=None)
 
-# For each player in the first_seasons dataframe, add the PPG and decade of the first season to the draft dataframe
-for _, row in first_seasons.iterrows():
-    player_id = row['PLAYER_ID']
-    draft_df.loc[draft_df['PLAYER_ID'] == player_id, NEW_COLUMN_NAME] = row[desired_column]
-    draft_df.loc[draft_df['PLAYER_ID'] == player_id, 'FIRST_NHL_SEASON_DECADE'] = row['SEASON_CAT']
+def prepare():
+    stats_df = read_player_stats(columns=['PLAYER_ID', 'PLAYER_SEASON_NUMBER', 'SEASON_CAT', desired_column])
+    draft_df = read_draft(columns=[
+        'PLAYER_ID', 'HEIGHT_CAT', 'WEIGHT_CAT', 'NATIONALITY_CAT', 'AMATEUR_LEAGUE_CAT', 'AVERAGE_JUNIOR_PPG_CAT',
+        'LAST_JUNIOR_YEAR_PPG_CAT', 'SHOOTS', 'POSITION',
+    ])
 
-# Get only players with the newly added columns
-draft_df = draft_df[draft_df[NEW_COLUMN_NAME].notnull()]
-draft_df = draft_df[draft_df['FIRST_NHL_SEASON_DECADE'].notnull()]
+    # Add the stat and the decade of the first NHL season of every player to the draft dataframe
+    first_seasons = first_season(stats_df, [desired_column, 'SEASON_CAT'])
+    draft_df = add_player_features(draft_df, first_seasons.rename(columns={
+        desired_column: NEW_COLUMN_NAME,
+        'SEASON_CAT': 'FIRST_NHL_SEASON_DECADE',
+    }))
 
-# To use rcut onNEW_COLUMN_NAME, we need to make it sortable
-categories = ['very low', 'low', 'medium', 'high', 'very high']
-sortable_categories = [f'{index}_{value}' for index, value in enumerate(categories)]
-draft_df[NEW_COLUMN_NAME] = draft_df[NEW_COLUMN_NAME].replace(categories, sortable_categories)
-
-# Remove players with no position
-draft_df = draft_df[draft_df['POSITION'].notnull()]
-
-clm = cleverminer(df=draft_df, proc='4ftMiner',
-                  quantifiers={'conf': 0.75, 'Base': 50},
-                  ante={
-                      'attributes': [
-                          {'name': 'HEIGHT_CAT', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
-                          {'name': 'WEIGHT_CAT', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
-                          {'name': 'NATIONALITY_CAT', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
-                          {'name': 'FIRST_NHL_SEASON_DECADE', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
-                          {'name': 'AMATEUR_LEAGUE_CAT', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
-                          {'name': 'AVERAGE_JUNIOR_PPG_CAT', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
-                          {'name': 'LAST_JUNIOR_YEAR_PPG_CAT', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
-                          {'name': 'SHOOTS', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
-                          {'name': 'POSITION', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
-                      ], 'minlen': 1, 'maxlen': 3, 'type': 'con'},
-                  succ={
-                      'attributes': [
-                          {'name': NEW_COLUMN_NAME, 'type': 'rcut', 'minlen': 1, 'maxlen': 2},
-                      ], 'minlen': 1, 'maxlen': 1, 'type': 'con'},
-                  )
-
-clm.print_rulelist()
+    # Get only players with the newly added columns and with a position
+    return apply_spec(draft_df, {
+        'dropna': [NEW_COLUMN_NAME, 'FIRST_NHL_SEASON_DECADE', 'POSITION'],
+        'sortable': {NEW_COLUMN_NAME: categories},
+    })
+
+
+MINER = {
+    'proc': '4ftMiner',
+    'quantifiers': {'conf': 0.75, 'Base': 50},
+    'ante': {
+        'attributes': [
+            {'name': 'HEIGHT_CAT', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
+            {'name': 'WEIGHT_CAT', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
+            {'name': 'NATIONALITY_CAT', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
+            {'name': 'FIRST_NHL_SEASON_DECADE', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
+            {'name': 'AMATEUR_LEAGUE_CAT', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
+            {'name': 'AVERAGE_JUNIOR_PPG_CAT', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
+            {'name': 'LAST_JUNIOR_YEAR_PPG_CAT', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
+            {'name': 'SHOOTS', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
+            {'name': 'POSITION', 'type': 'subset', 'minlen': 1, 'maxlen': 1},
+        ], 'minlen': 1, 'maxlen': 3, 'type': 'con',
+    },
+    'succ': {
+        'attributes': [
+            {'name': NEW_COLUMN_NAME, 'type': 'rcut', 'minlen': 1, 'maxlen': 2},
+        ], 'minlen': 1, 'maxlen': 1, 'type': 'con',
+    },
+}
+
+
+if __name__ == '__main__':
+    clm = mine(prepare(), **MINER)
+    clm.print_rulelist()
+    save('09', MINER, clm)
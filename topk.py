@@ -0,0 +1,350 @@
+"""
+Top-k rule search over the categorical columns of a task, with bound-based pruning.
+
+cleverminer checks every antecedent of a task and reports all the rules passing the quantifiers. top_k() walks the same
+candidates (the ante, succ, cond, frst and scnd cedents of the task's MINER) depth first on a bitset index of the
+task's working set and keeps only the k best rules by one measure:
+4ftMiner: conf or lift (conf divided by the share of the succedent, AAD + 1)
+SD4ftMiner: deltaconf (conf of the first set minus conf of the second set)
+
+Adding attributes to an antecedent can only lower its base, so a branch is pruned as soon as its base falls below the
+Base quantifiers of the task (Base for 4ftMiner, Base1 and Base2 for SD4ftMiner). Once k rules are found, a branch is
+also pruned when an optimistic estimate of the measure over all its extensions cannot beat the k-th rule (ties are
+decided by base, then by the shorter antecedent). The extensions of a branch only select rows by the columns of the
+attributes after its last one, so rows with the same categories in those columns (a group) are always kept or dropped
+together. The estimate takes the groups of the branch by their conf, best first, until they hold the Base positive
+rows an extension needs (the last group in part):
+conf and lift: the best conf of such groups (divided by the share of the succedent for lift).
+deltaconf: the best conf1 in the first set minus the worst conf2 in the second set, taking the groups worst first.
+The other quantifiers of the task are not applied, the measure replaces them.
+
+Usage: python topk.py task [--k 10] [--measure conf]
+e.g. python topk.py 03 --k 5 --measure lift
+"""
+
+import argparse
+import heapq
+import itertools
+import math
+
+import numpy as np
+
+from bitset import BitsetIndex, popcount
+from datasets import decategorize
+
+MEASURES = {
+    '4ftMiner': ['conf', 'lift'],
+    'SD4ftMiner': ['deltaconf'],
+}
+# Added to the estimates, so a rounding error never prunes an extension that ties with the k-th rule
+BOUND_TOLERANCE = 1e-9
+
+
+def _quantifier(quantifiers, *names):
+    values = {name.upper(): value for name, value in quantifiers.items()}
+    for name in names:
+        if name.upper() in values:
+            return values[name.upper()]
+    return 0
+
+
+# Categories of a column in the order cleverminer uses for lcut, rcut and seq: numeric when all the labels are numbers
+def _ordered_categories(index, column):
+    categories = index.categories(column)
+    try:
+        return sorted(categories, key=float)
+    except ValueError:
+        return categories
+
+
+# Literals of one attribute of a cedent spec, as (categories, bitset) pairs
+def _literals(index, attribute):
+    column, kind = attribute['name'], attribute['type']
+    categories = _ordered_categories(index, column)
+    if kind == 'one':
+        choices = [[index.label(column, attribute['value'])]]
+    elif kind == 'subset':
+        choices = [list(combination) for length in range(attribute['minlen'], attribute['maxlen'] + 1)
+                   for combination in itertools.combinations(categories, length)]
+    elif kind == 'lcut':
+        choices = [categories[:length] for length in range(attribute['minlen'], attribute['maxlen'] + 1)]
+    elif kind == 'rcut':
+        choices = [categories[-length:] for length in range(attribute['minlen'], attribute['maxlen'] + 1)]
+    elif kind == 'seq':
+        choices = [categories[start:start + length] for length in range(attribute['minlen'], attribute['maxlen'] + 1)
+                   for start in range(len(categories) - length + 1)]
+    else:
+        raise ValueError(f'Attribute type {kind} is not supported')
+    return [(choice, index.mask({column: choice})) for choice in choices if choice]
+
+
+def _slots(index, cedent):
+    if cedent.get('type', 'con') != 'con':
+        raise ValueError('Only conjunctive (con) cedents are supported')
+    return [(attribute['name'], _literals(index, attribute)) for attribute in cedent['attributes']]
+
+
+def _struct(parts):
+    struct = {}
+    for column, categories in parts:
+        struct.setdefault(column, []).extend(categories)
+    return struct
+
+
+def _text(struct):
+    if not struct:
+        return '---'
+    return ' & '.join(f"{column}({' '.join(str(category) for category in categories)})"
+                      for column, categories in struct.items())
+
+
+# All the conjunctions of a cedent spec (a fixed cedent like succ or frst), as (struct, bitset) pairs
+def _cedents(index, cedent):
+    if not cedent:
+        return [({}, index.all_rows)]
+    slots = _slots(index, cedent)
+    cedents = []
+    for length in range(cedent['minlen'], cedent['maxlen'] + 1):
+        for chosen in itertools.combinations(slots, length):
+            for literals in itertools.product(*(literals for _, literals in chosen)):
+                mask = index.all_rows.copy()
+                for _, literal_mask in literals:
+                    mask &= literal_mask
+                cedents.append((_struct((column, categories) for (column, _), (categories, _) in
+                                        zip(chosen, literals)), mask))
+    return cedents
+
+
+class TopK:
+    def __init__(self, df, miner, k=10, measure='conf'):
+        self.proc = miner['proc']
+        if measure not in MEASURES.get(self.proc, []):
+            raise ValueError(f'Measure {measure} is not supported for {self.proc}, use one of '
+                             f'{", ".join(MEASURES.get(self.proc, [])) or "nothing (unsupported procedure)"}')
+        self.miner = miner
+        self.k = k
+        self.measure = measure
+        quantifiers = miner['quantifiers']
+        if self.proc == '4ftMiner':
+            self.min_bases = [_quantifier(quantifiers, 'Base')]
+        else:
+            self.min_bases = [_quantifier(quantifiers, 'Base1', 'FrstBase'),
+                              _quantifier(quantifiers, 'Base2', 'ScndBase')]
+        self.index = BitsetIndex(decategorize(df))
+        self.ante = miner['ante']
+        self.slots = _slots(self.index, self.ante)
+        self._groups = self._group_codes()
+        self.stats = {'candidates': 0, 'evaluated': 0, 'pruned_base': 0, 'pruned_bound': 0}
+        self._heap = []
+        self._counter = itertools.count()
+        self._extension_counts = {}
+
+    # Number of antecedents extending a node whose last slot is slot, by up to depth more slots
+    def _extensions(self, slot, depth):
+        key = (slot, depth)
+        if key not in self._extension_counts:
+            count = 0
+            if depth > 0:
+                for next_slot in range(slot + 1, len(self.slots)):
+                    count += len(self.slots[next_slot][1]) * (1 + self._extensions(next_slot, depth - 1))
+            self._extension_counts[key] = count
+        return self._extension_counts[key]
+
+    # Group of every row by its categories in the columns of the slots after slot, for every slot (-1 for the root)
+    def _group_codes(self):
+        groups = {}
+        codes = np.zeros(self.index.rows, dtype=np.int64)
+        for slot in range(len(self.slots) - 1, -2, -1):
+            groups[slot] = codes
+            if slot >= 0:
+                column_codes = self.index.codes[self.slots[slot][0]]
+                codes = np.unique(codes * (column_codes.max() + 2) + column_codes + 1, return_inverse=True)[1]
+        return groups
+
+    def _kth(self):
+        return self._heap[0][0] if len(self._heap) == self.k else None
+
+    def _offer(self, key, rule):
+        entry = (key, next(self._counter), rule)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif key > self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+
+    # Score of every child and an optimistic estimate of the score of all its extensions, from the four-fold counts
+    # (arrays with one value per child, the a and b counts per set, within the counts of the sets)
+    def _scores(self, a, b, within):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if self.proc == '4ftMiner':
+                conf = a[0] / (a[0] + b[0])
+                if self.measure == 'conf':
+                    return conf, np.ones_like(conf)
+                # Lift is undefined for an empty succedent, nothing below such a node can enter the top k
+                if not within['succ']:
+                    return np.full_like(conf, math.nan), np.full_like(conf, -math.inf)
+                share = within['succ'] / within['rows']
+                return conf / share, np.full_like(conf, 1 / share)
+            conf1 = a[0] / (a[0] + b[0])
+            conf2 = a[1] / (a[1] + b[1])
+            min_base2 = self.min_bases[1]
+            if not min_base2:
+                return conf1 - conf2, np.ones_like(conf1)
+            return conf1 - conf2, 1 - min_base2 / (min_base2 + b[1])
+
+    # Best conf (the worst with lowest=True) of the extensions of a node whose last slot is slot within one set, for
+    # extensions with at least min_base positive rows in it. The groups of the node are taken best (worst) first until
+    # they hold min_base positive rows, the last one in part.
+    def _conf_bound(self, node_mask, slot, row_set, succ_set, min_base, lowest=False):
+        codes = self._groups[slot]
+        totals = np.bincount(codes[self.index.unpack(node_mask & row_set)])
+        positives = np.bincount(codes[self.index.unpack(node_mask & succ_set)], minlength=len(totals))
+        present = totals > 0
+        totals, positives = totals[present], positives[present]
+        if not len(totals):
+            return math.inf if lowest else -math.inf
+        confs = positives / totals
+        order = np.argsort(confs if lowest else -confs, kind='stable')
+        if min_base <= 0:
+            return confs[order[0]]
+        positives, totals = positives[order], totals[order]
+        last = np.searchsorted(np.cumsum(positives), min_base)
+        if last == len(order):
+            return math.inf if lowest else -math.inf
+        share = (min_base - positives[:last].sum()) / positives[last]
+        return min_base / (totals[:last].sum() + share * totals[last])
+
+    # Optimistic estimate of the measure over all the extensions of a node, from the groups of its rows
+    def _bound(self, node_mask, slot, sets, succ_sets, within):
+        conf = self._conf_bound(node_mask, slot, sets[0], succ_sets[0], self.min_bases[0])
+        if self.proc == '4ftMiner':
+            bound = conf if self.measure == 'conf' else conf / (within['succ'] / within['rows'])
+        else:
+            bound = conf - self._conf_bound(node_mask, slot, sets[1], succ_sets[1], self.min_bases[1], lowest=True)
+        return bound + BOUND_TOLERANCE
+
+    def _params(self, a, b, within):
+        if self.proc == '4ftMiner':
+            c = within['succ'] - a[0]
+            conf = a[0] / (a[0] + b[0])
+            return {
+                'base': a[0],
+                'rel_base': a[0] / within['rows'],
+                'conf': conf,
+                'lift': conf / (within['succ'] / within['rows']),
+                'fourfold': [a[0], b[0], c, within['rows'] - a[0] - b[0] - c],
+            }
+        params = {}
+        for number in (1, 2):
+            a_set, b_set, succ, rows = a[number - 1], b[number - 1], within[f'succ{number}'], within[f'rows{number}']
+            c = succ - a_set
+            params.update({
+                f'base{number}': a_set,
+                f'rel_base{number}': a_set / rows,
+                f'conf{number}': a_set / (a_set + b_set),
+                f'fourfold{number}': [a_set, b_set, c, rows - a_set - b_set - c],
+            })
+        params['deltaconf'] = params['conf1'] - params['conf2']
+        params['ratioconf'] = params['conf1'] / params['conf2'] if params['conf2'] > 0 else None
+        return params
+
+    # Depth first search below one node. sets: bitsets of the rows of every set (cond, or cond & frst / cond & scnd)
+    # within which the antecedent is counted, succ_sets: the same intersected with the succedent.
+    def _search(self, node_mask, node_parts, last_slot, sets, succ_sets, within, cedents):
+        length = len(node_parts) + 1
+        for slot in range(last_slot + 1, len(self.slots)):
+            column, literals = self.slots[slot]
+            masks = np.stack([literal_mask for _, literal_mask in literals]) & node_mask
+            a = [popcount(masks & succ_set) for succ_set in succ_sets]
+            b = [popcount(masks & row_set) - a_set for row_set, a_set in zip(sets, a)]
+            scores, bounds = self._scores(a, b, within)
+            extensions = self._extensions(slot, self.ante['maxlen'] - length)
+            for position, (categories, _) in enumerate(literals):
+                self.stats['evaluated'] += 1
+                counts_a = [int(a_set[position]) for a_set in a]
+                if any(count < min_base for count, min_base in zip(counts_a, self.min_bases)):
+                    self.stats['pruned_base'] += extensions
+                    continue
+                parts = node_parts + [(column, categories)]
+                score = scores[position]
+                if length >= self.ante['minlen'] and not math.isnan(score):
+                    rule_parts = {**cedents, 'ante': _struct(parts)}
+                    self._offer((float(score), counts_a[0], -length), (rule_parts, counts_a,
+                                                                      [int(b_set[position]) for b_set in b], within))
+                if length >= self.ante['maxlen']:
+                    continue
+                # Best key any extension could get: the estimate, the base of this node and one more attribute. The
+                # estimate from the four-fold table is tried first, it costs nothing.
+                kth = self._kth()
+                if kth is not None and ((float(bounds[position]), counts_a[0], -length - 1) <= kth or
+                                        (self._bound(masks[position], slot, sets, succ_sets, within), counts_a[0],
+                                         -length - 1) <= kth):
+                    self.stats['pruned_bound'] += extensions
+                    continue
+                self._search(masks[position], parts, slot, sets, succ_sets, within, cedents)
+
+    def run(self):
+        index, miner = self.index, self.miner
+        conds = _cedents(index, miner.get('cond'))
+        succs = _cedents(index, miner.get('succ'))
+        if self.proc == '4ftMiner':
+            set_pairs = [[({}, index.all_rows)]]
+        else:
+            set_pairs = [[frst, scnd] for frst in _cedents(index, miner.get('frst'))
+                         for scnd in _cedents(index, miner.get('scnd'))]
+        antes = self._extensions(-1, self.ante['maxlen'])
+        for (cond, cond_mask), (succ, succ_mask), set_pair in itertools.product(conds, succs, set_pairs):
+            self.stats['candidates'] += antes
+            sets = [set_mask & cond_mask for _, set_mask in set_pair]
+            succ_sets = [row_set & succ_mask for row_set in sets]
+            if self.proc == '4ftMiner':
+                within = {'rows': int(popcount(sets[0])), 'succ': int(popcount(succ_sets[0]))}
+                cedents = {'cond': cond, 'succ': succ}
+            else:
+                within = {f'{name}{number}': int(popcount(mask)) for number, (row_set, succ_set) in
+                          enumerate(zip(sets, succ_sets), start=1) for name, mask in (('rows', row_set),
+                                                                                     ('succ', succ_set))}
+                cedents = {'cond': cond, 'frst': set_pair[0][0], 'scnd': set_pair[1][0], 'succ': succ}
+            self._search(index.all_rows, [], -1, sets, succ_sets, within, cedents)
+
+        rules = []
+        for rule_id, (key, _, (structs, a, b, within)) in enumerate(sorted(self._heap, reverse=True), start=1):
+            rules.append({
+                'rule_id': rule_id,
+                'cedents': {name: _text(struct) for name, struct in structs.items()},
+                'cedents_struct': structs,
+                'params': self._params(a, b, within),
+                'score': key[0],
+            })
+        return rules
+
+
+# The k best rules of df by measure, searching the candidates of a cleverminer task spec (MINER of a task).
+# Rules are in the format of mining.rule_records() plus their score. Returns (rules, stats): stats counts the candidate
+# antecedents, the evaluated ones and the ones skipped by the base and by the bound pruning.
+def top_k(df, miner, k=10, measure='conf'):
+    search = TopK(df, miner, k, measure)
+    rules = search.run()
+    return rules, search.stats
+
+
+def main():
+    from run_tasks import load_task
+
+    parser = argparse.ArgumentParser(description='Find the k best rules of a task by one measure.')
+    parser.add_argument('task', help='task name (e.g. 03)')
+    parser.add_argument('--k', type=int, default=10, help='number of rules')
+    parser.add_argument('--measure', default='conf', help='conf or lift (4ftMiner), deltaconf (SD4ftMiner)')
+    args = parser.parse_args()
+
+    task = load_task(args.task)
+    rules, stats = top_k(task.prepare(), task.MINER, args.k, args.measure)
+    for rule in rules:
+        cedents = ' | '.join(f'{name}: {text}' for name, text in rule['cedents'].items() if text != '---')
+        print(f"{rule['rule_id']:>3}  {args.measure}={rule['score']:.3f}  {cedents}")
+    pruned = stats['pruned_base'] + stats['pruned_bound']
+    print(f"{stats['candidates']} candidates: {stats['evaluated']} evaluated, {pruned} pruned "
+          f"({stats['pruned_base']} by base, {stats['pruned_bound']} by the bound)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,232 @@
+"""
+Feature matrix and cross-validated training for the draft round classifier of tasks/08.py.
+
+feature_matrix() encodes the text columns of nhl_draft.csv with stable category-to-code maps: the first build gives
+the categories their sorted order (as LabelEncoder does), later builds keep every code and append new categories at
+the end. Missing values get the code MISSING. The maps are stored in CODE_MAPS_FILE and the encoded matrix is stored
+under TRAINING_DIR with a version, a hash of the source table, the columns and the maps, so the matrix is only
+encoded again when one of them changes. save_model() stores a trained model with its code maps in MODEL_FILE.
+
+cross_validate_grid() scores every setting of a hyperparameter grid by k-fold cross-validation, running the folds in
+parallel on all the cores with joblib. For models with warm_start (like RandomForestClassifier) the n_estimators
+values of the grid are not fitted one by one: one model per fold and setting of the other parameters is grown from
+the smallest to the largest n_estimators and scored at every size.
+
+Usage: python training.py [--folds K] [--jobs N] [parameter=value,value ...]
+e.g. python training.py n_estimators=100,200,400 max_depth=none,10,20
+"""
+
+import argparse
+import itertools
+import json
+import os
+import pickle
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import StratifiedKFold
+
+from datasets import DATA_DIR, DRAFT, read_table, source_path
+from stage_cache import file_fingerprint, fingerprint
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+TRAINING_DIR = os.path.join(ROOT_DIR, '.cache', 'training')
+CODE_MAPS_FILE = 'code_maps.json'
+# Model of tasks/08.py with its code maps, used by score.py
+MODEL_FILE = os.path.join(DATA_DIR, 'draft_round_model.joblib')
+
+# Columns of the matrix in the order of tasks/08.py, the text columns are encoded and TARGET is predicted
+COLUMNS = ['NATIONALITY_CAT', 'POSITION', 'AGE', 'DRAFT_ROUND', 'HEIGHT_CAT', 'WEIGHT_CAT', 'SHOOTS',
+           'AMATEUR_LEAGUE_CAT', 'LAST_JUNIOR_YEAR_PPG_CAT', 'AVERAGE_JUNIOR_PPG_CAT']
+ENCODED_COLUMNS = ['NATIONALITY_CAT', 'POSITION', 'HEIGHT_CAT', 'WEIGHT_CAT', 'SHOOTS', 'AMATEUR_LEAGUE_CAT',
+                   'LAST_JUNIOR_YEAR_PPG_CAT', 'AVERAGE_JUNIOR_PPG_CAT']
+TARGET = 'DRAFT_ROUND'
+# Code of missing values (and of categories without a code), above the codes of all the categories
+MISSING = 123
+
+FOLDS = 5
+SEED = 42
+GRID = {'n_estimators': [100, 200, 400], 'max_depth': [None, 10, 20], 'min_samples_leaf': [1, 5]}
+
+
+def load_code_maps(training_dir=TRAINING_DIR):
+    path = os.path.join(training_dir, CODE_MAPS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_code_maps(code_maps, training_dir=TRAINING_DIR):
+    os.makedirs(training_dir, exist_ok=True)
+    with open(os.path.join(training_dir, CODE_MAPS_FILE), 'w') as file:
+        json.dump(code_maps, file, indent=2)
+
+
+# Code maps {column: {category: code}} covering all the categories of df. Existing codes are kept, new categories get
+# the next codes in sorted order.
+def update_code_maps(code_maps, df, columns=ENCODED_COLUMNS):
+    updated = {}
+    for column in columns:
+        codes = dict(code_maps.get(column, {}))
+        new = sorted(set(df[column].dropna().astype(str)) - set(codes))
+        codes.update({category: code for code, category in enumerate(new, start=len(codes))})
+        if len(codes) > MISSING:
+            raise ValueError(f'{column} has {len(codes)} categories, the codes would reach MISSING ({MISSING})')
+        updated[column] = codes
+    return updated
+
+
+# Encode the text columns of df by the code maps, missing values and categories without a code get MISSING.
+# The other columns get MISSING for missing values, all the columns are int16.
+def encode(df, code_maps):
+    encoded = pd.DataFrame(index=df.index)
+    for column in df.columns:
+        if column in code_maps:
+            # The codes of a map run from 0, so they are the codes of a Categorical with the categories in code order
+            categories = sorted(code_maps[column], key=code_maps[column].get)
+            codes = pd.Categorical(df[column].astype('string'), categories=categories).codes
+            encoded[column] = np.where(codes < 0, MISSING, codes).astype(np.int16)
+        else:
+            encoded[column] = pd.to_numeric(df[column]).astype(float).fillna(MISSING).astype(np.int16)
+    return encoded
+
+
+# The encoded COLUMNS of the draft table and the version of the matrix. The matrix is loaded from TRAINING_DIR when
+# the table and the code maps have not changed, otherwise it is encoded (adding new categories to the maps).
+def feature_matrix(data_dir=DATA_DIR, training_dir=TRAINING_DIR):
+    source = file_fingerprint(source_path(DRAFT, data_dir))
+    code_maps = load_code_maps(training_dir)
+    version = fingerprint(source, COLUMNS, code_maps)[:12]
+    path = os.path.join(training_dir, f'features-{version}.pkl')
+    if os.path.exists(path):
+        with open(path, 'rb') as file:
+            return pickle.load(file), version
+
+    df = read_table(DRAFT, COLUMNS, data_dir)
+    updated = update_code_maps(code_maps, df)
+    if updated != code_maps:
+        save_code_maps(updated, training_dir)
+        version = fingerprint(source, COLUMNS, updated)[:12]
+        path = os.path.join(training_dir, f'features-{version}.pkl')
+    matrix = encode(df, updated)
+    os.makedirs(training_dir, exist_ok=True)
+    with open(path, 'wb') as file:
+        pickle.dump(matrix, file, protocol=pickle.HIGHEST_PROTOCOL)
+    return matrix, version
+
+
+# Store a model trained on the matrix of features_version, together with the code maps and the feature columns
+def save_model(model, features_version, path=MODEL_FILE, training_dir=TRAINING_DIR):
+    bundle = {
+        'model': model,
+        'features': list(model.feature_names_in_),
+        'code_maps': load_code_maps(training_dir),
+        'features_version': features_version,
+    }
+    joblib.dump(bundle, path)
+
+
+def load_model(path=MODEL_FILE):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f'{path} does not exist, run tasks/08.py first')
+    return joblib.load(path)
+
+
+# Features and target of the matrix
+def split_target(matrix, target=TARGET):
+    return matrix.drop(target, axis=1), matrix[target]
+
+
+def _supports_warm_start(model, grid):
+    return 'warm_start' in model.get_params() and len(grid.get('n_estimators', [])) > 1
+
+
+# Fit one model on a fold and score it for every n_estimators value (grown with warm_start), or just once
+def _fit_fold(model, params, n_estimators, X, y, train, test):
+    model = clone(model).set_params(**params)
+    if 'n_jobs' in model.get_params():
+        # The folds already run in parallel
+        model.set_params(n_jobs=1)
+    X_train, y_train, X_test, y_test = X.iloc[train], y.iloc[train], X.iloc[test], y.iloc[test]
+    if not n_estimators:
+        return [model.fit(X_train, y_train).score(X_test, y_test)]
+    model.set_params(warm_start=True)
+    scores = []
+    for count in n_estimators:
+        model.set_params(n_estimators=count)
+        scores.append(model.fit(X_train, y_train).score(X_test, y_test))
+    return scores
+
+
+# Score every setting of grid {parameter: [value, ...]} by k-fold cross-validation (stratified by y), in parallel.
+# Returns a list of {'params': ..., 'scores': [score per fold], 'mean': ..., 'std': ...}, the best mean first.
+def cross_validate_grid(model, X, y, grid, folds=FOLDS, seed=SEED, n_jobs=-1):
+    grid = dict(grid)
+    n_estimators = sorted(set(grid.pop('n_estimators'))) if _supports_warm_start(model, grid) else []
+    names = list(grid)
+    settings = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    splits = list(StratifiedKFold(folds, shuffle=True, random_state=seed).split(X, y))
+
+    jobs = [(params, split) for params in settings for split in splits]
+    fold_scores = joblib.Parallel(n_jobs=n_jobs)(
+        joblib.delayed(_fit_fold)(model, params, n_estimators, X, y, train, test) for params, (train, test) in jobs
+    )
+
+    results = []
+    for number, params in enumerate(settings):
+        scores = np.array(fold_scores[number * folds:(number + 1) * folds])
+        sizes = [{'n_estimators': count} for count in n_estimators] or [{}]
+        for position, size in enumerate(sizes):
+            results.append({
+                'params': {**params, **size},
+                'scores': scores[:, position].tolist(),
+                'mean': float(scores[:, position].mean()),
+                'std': float(scores[:, position].std()),
+            })
+    return sorted(results, key=lambda result: -result['mean'])
+
+
+# k-fold cross-validation scores of one model
+def cross_validate(model, X, y, folds=FOLDS, seed=SEED, n_jobs=-1):
+    return cross_validate_grid(model, X, y, {}, folds, seed, n_jobs)[0]['scores']
+
+
+def _grid_argument(text):
+    name, _, values = text.partition('=')
+    if not values:
+        raise argparse.ArgumentTypeError(f'expected parameter=value,value,..., got {text}')
+
+    def parse(value):
+        if value.lower() == 'none':
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            return float(value)
+
+    return name, [parse(value) for value in values.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cross-validate a grid of random forests predicting the draft round.')
+    parser.add_argument('grid', nargs='*', type=_grid_argument, help='parameter values, e.g. max_depth=none,10')
+    parser.add_argument('--folds', type=int, default=FOLDS, help='number of folds')
+    parser.add_argument('--jobs', type=int, default=-1, help='parallel jobs (-1: all cores)')
+    args = parser.parse_args()
+
+    matrix, version = feature_matrix()
+    X, y = split_target(matrix)
+    grid = dict(args.grid) or GRID
+    results = cross_validate_grid(RandomForestClassifier(random_state=SEED), X, y, grid, args.folds, n_jobs=args.jobs)
+    print(f'Feature matrix {version}: {len(matrix)} rows, {X.shape[1]} features, {args.folds} folds')
+    for result in results:
+        params = ', '.join(f'{name}={value}' for name, value in result['params'].items())
+        print(f"{result['mean']:.4f} +/- {result['std']:.4f}  {params}")
+
+
+if __name__ == '__main__':
+    main()
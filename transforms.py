@@ -0,0 +1,124 @@
+"""
+Transforms of text columns that run once per distinct value.
+
+unique_map(series, function) factorizes the column, calls function on every distinct value and broadcasts the results
+back through the codes, so the cost depends on the number of distinct values, not on the number of rows. Missing
+values stay missing and function is never called on them.
+
+The results are also kept in a memo per function, stored under CACHE_DIR and keyed by the source code of the function,
+the patterns of the regular expressions below and the constants the caller names. A later run (a rebuild after new
+seasons were added, or ingest.py) only calls the function on values it has never seen. The memo of a function is
+dropped when any of these change. New results are written back once, when the process exits, and a memo keeps at most
+MEMO_SIZE values (the oldest ones are dropped first).
+
+The value functions below replace the pandas .str calls of connect.py and give the same results.
+"""
+
+import atexit
+import os
+import pickle
+import re
+
+import numpy as np
+import pandas as pd
+
+from stage_cache import code_fingerprint, fingerprint
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(ROOT_DIR, '.cache', 'transforms')
+# Values kept in the memo of a function
+MEMO_SIZE = 500_000
+
+POSITION_SUFFIX = r'\s*\(.+\)\s*'
+_POSITION_SUFFIX = re.compile(POSITION_SUFFIX)
+_PARENTHESES = re.compile(r'\((.*?)\)')
+_SECONDARY = re.compile(r'\/.+')
+# Read by the value functions, part of the key of every memo
+_PATTERNS = [_POSITION_SUFFIX.pattern, _PARENTHESES.pattern, _SECONDARY.pattern]
+
+# Memos loaded in this process, by file path
+_memos = {}
+# Memos with new results, written back at exit: {file path: (function, cache directory)}
+_unsaved = {}
+
+
+# 'Sebastian Aho (C)' -> 'Sebastian Aho'
+def strip_position(name):
+    return _POSITION_SUFFIX.sub('', name)
+
+
+# First text in parentheses ('London Knights (OHL)' -> 'OHL'), NaN without parentheses
+def parenthesized(text):
+    match = _PARENTHESES.search(text)
+    return match.group(1) if match else np.nan
+
+
+# First of the values separated by slashes ('C/LW' -> 'C')
+def primary(value):
+    return _SECONDARY.sub('', value)
+
+
+# First year of a season ('2005-06' -> 2005)
+def season_year(season):
+    return int(str(season)[:4])
+
+
+# code: helper functions used by function, their source is part of the key, constants: module-level values read by
+# function or its helpers ({name: value}), also part of the key (as in stage_cache.Pipeline.run)
+def _memo_path(function, code, constants, cache_dir):
+    key = fingerprint(code_fingerprint(function, *code), _PATTERNS, sorted((constants or {}).items()))
+    return os.path.join(cache_dir, f'{function.__name__}-{key[:16]}.pkl')
+
+
+def load_memo(function, code=(), constants=None, cache_dir=CACHE_DIR):
+    path = _memo_path(function, code, constants, cache_dir)
+    if path not in _memos:
+        memo = {}
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                memo = pickle.load(file)
+        _memos[path] = memo
+    return _memos[path]
+
+
+def _save_memo(path, function, cache_dir):
+    memo = _memos[path]
+    # Dicts keep the insertion order, the values seen first are dropped
+    for value in list(memo)[:max(len(memo) - MEMO_SIZE, 0)]:
+        del memo[value]
+    os.makedirs(cache_dir, exist_ok=True)
+    # Memos of older versions of the function can never be used again
+    for file_name in os.listdir(cache_dir):
+        if file_name.startswith(f'{function.__name__}-') and file_name.endswith('.pkl'):
+            os.remove(os.path.join(cache_dir, file_name))
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as file:
+        pickle.dump(memo, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, path)
+
+
+# Write the memos with new results, called at exit
+@atexit.register
+def save_memos():
+    while _unsaved:
+        path, (function, cache_dir) = _unsaved.popitem()
+        _save_memo(path, function, cache_dir)
+
+
+# function applied to every value of series (an object Series with the same index), called once per distinct value.
+# code and constants: what function reads besides its argument (see _memo_path). persist=False keeps new results in
+# the memo of this process only.
+def unique_map(series, function, code=(), constants=None, persist=True, cache_dir=CACHE_DIR):
+    series = pd.Series(series)
+    codes, uniques = pd.factorize(series)
+    memo = load_memo(function, code, constants, cache_dir)
+    new = [value for value in uniques if value not in memo]
+    if new:
+        memo.update({value: function(value) for value in new})
+        if persist:
+            _unsaved[_memo_path(function, code, constants, cache_dir)] = (function, cache_dir)
+    # Code -1 (missing values) takes the NaN at the end
+    results = np.empty(len(uniques) + 1, dtype=object)
+    results[:-1] = [memo[value] for value in uniques]
+    results[-1] = np.nan
+    return pd.Series(results[codes], index=series.index, name=series.name)
@@ -1,7 +1,19 @@
+import os
+import sys
+
 import pandas_cat as pc
-import pandas as pd
 
-draft_df = pd.read_csv('../nhl_draft.csv', encoding='unicode_escape')
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from cube import draft_cube  # noqa: E402
+from datasets import read_draft  # noqa: E402
+
+# Distributions of the categories and their crosstabs with the draft round, counted in the cube
+cube = draft_cube()
+for column in cube.columns:
+    print(f'\n{cube.marginal(column, dropna=False).to_string()}')
+    if column != 'DRAFT_ROUND':
+        print(f"\n{cube.crosstab(column, 'DRAFT_ROUND', dropna=False).to_string()}")
 
-# Prepare the category profiles
+# Prepare the category profiles, pandas_cat works on the rows of the table
+draft_df = read_draft()
 profiles = pc.pandas_cat.profile(df=draft_df, dataset_name="NHL", opts={"auto_prepare": True})